@@ -0,0 +1,54 @@
+import importlib.util
+import os
+from urllib.parse import urlsplit
+
+import httpx
+
+CHATWOOT_MAX_CONNECTIONS = int(os.getenv("CHATWOOT_MAX_CONNECTIONS", "50"))
+CHATWOOT_MAX_KEEPALIVE = int(os.getenv("CHATWOOT_MAX_KEEPALIVE", "20"))
+CHATWOOT_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("CHATWOOT_KEEPALIVE_EXPIRY_SECONDS", "30"))
+CHATWOOT_CONNECT_TIMEOUT_SECONDS = float(os.getenv("CHATWOOT_CONNECT_TIMEOUT_SECONDS", "3"))
+CHATWOOT_TIMEOUT_SECONDS = float(os.getenv("CHATWOOT_TIMEOUT_SECONDS", "10"))
+
+# HTTP/2 needs the optional `h2` package (`pip install httpx[http2]`).
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_CLIENTS: dict[str, httpx.AsyncClient] = {}
+
+
+def _origin(api_url: str) -> str:
+    parts = urlsplit(api_url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def chatwoot_client(api_url: str) -> httpx.AsyncClient:
+    """
+    Return the shared client for the Chatwoot instance serving `api_url`.
+
+    Clients are pooled per origin so replies reuse keep-alive connections
+    instead of paying a TCP/TLS handshake per message.
+    """
+    origin = _origin(api_url)
+    client = _CLIENTS.get(origin)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=CHATWOOT_MAX_CONNECTIONS,
+                max_keepalive_connections=CHATWOOT_MAX_KEEPALIVE,
+                keepalive_expiry=CHATWOOT_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(
+                CHATWOOT_TIMEOUT_SECONDS,
+                connect=CHATWOOT_CONNECT_TIMEOUT_SECONDS,
+            ),
+        )
+        _CLIENTS[origin] = client
+    return client
+
+
+async def close_chatwoot_clients() -> None:
+    clients = list(_CLIENTS.values())
+    _CLIENTS.clear()
+    for client in clients:
+        await client.aclose()
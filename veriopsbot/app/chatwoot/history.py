@@ -0,0 +1,89 @@
+"""Rebuild a conversation's memory from Chatwoot when its session is missing.
+
+After a restart or cache eviction the bot would otherwise answer without
+context. `fetch_conversation_turns` reads the message list newest page
+first and pages backwards with `before=<oldest id>` until it has enough
+user/assistant turns. Private notes are agent-only (handoff summaries,
+internal remarks) and never part of what the customer saw, so they are
+skipped. The messages being answered right now are excluded too: the
+pipeline adds them to memory itself, and reading them here would record
+them twice.
+"""
+
+from typing import Any, Collection, Optional
+
+import httpx
+
+from app.chatwoot.handoff import _headers
+from app.metrics import metrics
+
+# Chatwoot message_type values.
+MESSAGE_INCOMING = 0
+MESSAGE_OUTGOING = 1
+
+_ROLES = {MESSAGE_INCOMING: "user", MESSAGE_OUTGOING: "assistant"}
+
+
+def _as_turn(message: dict[str, Any]) -> Optional[tuple[str, str]]:
+    message_type = message.get("message_type")
+    if isinstance(message_type, str):
+        message_type = {"incoming": MESSAGE_INCOMING, "outgoing": MESSAGE_OUTGOING}.get(message_type)
+    role = _ROLES.get(message_type)
+    content = (message.get("content") or "").strip()
+    if role is None or not content or message.get("private"):
+        return None
+    return role, content
+
+
+async def fetch_conversation_turns(
+    *,
+    client: httpx.AsyncClient,
+    api_url: str,
+    access_token: str,
+    account_id: int,
+    conversation_id: int,
+    max_turns: int,
+    max_pages: int = 3,
+    exclude_message_ids: Collection[int] = (),
+) -> list[tuple[str, str]]:
+    """
+    Return up to `max_turns` (role, content) pairs from the conversation, oldest first.
+
+    Chatwoot returns the latest page of messages first; older pages are
+    requested with `before=<oldest id>` until enough turns were collected.
+    Private notes, activity messages and `exclude_message_ids` are skipped.
+    """
+    turns: list[tuple[int, str, str]] = []
+    before: Optional[int] = None
+
+    for _ in range(max(max_pages, 1)):
+        params = {"before": before} if before is not None else None
+        with metrics.timer("chatwoot_request_seconds", call="list_messages"):
+            resp = await client.get(
+                f"{api_url}/accounts/{account_id}/conversations/{conversation_id}/messages",
+                headers=_headers(access_token),
+                params=params,
+            )
+        if resp.status_code >= 300:
+            metrics.incr("chatwoot_request_errors", call="list_messages")
+            print("❌ Error fetching conversation history:", resp.status_code, resp.text[:200])
+            break
+
+        messages = (resp.json() or {}).get("payload") or []
+        if not messages:
+            break
+        for message in messages:
+            message_id = message.get("id")
+            if message_id is None or message_id in exclude_message_ids:
+                continue
+            turn = _as_turn(message)
+            if turn is not None:
+                turns.append((int(message_id), *turn))
+
+        oldest = min((m["id"] for m in messages if m.get("id") is not None), default=None)
+        if oldest is None or oldest == before or len(turns) >= max_turns:
+            break
+        before = oldest
+
+    turns.sort(key=lambda item: item[0])
+    return [(role, content) for _, role, content in turns[-max_turns:]]
@@ -0,0 +1,227 @@
+"""Durable outbox for Chatwoot replies, notes and priority updates.
+
+Bot workers only insert rows into `chatwoot_outbox`; a dispatcher loop claims
+them with SKIP LOCKED and delivers them over the pooled Chatwoot client.
+Failed calls are retried with exponential backoff, so a Chatwoot hiccup no
+longer loses the reply. Public messages of one conversation are sent in
+order: the claim only hands out a conversation's oldest unsent public
+message, so a message waiting for a retry holds back the newer ones. Private
+notes, priority updates and other conversations go out concurrently.
+
+Rows are inserted by this process, which wakes the dispatcher itself, and
+each retry arms a timer for when it is due; the poll is only a fallback.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from app.db.repository import (
+    claim_chatwoot_outbox,
+    delete_sent_chatwoot_outbox,
+    enqueue_chatwoot_outbox,
+    fail_chatwoot_outbox,
+    get_params_by_omnichannel_id,
+    mark_chatwoot_outbox_sent,
+    retry_chatwoot_outbox,
+)
+from app.metrics import metrics
+
+from .client import chatwoot_client
+from .handoff import send_message, set_priority
+
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "10"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "2"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "300"))
+_LEASE_SECONDS = 60
+_CLEANUP_INTERVAL_SECONDS = 15 * 60
+_SENT_RETENTION_SECONDS = 24 * 60 * 60
+
+KIND_MESSAGE = "message"
+KIND_PRIORITY = "priority"
+
+
+def backoff_delay(attempts: int, base: float, cap: float) -> float:
+    """Exponential backoff with jitter for the given (1-based) attempt."""
+    delay = min(base * (2 ** max(attempts - 1, 0)), cap)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def message_row(account_id: int, conversation_id: int, content: Optional[str], *, private: bool = False) -> Dict[str, Any]:
+    return {
+        "account_id": account_id,
+        "conversation_id": conversation_id,
+        "kind": KIND_MESSAGE,
+        "body": {"content": content, "private": private},
+    }
+
+
+def priority_row(account_id: int, conversation_id: int, priority: Optional[str]) -> Dict[str, Any]:
+    return {
+        "account_id": account_id,
+        "conversation_id": conversation_id,
+        "kind": KIND_PRIORITY,
+        "body": {"priority": priority},
+    }
+
+
+def deliverable_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop messages without content; Chatwoot rejects them anyway."""
+    return [row for row in rows if row["kind"] != KIND_MESSAGE or row["body"].get("content")]
+
+
+class ChatwootOutbox:
+    def __init__(
+        self,
+        *,
+        poll_interval: float = OUTBOX_POLL_SECONDS,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+    ) -> None:
+        self._poll_interval = poll_interval
+        self._batch_size = max(batch_size, 1)
+        self._max_attempts = max(max_attempts, 1)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_cleanup = 0.0
+
+    async def enqueue(self, rows: List[Dict[str, Any]]) -> bool:
+        rows = deliverable_rows(rows)
+        if rows:
+            await enqueue_chatwoot_outbox(rows)
+            self.notify(len(rows))
+        return True
+
+    def notify(self, count: int) -> None:
+        """Wake the dispatcher after rows were inserted elsewhere."""
+        if count:
+            metrics.incr("chatwoot_outbox_enqueued", count)
+            self._wake.set()
+
+    async def _deliver_row(self, row: Dict[str, Any]) -> bool:
+        cfg = await get_params_by_omnichannel_id(int(row["account_id"]))
+        omnichannel = (cfg or {}).get("omnichannel") or {}
+        api_url = omnichannel.get("chatwoot_api_url")
+        access_token = omnichannel.get("chatwoot_bot_access_token")
+        if not api_url or not access_token:
+            raise RuntimeError("Chatwoot API URL or access token not configured")
+
+        body = row["body"] or {}
+        common = {
+            "client": chatwoot_client(api_url),
+            "api_url": api_url,
+            "access_token": access_token,
+            "account_id": row["account_id"],
+            "conversation_id": row["conversation_id"],
+        }
+        if row["kind"] == KIND_PRIORITY:
+            return await set_priority(**common, priority=body.get("priority"))
+        return await send_message(**common, content=body.get("content"), private=bool(body.get("private")))
+
+    async def _deliver_conversation(self, rows: List[Dict[str, Any]]) -> List[int]:
+        ordered = [row for row in rows if row["kind"] == KIND_MESSAGE and not (row["body"] or {}).get("private")]
+        independent = [row for row in rows if row not in ordered]
+        results = await asyncio.gather(
+            self._deliver_sequence(ordered),
+            *(self._deliver_sequence([row]) for row in independent),
+        )
+        return [row_id for sent in results for row_id in sent]
+
+    async def _deliver_sequence(self, rows: List[Dict[str, Any]]) -> List[int]:
+        sent: List[int] = []
+        for index, row in enumerate(rows):
+            try:
+                delivered = await self._deliver_row(row)
+                error = "" if delivered else "Chatwoot rejected the call"
+            except Exception as exc:
+                delivered, error = False, str(exc)
+            if delivered:
+                sent.append(row["id"])
+                metrics.incr("chatwoot_outbox_sent", kind=row["kind"])
+                metrics.observe("chatwoot_outbox_delivery_seconds", float(row["wait_seconds"] or 0))
+                continue
+            # Keep the conversation's order: later messages wait for this one.
+            for pending in rows[index:]:
+                await self._reschedule(pending, error)
+            break
+        return sent
+
+    async def _reschedule(self, row: Dict[str, Any], error: str) -> None:
+        attempts = int(row["attempts"])
+        if attempts >= self._max_attempts:
+            metrics.incr("chatwoot_outbox_failed", kind=row["kind"])
+            print(f"❌ Giving up on Chatwoot outbox row {row['id']} after {attempts} attempts: {error}")
+            await fail_chatwoot_outbox(row["id"], error)
+            return
+        delay = backoff_delay(attempts, OUTBOX_BACKOFF_SECONDS, OUTBOX_BACKOFF_MAX_SECONDS)
+        metrics.incr("chatwoot_outbox_retried", kind=row["kind"])
+        print(f"⚠️ Chatwoot outbox row {row['id']} failed ({error}); retrying in {delay:.1f}s")
+        await retry_chatwoot_outbox(row["id"], delay, error)
+        asyncio.get_running_loop().call_later(delay, self._wake.set)
+
+    async def deliver_batch(self) -> int:
+        """Claim and deliver one batch; returns the number of rows claimed."""
+        rows = await claim_chatwoot_outbox(self._batch_size, _LEASE_SECONDS)
+        if not rows:
+            return 0
+        by_conversation: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+        for row in rows:
+            by_conversation[(row["account_id"], row["conversation_id"])].append(row)
+        results = await asyncio.gather(
+            *(self._deliver_conversation(group) for group in by_conversation.values())
+        )
+        sent = [row_id for delivered in results for row_id in delivered]
+        await mark_chatwoot_outbox_sent(sent)
+        if sent:
+            # The next public message of a conversation becomes claimable
+            # only now; claim again without waiting for the poll interval.
+            self._wake.set()
+        return len(rows)
+
+    async def _cleanup(self) -> None:
+        if time.monotonic() - self._last_cleanup < _CLEANUP_INTERVAL_SECONDS:
+            return
+        self._last_cleanup = time.monotonic()
+        deleted = await delete_sent_chatwoot_outbox(_SENT_RETENTION_SECONDS)
+        if deleted:
+            print(f"🧹 Removed {deleted} delivered Chatwoot outbox row(s)")
+
+    async def _loop(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                claimed = await self.deliver_batch()
+                await self._cleanup()
+            except Exception as exc:
+                print(f"⚠️ Chatwoot outbox dispatcher error: {exc}")
+                claimed = 0
+            if claimed >= self._batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+chatwoot_outbox = ChatwootOutbox()
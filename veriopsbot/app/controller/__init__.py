@@ -1,24 +1,46 @@
 """Controller utilities for FastAPI handlers."""
 
-from .bot import process_bot_request
+from .bot import accept_bot_request, process_bot_request
 from .rag_docs import (
     upload_documents,
     list_documents,
     download_document,
     delete_folder,
 )
-from .rag_ingest import IngestRequest, trigger_ingest
+from .rag_faq import (
+    FaqEntry,
+    delete_faq,
+    import_faq_csv,
+    list_faq,
+    save_faq_entry,
+)
+from .rag_ingest import (
+    IngestRequest,
+    cancel_ingest,
+    ingest_job_status,
+    remove_documents,
+    trigger_ingest,
+)
 from .webhooks import process_chatwoot_webhook, process_twenty_webhook
 
 
 __all__ = [
+    "accept_bot_request",
     "process_bot_request",
     "upload_documents",
     "list_documents",
     "download_document",
     "delete_folder",
+    "FaqEntry",
+    "list_faq",
+    "save_faq_entry",
+    "import_faq_csv",
+    "delete_faq",
     "IngestRequest",
     "trigger_ingest",
+    "remove_documents",
+    "ingest_job_status",
+    "cancel_ingest",
     "process_chatwoot_webhook",
     "process_twenty_webhook",
 ]
@@ -1,46 +1,190 @@
 """Chatwoot bot controller logic."""
 
+import asyncio
+import json
+import os
 from datetime import date
+from typing import Optional
 
 import httpx
+from fastapi import HTTPException
 
-from app.chatwoot.handoff import perform_handoff, send_message
+from app.chatwoot.client import chatwoot_client
+from app.chatwoot.history import fetch_conversation_turns
+from app.chatwoot.outbox import chatwoot_outbox, message_row, priority_row
+from app.db.idempotency import message_idempotency
 from app.db.repository import (
     get_bot_request_total,
     get_params_by_omnichannel_id,
     increment_bot_request_count,
 )
-from app.rag_engine.rag import handle_input, initial_state
+from app.metrics import metrics
+from app.rag_engine.rag import (
+    handle_input,
+    hydrated_state,
+    initial_state,
+    schedule_memory_refresh,
+)
+from app.rag_engine.rag_memory import MemoryState
+from app.rag_engine.rag_sessions import conversation_store
+from app.workers.bot_queue import Deliver, bot_queue
 
 
-SESSIONS: dict[str, dict] = {}
 DEFAULT_HANDOFF_PRIORITY = "high"
+SESSION_HYDRATE_MAX_PAGES = int(os.getenv("SESSION_HYDRATE_MAX_PAGES", "3"))
+
+
+async def _load_session_from_chatwoot(
+    *,
+    tenant_id: int,
+    account_id: int,
+    conversation_id: int,
+    api_url: str,
+    access_token: str,
+    llm_params: dict,
+    exclude_message_ids: list[int],
+) -> Optional[MemoryState]:
+    try:
+        turns = await fetch_conversation_turns(
+            client=chatwoot_client(api_url),
+            api_url=api_url,
+            access_token=access_token,
+            account_id=account_id,
+            conversation_id=conversation_id,
+            max_turns=MemoryState().max_turns,
+            max_pages=SESSION_HYDRATE_MAX_PAGES,
+            exclude_message_ids=set(exclude_message_ids),
+        )
+    except httpx.HTTPError as exc:
+        print(f"⚠️ Failed to fetch history for conversation {conversation_id}: {exc}")
+        return None
+    if not turns:
+        return None
+    state = hydrated_state(turns, tenant_id=tenant_id, llm_params=llm_params)
+    print(
+        f"💾 Hydrated conversation {conversation_id} from Chatwoot: "
+        f"fetched={len(turns)} kept={len(state.turns)}"
+    )
+    return state
 
 
-async def process_bot_request(data: dict):
+async def _mark_messages_done(account_id: int, data: dict) -> None:
+    message_ids = data.get("merged_message_ids") or [data.get("id")]
+    try:
+        await message_idempotency.mark_done(
+            account_id, [int(message_id) for message_id in message_ids if message_id is not None]
+        )
+    except Exception as exc:
+        print(f"⚠️ Failed to record processed messages {message_ids}: {exc}")
+
+
+def _refresh_session_summary(session_key: tuple[int, int], state, cfg: dict) -> None:
+    task = schedule_memory_refresh(state, runtime_config=cfg)
+    if task is not None:
+        # The summary lands after the reply; store the session again so the
+        # write-behind flush picks it up.
+        task.add_done_callback(lambda _: conversation_store.put(session_key, state))
+
+
+def bot_request_skip_reason(data: dict) -> Optional[str]:
+    """Return why the bot should ignore this webhook, or None to process it."""
     convo = data.get("conversation", {}) or {}
     assignee_id = (convo.get("meta", {}) or {}).get("assignee", {}) or {}
     assignee_id = assignee_id.get("id")
 
     if assignee_id:
-        print("🤖 Conversation is assigned to someone")
-        return {"message": "Conversation is assigned to someone"}
-
+        return "Conversation is assigned to someone"
     if data.get("event") != "message_created":
-        print("🤖 Not a message creation event")
-        return {"message": "Not a message creation event"}
-
+        return "Not a message creation event"
     if data.get("message_type") != "incoming":
-        print("🤖 Not an incoming message")
-        return {"message": "Not an incoming message"}
-
+        return "Not an incoming message"
     if "sender" not in data:
-        print("🤖 No sender detected")
-        return {"message": "No sender detected"}
+        return "No sender detected"
+    if not (data.get("account") or {}).get("id") or not convo.get("id"):
+        return "No account or conversation detected"
+    return None
+
+
+def parse_bot_webhook(body: bytes) -> tuple[Optional[dict], Optional[str]]:
+    """
+    Parse a raw `/bot` body once, rejecting noise as cheaply as possible.
+
+    Most deliveries are outgoing messages, notes and conversation updates.
+    The byte checks reject those without parsing JSON at all; the rest are
+    parsed a single time and run through `bot_request_skip_reason`.
+    Returns (payload, None) for messages to process, (None, reason) otherwise.
+    """
+    if b'"message_created"' not in body:
+        return None, "Not a message creation event"
+    if b'"incoming"' not in body:
+        return None, "Not an incoming message"
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None, "Invalid JSON payload"
+    if not isinstance(data, dict):
+        return None, "Invalid JSON payload"
+    reason = bot_request_skip_reason(data)
+    return (None, reason) if reason else (data, None)
+
+
+async def accept_bot_request(data: dict):
+    """Validate a `/bot` webhook and queue it for the bot workers."""
+    reason = bot_request_skip_reason(data)
+    if reason:
+        print(f"🤖 {reason}")
+        return {"message": reason}
+
+    account_id = int(data["account"]["id"])
+    message_id = data.get("id")
+    if message_id is not None:
+        try:
+            existing = await message_idempotency.claim(account_id, int(message_id))
+        except Exception as exc:
+            # Better to risk a duplicate reply than to drop the message.
+            print(f"⚠️ Idempotency check failed for message {message_id}: {exc}")
+            existing = None
+        if existing is not None:
+            metrics.incr("bot_duplicate_deliveries", state=existing)
+            print(f"🔁 Duplicate delivery of message {message_id} ({existing}); skipping")
+            return {"message": "Duplicate message", "state": existing}
+
+    try:
+        job_id = await bot_queue.enqueue(data)
+    except Exception as exc:
+        print(f"❌ Failed to queue bot message: {exc}")
+        if message_id is not None:
+            try:
+                await message_idempotency.release(account_id, int(message_id))
+            except Exception as release_exc:
+                print(f"⚠️ Failed to release message {message_id}: {release_exc}")
+        # Chatwoot re-delivers the webhook when it does not get a 2xx.
+        raise HTTPException(status_code=503, detail="Bot queue unavailable") from exc
+    if job_id is None:
+        # Another process accepted this message already; the cache claim
+        # only covers this process unless CACHE_BACKEND=REDIS.
+        metrics.incr("bot_duplicate_deliveries", state="queued")
+        print(f"🔁 Duplicate delivery of message {message_id} (queued); skipping")
+        return {"message": "Duplicate message", "state": "queued"}
+    return {"message": "Queued", "job_id": job_id}
+
+
+async def process_bot_request(data: dict, deliver: Optional[Deliver] = None):
+    """
+    Run the bot pipeline for one (possibly merged) incoming message.
+
+    `deliver` queues the Chatwoot calls; the bot workers pass one that refuses
+    when a newer message superseded this job, in which case the turn is
+    dropped from memory and nothing is sent.
+    """
+    deliver = deliver or chatwoot_outbox.enqueue
+    reason = bot_request_skip_reason(data)
+    if reason:
+        print(f"🤖 {reason}")
+        return {"message": reason}
 
     account_id = int(data["account"]["id"])
     conversation_id = data["conversation"]["id"]
-    user_id = str(data["sender"]["id"])
     text = data.get("content", "") or ""
 
     cfg = await get_params_by_omnichannel_id(account_id)
@@ -106,29 +250,30 @@ async def process_bot_request(data: dict):
                     "We have reached the automated response limit for this month. "
                     "A human teammate will take it from here.",
                 )
-                async with httpx.AsyncClient() as client:
-                    await send_message(
-                        client=client,
-                        api_url=chatwoot_api_url,
-                        access_token=chatwoot_bot_access_token,
-                        account_id=account_id,
-                        conversation_id=conversation_id,
-                        content=limit_message,
-                        private=False,
-                    )
+                if await deliver([message_row(account_id, conversation_id, limit_message)]):
+                    await _mark_messages_done(account_id, data)
                 return {
                     "message": "Monthly limit reached",
                     "bot_requests_month": monthly_usage,
                     "monthly_limit": monthly_limit,
                 }
 
-    try:
-        bot_usage_today = await increment_bot_request_count(tenant_id)
-        print(f"📈 Bot usage for tenant {tenant_id} today: {bot_usage_today}")
-        if bot_usage_month is not None:
-            bot_usage_month = bot_usage_month + 1
-    except Exception as exc:
-        print(f"⚠️ Failed to record bot usage for tenant {tenant_id}: {exc}")
+    # Rebuild a missing session from Chatwoot. Started only after the monthly
+    # limit check, whose reply does not need the history.
+    session_key = (tenant_id, int(conversation_id))
+    hydration = conversation_store.hydrate(
+        session_key,
+        lambda: _load_session_from_chatwoot(
+            tenant_id=tenant_id,
+            account_id=account_id,
+            conversation_id=int(conversation_id),
+            api_url=chatwoot_api_url,
+            access_token=chatwoot_bot_access_token,
+            llm_params=llm_params,
+            # Messages being answered right now, including merged ones.
+            exclude_message_ids=data.get("merged_message_ids") or [data.get("id")],
+        ),
+    )
 
     handoff_public_reply = llm_params.get(
         "handoff_public_reply",
@@ -140,39 +285,53 @@ async def process_bot_request(data: dict):
     )
     handoff_priority = llm_params.get("handoff_priority", DEFAULT_HANDOFF_PRIORITY)
 
-    state = SESSIONS.get(user_id) or initial_state()
+    hydrated = await conversation_store.wait_hydrated(hydration)
+    state = hydrated or initial_state()
     print("🤖 Handling the input ...")
-    state, reply, status = await handle_input(
-        state,
-        text,
-        tenant_id=cfg.get("id", account_id),
-        runtime_config=cfg,
-    )
-    SESSIONS[user_id] = state
-
-    async with httpx.AsyncClient() as client:
-        if reply == "human_agent":
-            await perform_handoff(
-                client=client,
-                account_id=account_id,
-                conversation_id=conversation_id,
-                api_url=chatwoot_api_url,
-                access_token=chatwoot_bot_access_token,
-                public_reply=handoff_public_reply,
-                private_note=handoff_private_note,
-                priority=handoff_priority,
-            )
-            return {"message": "Routing to human agent"}
-
-        await send_message(
-            client=client,
-            api_url=chatwoot_api_url,
-            access_token=chatwoot_bot_access_token,
-            account_id=account_id,
-            conversation_id=conversation_id,
-            content=reply,
-            private=False,
+    checkpoint = state.checkpoint()
+    try:
+        state, reply, status = await handle_input(
+            state,
+            text,
+            tenant_id=cfg.get("id", account_id),
+            runtime_config=cfg,
         )
+    except asyncio.CancelledError:
+        state.rollback(checkpoint)
+        raise
+
+    if reply == "human_agent":
+        rows = [
+            message_row(account_id, conversation_id, handoff_public_reply),
+            message_row(account_id, conversation_id, handoff_private_note, private=True),
+            priority_row(account_id, conversation_id, handoff_priority),
+        ]
+    else:
+        rows = [message_row(account_id, conversation_id, reply)]
+
+    if not await deliver(rows):
+        state.rollback(checkpoint)
+        return {"message": "Superseded by a newer message"}
+
+    # Counted only once the reply is queued, so superseded and retried jobs
+    # do not use up the tenant's monthly limit.
+    try:
+        bot_usage_today = await increment_bot_request_count(tenant_id)
+        print(f"📈 Bot usage for tenant {tenant_id} today: {bot_usage_today}")
+        if bot_usage_month is not None:
+            bot_usage_month = bot_usage_month + 1
+    except Exception as exc:
+        print(f"⚠️ Failed to record bot usage for tenant {tenant_id}: {exc}")
+    if hydrated is None:
+        # Ran without history; keep any that hydration stored after we gave up.
+        state = conversation_store.put_merged(session_key, state)
+    else:
+        conversation_store.put(session_key, state)
+    await _mark_messages_done(account_id, data)
+    _refresh_session_summary(session_key, state, cfg)
+
+    if reply == "human_agent":
+        return {"message": "Routing to human agent"}
 
     response = {"message": "VD Bot processed"}
     if bot_usage_today is not None:
@@ -184,4 +343,9 @@ async def process_bot_request(data: dict):
     return response
 
 
-__all__ = ["process_bot_request"]
+__all__ = [
+    "accept_bot_request",
+    "bot_request_skip_reason",
+    "parse_bot_webhook",
+    "process_bot_request",
+]
@@ -49,6 +49,14 @@ def tenant_folder_name(tenant_id: int, *, tenant_email: str | None = None) -> st
     return f"{_CLIENT_FOLDER_PREFIX}-{tenant_id}"
 
 
+def tenant_id_from_folder(folder_name: str) -> int | None:
+    """Inverse of `tenant_folder_name`; None for folders that are not a tenant's."""
+    prefix, _, tenant_id = folder_name.partition("-")
+    if prefix != _CLIENT_FOLDER_PREFIX or not tenant_id.isdigit():
+        return None
+    return int(tenant_id)
+
+
 def _validate_component(name: str, *, label: str) -> str:
     if not name:
         raise ValueError(f"{label} name must not be empty.")
@@ -189,6 +197,7 @@ __all__ = [
     "FolderControllerError",
     "STORAGE_ROOT",
     "tenant_folder_name",
+    "tenant_id_from_folder",
     "ensure_folder",
     "save_folder_files",
     "list_folder_files",
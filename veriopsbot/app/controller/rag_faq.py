@@ -0,0 +1,164 @@
+"""Curated FAQ controller functions."""
+
+from __future__ import annotations
+
+import csv
+import io
+from typing import Any, Dict, List, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from app.db.repository import (
+    delete_faq_entries,
+    get_faq_entries,
+    get_params_by_tenant_id,
+    update_faq_entry,
+    upsert_faq_entries,
+)
+from app.rag_engine.helpers import build_embed_model_from_config
+from app.rag_engine.rag_faq import (
+    FAQ_MAX_ENTRIES,
+    embed_questions,
+    ensure_faq_store,
+    invalidate_faq_index,
+)
+
+_CSV_DELIMITERS = ",;\t"
+_CSV_HEADERS = {"question", "questions", "pergunta", "perguntas", "pregunta", "preguntas"}
+
+
+class FaqEntry(BaseModel):
+    question: str
+    answer: str
+
+
+def _faq_view(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "question": row["question"],
+        "answer": row["answer"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def parse_faq_csv(data: bytes) -> List[Tuple[str, str]]:
+    """(question, answer) pairs from a two-column CSV; a header row is optional.
+
+    Rows missing either column are skipped, and a repeated question keeps its last answer.
+    """
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = data.decode("latin-1")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=_CSV_DELIMITERS)
+    except csv.Error:
+        dialect = csv.excel
+
+    pairs: Dict[str, str] = {}
+    for index, row in enumerate(csv.reader(io.StringIO(text), dialect)):
+        cells = [cell.strip() for cell in row]
+        if len(cells) < 2 or not cells[0] or not cells[1]:
+            continue
+        if index == 0 and cells[0].lower() in _CSV_HEADERS:
+            continue
+        pairs[cells[0]] = cells[1]
+    return list(pairs.items())
+
+
+async def _tenant_embed_model(tenant_id: int):
+    config = await get_params_by_tenant_id(tenant_id)
+    if not config:
+        raise HTTPException(status_code=404, detail=f"No tenant configuration found for id {tenant_id}.")
+    try:
+        return build_embed_model_from_config(config)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+async def _embedded_entries(tenant_id: int, pairs: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    embed_model = await _tenant_embed_model(tenant_id)
+    try:
+        embeddings = await embed_questions(embed_model, [question for question, _ in pairs])
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"Could not embed the FAQ questions: {exc}") from exc
+    return [
+        {
+            "question": question,
+            "answer": answer,
+            "embed_model": embed_model.model_name,
+            "embedding": embedding,
+        }
+        for (question, answer), embedding in zip(pairs, embeddings)
+    ]
+
+
+def _check_capacity(existing: List[Dict[str, Any]], questions: List[str], *, replace: bool) -> None:
+    known = set() if replace else {row["question"] for row in existing}
+    if len(known | set(questions)) > FAQ_MAX_ENTRIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"The FAQ is limited to {FAQ_MAX_ENTRIES} entries per tenant.",
+        )
+
+
+async def list_faq(tenant_id: int) -> List[Dict[str, Any]]:
+    await ensure_faq_store()
+    return [_faq_view(row) for row in await get_faq_entries(tenant_id)]
+
+
+async def save_faq_entry(tenant_id: int, payload: FaqEntry, entry_id: int | None = None) -> Dict[str, Any]:
+    """Create or edit one entry; the question is embedded before it is stored."""
+    question, answer = payload.question.strip(), payload.answer.strip()
+    if not question or not answer:
+        raise HTTPException(status_code=400, detail="Both the question and the answer are required.")
+
+    await ensure_faq_store()
+    if entry_id is None:
+        _check_capacity(await get_faq_entries(tenant_id), [question], replace=False)
+    entry = (await _embedded_entries(tenant_id, [(question, answer)]))[0]
+    if entry_id is None:
+        await upsert_faq_entries(tenant_id, [entry])
+    else:
+        try:
+            updated = await update_faq_entry(tenant_id, entry_id, entry)
+        except ValueError as exc:
+            raise HTTPException(status_code=409, detail=str(exc)) from exc
+        if not updated:
+            raise HTTPException(status_code=404, detail="FAQ entry not found.")
+    invalidate_faq_index(tenant_id)
+    return {"tenant_id": tenant_id, "id": entry_id, "question": question, "saved": True}
+
+
+async def import_faq_csv(tenant_id: int, data: bytes, *, replace: bool = False) -> Dict[str, Any]:
+    """Add (or with `replace`, swap in) the entries of a question,answer CSV."""
+    pairs = parse_faq_csv(data)
+    if not pairs:
+        raise HTTPException(status_code=400, detail="The CSV has no question,answer rows.")
+
+    await ensure_faq_store()
+    _check_capacity(await get_faq_entries(tenant_id), [question for question, _ in pairs], replace=replace)
+    entries = await _embedded_entries(tenant_id, pairs)
+    await upsert_faq_entries(tenant_id, entries, replace=replace)
+    invalidate_faq_index(tenant_id)
+    return {"tenant_id": tenant_id, "imported": len(entries), "replaced": replace}
+
+
+async def delete_faq(tenant_id: int, entry_ids: List[int]) -> Dict[str, Any]:
+    if not entry_ids:
+        raise HTTPException(status_code=400, detail="Select at least one FAQ entry to delete.")
+    await ensure_faq_store()
+    deleted = await delete_faq_entries(tenant_id, entry_ids)
+    invalidate_faq_index(tenant_id)
+    return {"tenant_id": tenant_id, "deleted": deleted}
+
+
+__all__ = [
+    "FaqEntry",
+    "delete_faq",
+    "import_faq_csv",
+    "list_faq",
+    "parse_faq_csv",
+    "save_faq_entry",
+]
@@ -1,9 +1,14 @@
 """RAG ingestion controller functions."""
 
+from typing import Any, Dict
+
 from pydantic import BaseModel
 from fastapi import HTTPException
 
-from app.rag_engine.ingest import ingest_documents, IngestError
+from app.controller.rag_docs import list_folder_files
+from app.db.repository import get_ingest_job, get_latest_ingest_job
+from app.rag_engine.ingest import remove_ingested_files
+from app.workers.ingest_queue import ingest_queue
 
 
 class IngestRequest(BaseModel):
@@ -11,26 +16,84 @@ class IngestRequest(BaseModel):
     tenant_id: int
     provider: str | None = None
     embed_model: str | None = None
+    rebuild: bool = False
+
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["id"],
+        "tenant_id": job["tenant_id"],
+        "folder": job["folder_name"],
+        "rebuild": job["rebuild"],
+        "status": job["status"],
+        "cancel_requested": job["cancel_requested"],
+        "progress": job["progress"] or {},
+        "report": job["report"],
+        "error": job["last_error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "updated_at": job["updated_at"],
+        "finished_at": job["finished_at"],
+    }
 
 
 async def trigger_ingest(payload: IngestRequest):
+    """Queue an ingest job and return its id; progress is polled separately."""
     try:
-        ingested, resolved_provider, resolved_model = await ingest_documents(
-            tenant_id=payload.tenant_id,
-            folder_name=payload.folder,
-            provider=payload.provider,
-            embed_model=payload.embed_model,
-        )
-    except IngestError as exc:
-        raise HTTPException(status_code=400, detail=str(exc)) from exc
+        list_folder_files(payload.folder)
+    except (FileNotFoundError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=f"Folder '{payload.folder}' was not found.") from exc
 
+    job_id = await ingest_queue.enqueue(
+        tenant_id=payload.tenant_id,
+        folder_name=payload.folder,
+        provider=payload.provider,
+        embed_model=payload.embed_model,
+        rebuild=payload.rebuild,
+    )
     return {
+        "job_id": job_id,
+        "status": "queued",
         "tenant_id": payload.tenant_id,
         "folder": payload.folder,
-        "provider": resolved_provider,
-        "embed_model": resolved_model,
-        "documents_ingested": ingested,
+        "status_url": f"/rag/ingest/jobs/{job_id}",
     }
 
 
-__all__ = ["IngestRequest", "trigger_ingest"]
+async def ingest_job_status(job_id: int, tenant_id: int | None = None):
+    job = await get_ingest_job(job_id)
+    if not job or (tenant_id is not None and job["tenant_id"] != tenant_id):
+        raise HTTPException(status_code=404, detail="Ingest job not found.")
+    return _job_view(job)
+
+
+async def latest_ingest_job(tenant_id: int):
+    job = await get_latest_ingest_job(tenant_id)
+    return _job_view(job) if job else None
+
+
+async def cancel_ingest(job_id: int, tenant_id: int | None = None):
+    row = await ingest_queue.cancel(job_id, tenant_id)
+    if row is None:
+        raise HTTPException(status_code=409, detail="Ingest job is not queued or running.")
+    return {"job_id": row["id"], "status": row["status"], "cancel_requested": True}
+
+
+async def remove_documents(tenant_id: int, file_names: list[str], folder_name: str) -> int:
+    """Drop the vectors of deleted files so the bot stops citing them."""
+    removed_nodes, held = await remove_ingested_files(tenant_id, file_names)
+    if held:
+        # Other files were deduplicated against these; an ingest re-embeds
+        # them and then removes the held vectors.
+        await ingest_queue.enqueue(tenant_id=tenant_id, folder_name=folder_name)
+    return removed_nodes
+
+
+__all__ = [
+    "IngestRequest",
+    "cancel_ingest",
+    "ingest_job_status",
+    "latest_ingest_job",
+    "remove_documents",
+    "trigger_ingest",
+]
@@ -1,9 +1,9 @@
 """Webhook controller functions."""
 
-import requests
+from app.workers.n8n_coalescer import n8n_coalescer
 
 
-def process_chatwoot_webhook(payload: dict):
+async def process_chatwoot_webhook(payload: dict):
     print("☎️ Chatwoot webhook payload received:", payload)
 
     if not payload.get("event", "").startswith("contact_"):
@@ -11,25 +11,21 @@ def process_chatwoot_webhook(payload: dict):
     if not payload.get("phone_number") and not payload.get("email"):
         return {"message": "No phone number or email detected"}
 
-    n8n = requests.post("http://host.docker.internal:5678/webhook/chatwoot", json=payload).json()
-    n8ntest = requests.post("http://host.docker.internal:5678/webhook-test/chatwoot", json=payload).json()
-    print("🔄 N8N webhook:", n8n)
-    print("🔄 N8N test webhook:", n8ntest)
-    return {"message": "Chatwoot webhook processed"}
+    if not n8n_coalescer.offer("chatwoot", payload):
+        return {"message": "Chatwoot webhook dropped, forward queue unavailable"}
+    return {"message": "Chatwoot webhook queued"}
 
 
-def process_twenty_webhook(payload: dict):
+async def process_twenty_webhook(payload: dict):
     print("👩‍🔧 Twenty webhook:", payload)
 
     if payload.get("record", {}).get("deletedAt"):
         print("🧹 Deletion detected, skipping n8n call.")
         return {"message": "Deletion detected, skipping n8n call."}
 
-    n8n = requests.post("http://host.docker.internal:5678/webhook/twenty", json=payload).json()
-    n8ntest = requests.post("http://host.docker.internal:5678/webhook-test/twenty", json=payload).json()
-    print("🔄 N8N webhook:", n8n)
-    print("🔄 N8N test webhook:", n8ntest)
-    return {"message": "Twenty webhook processed"}
+    if not n8n_coalescer.offer("twenty", payload):
+        return {"message": "Twenty webhook dropped, forward queue unavailable"}
+    return {"message": "Twenty webhook queued"}
 
 
 __all__ = ["process_chatwoot_webhook", "process_twenty_webhook"]
@@ -0,0 +1,33 @@
+"""Cache factory shared by the repository and other cache-backed stores."""
+
+from __future__ import annotations
+
+import os
+from typing import Any
+
+from aiocache import Cache
+
+# --- Cache backend: Memory now, flip to Redis via env without code changes ---
+# MEMORY (default): no external service. For production, set CACHE_BACKEND=REDIS.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "MEMORY").upper()
+CACHE_NAMESPACE = os.getenv("CACHE_NAMESPACE", "veridata")
+DEFAULT_TTL = int(os.getenv("CACHE_TTL_SECONDS", "300"))  # 5 minutes
+
+
+def create_cache(
+    namespace: str = CACHE_NAMESPACE,
+    *,
+    backend: str | None = None,
+    **kwargs: Any,
+) -> Cache:
+    """Build an aiocache instance for `backend` (defaults to `CACHE_BACKEND`)."""
+    if (backend or CACHE_BACKEND).upper() == "REDIS":
+        return Cache(
+            Cache.REDIS,
+            endpoint=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", "6379")),
+            password=os.getenv("REDIS_PASSWORD") or None,
+            namespace=namespace,
+            **kwargs,
+        )
+    return Cache(Cache.MEMORY, namespace=namespace, **kwargs)
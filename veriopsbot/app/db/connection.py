@@ -1,9 +1,20 @@
 # /workspace/app/db/connection.py
 import os
+import threading
+import time
+from collections import deque
 from contextlib import contextmanager
-from typing import Tuple
+from typing import Deque, Tuple
 
 import psycopg
+from psycopg.pq import TransactionStatus
+
+# Connections kept open between `get_connection` calls, per process. Queue
+# pollers and request handlers reuse them instead of reconnecting each time.
+DB_POOL_MAX_IDLE = int(os.getenv("DB_POOL_MAX_IDLE", "8"))
+# Idle connections older than this are closed rather than reused, so the
+# server or a proxy dropping them first does not fail a request.
+DB_POOL_IDLE_SECONDS = float(os.getenv("DB_POOL_IDLE_SECONDS", "60"))
 
 
 def _database_dsn() -> str:
@@ -32,10 +43,62 @@ def resolve_sqlalchemy_urls() -> Tuple[str, str]:
     return sync_url, async_url
 
 
+_idle: Deque[Tuple[psycopg.Connection, float]] = deque()
+_idle_lock = threading.Lock()
+_idle_pid = os.getpid()
+
+
+def _take_idle() -> psycopg.Connection | None:
+    global _idle_pid
+    expired = []
+    conn = None
+    with _idle_lock:
+        if _idle_pid != os.getpid():
+            # Forked child: the sockets belong to the parent.
+            _idle.clear()
+            _idle_pid = os.getpid()
+        cutoff = time.monotonic() - DB_POOL_IDLE_SECONDS
+        while _idle and _idle[0][1] < cutoff:
+            expired.append(_idle.popleft()[0])
+        if _idle:
+            # Newest first, so rarely needed connections age out.
+            conn = _idle.pop()[0]
+    for stale in expired:
+        stale.close()
+    return conn
+
+
+def _give_back(conn: psycopg.Connection) -> None:
+    if conn.closed or conn.broken:
+        return
+    try:
+        if conn.info.transaction_status != TransactionStatus.IDLE:
+            conn.rollback()
+    except psycopg.Error:
+        conn.close()
+        return
+    with _idle_lock:
+        if _idle_pid == os.getpid() and len(_idle) < DB_POOL_MAX_IDLE:
+            _idle.append((conn, time.monotonic()))
+            return
+    conn.close()
+
+
 @contextmanager
 def get_connection():
-    conn = psycopg.connect(_database_dsn())
+    """
+    Borrow a connection; uncommitted work is rolled back when it is returned.
+    """
+    conn = _take_idle() or psycopg.connect(_database_dsn())
     try:
         yield conn
     finally:
+        _give_back(conn)
+
+
+def close_idle_connections() -> None:
+    with _idle_lock:
+        idle = [conn for conn, _ in _idle]
+        _idle.clear()
+    for conn in idle:
         conn.close()
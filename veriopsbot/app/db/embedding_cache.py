@@ -0,0 +1,102 @@
+"""Content-addressed store for embedding vectors.
+
+Rows are keyed by (embedding model, dimensions, sha256 of the text) and hold
+the vector as packed float32 bytes. The same chunk uploaded for several
+tenants, re-chunked with unchanged text, or asked again as a query is then
+embedded only once. Access is synchronous because llama-index calls the
+embedder synchronously; async callers go through `anyio.to_thread`.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from . import queries
+from .connection import get_connection
+
+EMBED_CACHE_MAX_ROWS = int(os.getenv("EMBED_CACHE_MAX_ROWS", "500000"))
+_PRUNE_INTERVAL_SECONDS = 15 * 60
+
+
+def pack_vector(vector: Sequence[float]) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def unpack_vector(data: bytes) -> List[float]:
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+
+class EmbeddingCacheStore:
+    def __init__(self, *, max_rows: int = EMBED_CACHE_MAX_ROWS) -> None:
+        self._max_rows = max(max_rows, 1)
+        self._lock = threading.Lock()
+        self._ready = False
+        self._last_prune = 0.0
+
+    def _ensure_table(self) -> None:
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute(queries.SQL_CREATE_EMBEDDING_CACHE_TABLE)
+                conn.commit()
+            self._ready = True
+
+    def lookup(self, embed_model: str, dimensions: int, hashes: Sequence[bytes]) -> Dict[bytes, List[float]]:
+        """Fetch cached vectors for the given text hashes in one query."""
+        if not hashes:
+            return {}
+        self._ensure_table()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_GET_CACHED_EMBEDDINGS,
+                {"embed_model": embed_model, "dimensions": dimensions, "hashes": list(hashes)},
+            )
+            rows = cur.fetchall()
+            conn.commit()
+        return {bytes(text_hash): unpack_vector(bytes(embedding)) for text_hash, embedding in rows}
+
+    def store(self, embed_model: str, dimensions: int, items: Iterable[Tuple[bytes, Sequence[float]]]) -> None:
+        rows = [
+            {
+                "embed_model": embed_model,
+                "dimensions": dimensions,
+                "text_hash": text_hash,
+                "embedding": pack_vector(vector),
+            }
+            for text_hash, vector in items
+        ]
+        if not rows:
+            return
+        self._ensure_table()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.executemany(queries.SQL_INSERT_CACHED_EMBEDDING, rows)
+            conn.commit()
+        self._maybe_prune()
+
+    def _maybe_prune(self) -> None:
+        if time.monotonic() - self._last_prune < _PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = time.monotonic()
+        self.prune()
+
+    def prune(self) -> int:
+        """Drop the least recently used rows beyond `EMBED_CACHE_MAX_ROWS`."""
+        self._ensure_table()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_PRUNE_EMBEDDING_CACHE, {"max_rows": self._max_rows})
+            deleted = cur.rowcount
+            conn.commit()
+        if deleted:
+            print(f"🧹 Pruned {deleted} cached embedding(s)")
+        return deleted
+
+
+embedding_cache_store = EmbeddingCacheStore()
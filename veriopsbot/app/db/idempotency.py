@@ -0,0 +1,58 @@
+"""Deduplicate Chatwoot webhook re-deliveries by (account, message id).
+
+Chatwoot re-sends `message_created` when our acknowledgement is slow. The
+first delivery claims the message with an atomic set-if-absent (`add`) and
+moves it from `in_progress` to `done` once the reply is queued; any other
+delivery of the same message is acknowledged without touching the LLM or
+the database. Uses Redis when `CACHE_BACKEND=REDIS`, so all workers share
+the claims.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Iterable, Optional
+
+from .cache import CACHE_NAMESPACE, create_cache
+
+IDEMPOTENCY_IN_PROGRESS_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_IN_PROGRESS_TTL_SECONDS", "900"))
+IDEMPOTENCY_DONE_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_DONE_TTL_SECONDS", "3600"))
+
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+
+def _key(account_id: int, message_id: int) -> str:
+    return f"{account_id}:{message_id}"
+
+
+class MessageIdempotency:
+    def __init__(self) -> None:
+        self._cache = create_cache(f"{CACHE_NAMESPACE}:bot_messages")
+
+    async def claim(self, account_id: int, message_id: int) -> Optional[str]:
+        """
+        Claim a message for processing.
+
+        Returns None when this call owns the message, otherwise the state
+        recorded by the delivery that got there first.
+        """
+        key = _key(account_id, message_id)
+        try:
+            await self._cache.add(key, IN_PROGRESS, ttl=IDEMPOTENCY_IN_PROGRESS_TTL_SECONDS)
+            return None
+        except ValueError:
+            # The key exists; it may have expired since, so fall back to in_progress.
+            return await self._cache.get(key) or IN_PROGRESS
+
+    async def mark_done(self, account_id: int, message_ids: Iterable[int]) -> None:
+        pairs = [(_key(account_id, message_id), DONE) for message_id in message_ids]
+        if pairs:
+            await self._cache.multi_set(pairs, ttl=IDEMPOTENCY_DONE_TTL_SECONDS)
+
+    async def release(self, account_id: int, message_id: int) -> None:
+        """Forget a claim so a re-delivery can try again."""
+        await self._cache.delete(_key(account_id, message_id))
+
+
+message_idempotency = MessageIdempotency()
@@ -0,0 +1,89 @@
+"""Postgres LISTEN/NOTIFY wake-ups for the job queues.
+
+Enqueues call `pg_notify` inside their transaction, so a notification goes
+out only once the row is committed. One listener connection per process
+waits for them in a thread and hands each payload to the handlers
+subscribed on the event loop. Idle workers therefore sleep until there is
+work instead of polling the database every second. Their poll stays as a
+slow fallback for delayed retries, expired leases and reconnects; every
+handler is also called once after a (re)connect, since notifications sent
+while the listener was down are lost.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+import anyio
+import psycopg
+from psycopg import sql
+
+from app.metrics import metrics
+
+from .connection import resolve_database_dsn
+
+CHANNEL_BOT_JOBS = "bot_jobs"
+CHANNEL_BOT_JOB_CANCEL = "bot_job_cancel"
+CHANNEL_INGEST_JOBS = "ingest_jobs"
+
+DB_LISTEN_RECONNECT_SECONDS = float(os.getenv("DB_LISTEN_RECONNECT_SECONDS", "5"))
+_WAIT_SECONDS = 1.0
+
+# Called on the event loop with the notification payload ("" after a reconnect).
+Handler = Callable[[str], None]
+
+
+class DatabaseListener:
+    def __init__(self) -> None:
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        """Register a handler; channels subscribed after `start` are picked up on the next reconnect."""
+        if handler not in self._handlers[channel]:
+            self._handlers[channel].append(handler)
+
+    def _dispatch(self, channel: str, payload: str) -> None:
+        for handler in list(self._handlers.get(channel, ())):
+            self._loop.call_soon_threadsafe(handler, payload)
+
+    def _listen(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                with psycopg.connect(resolve_database_dsn(), autocommit=True) as conn:
+                    channels = list(self._handlers)
+                    for channel in channels:
+                        conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+                    for channel in channels:
+                        self._dispatch(channel, "")
+                    while not self._stopping.is_set():
+                        for notify in conn.notifies(timeout=_WAIT_SECONDS):
+                            metrics.incr("db_notifications", channel=notify.channel)
+                            self._dispatch(notify.channel, notify.payload)
+            except Exception as exc:
+                print(f"⚠️ Database listener lost its connection: {exc}")
+                self._stopping.wait(DB_LISTEN_RECONNECT_SECONDS)
+
+    async def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="db-listener", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        await anyio.to_thread.run_sync(self._thread.join, _WAIT_SECONDS + 1)
+        self._thread = None
+
+
+database_listener = DatabaseListener()
@@ -111,3 +111,871 @@ INSERT INTO veriops_users (tenant_id, email, password_hash, is_admin, modified_a
 VALUES (%(tenant_id)s, %(email)s, %(password_hash)s, %(is_admin)s, NOW())
 RETURNING id, tenant_id, email, is_admin
 """
+
+
+SQL_CREATE_BOT_SESSIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS bot_sessions (
+    session_key TEXT PRIMARY KEY,
+    tenant_id BIGINT NOT NULL,
+    payload BYTEA NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS bot_sessions_expires_at_idx ON bot_sessions (expires_at);
+"""
+
+
+SQL_GET_BOT_SESSION = """
+SELECT payload
+FROM bot_sessions
+WHERE session_key = %(session_key)s
+  AND expires_at > NOW()
+"""
+
+
+SQL_UPSERT_BOT_SESSION = """
+INSERT INTO bot_sessions (session_key, tenant_id, payload, expires_at, updated_at)
+VALUES (
+    %(session_key)s,
+    %(tenant_id)s,
+    %(payload)s,
+    NOW() + make_interval(secs => %(ttl_seconds)s),
+    NOW()
+)
+ON CONFLICT (session_key)
+DO UPDATE SET
+    payload = EXCLUDED.payload,
+    expires_at = EXCLUDED.expires_at,
+    updated_at = EXCLUDED.updated_at
+"""
+
+
+SQL_DELETE_EXPIRED_BOT_SESSIONS = """
+DELETE FROM bot_sessions
+WHERE expires_at <= NOW()
+"""
+
+
+SQL_CREATE_BOT_JOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS bot_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    account_id BIGINT NOT NULL,
+    conversation_id BIGINT NOT NULL,
+    message_id BIGINT,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_until TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+ALTER TABLE bot_jobs ADD COLUMN IF NOT EXISTS cancel_requested BOOLEAN NOT NULL DEFAULT FALSE;
+CREATE INDEX IF NOT EXISTS bot_jobs_ready_idx
+    ON bot_jobs (available_at, id) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS bot_jobs_open_conversation_idx
+    ON bot_jobs (account_id, conversation_id, id) WHERE status IN ('queued', 'running');
+-- One row per accepted Chatwoot message. Merged jobs overwrite
+-- bot_jobs.message_id, so re-deliveries are deduplicated here instead.
+CREATE TABLE IF NOT EXISTS bot_job_messages (
+    account_id BIGINT NOT NULL,
+    message_id BIGINT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (account_id, message_id)
+);
+"""
+
+
+# Delivered to listeners when the surrounding transaction commits.
+SQL_NOTIFY = """
+SELECT pg_notify(%(channel)s, %(payload)s)
+"""
+
+
+# Serializes enqueues for one conversation so merging is race free.
+SQL_LOCK_BOT_CONVERSATION = """
+SELECT pg_advisory_xact_lock(%(account_id)s::bigint * 1000003 + %(conversation_id)s::bigint)
+"""
+
+
+SQL_GET_OPEN_BOT_JOB = """
+SELECT id, payload, created_at,
+       CASE WHEN status = 'running' AND locked_until < NOW() THEN 'queued' ELSE status END AS status
+FROM bot_jobs
+WHERE account_id = %(account_id)s
+  AND conversation_id = %(conversation_id)s
+  AND status IN ('queued', 'running')
+  AND NOT cancel_requested
+ORDER BY id DESC
+LIMIT 1
+FOR UPDATE
+"""
+
+
+# Returns no row when the message was already accepted (a re-delivery).
+SQL_CLAIM_BOT_MESSAGE = """
+INSERT INTO bot_job_messages (account_id, message_id)
+VALUES (%(account_id)s, %(message_id)s)
+ON CONFLICT DO NOTHING
+RETURNING message_id
+"""
+
+
+SQL_ENQUEUE_BOT_JOB = """
+INSERT INTO bot_jobs (account_id, conversation_id, message_id, payload, available_at)
+VALUES (
+    %(account_id)s,
+    %(conversation_id)s,
+    %(message_id)s,
+    %(payload)s,
+    NOW() + make_interval(secs => %(debounce_seconds)s)
+)
+RETURNING id
+"""
+
+
+# Debounce: each merged message pushes the job back, up to a hard cap
+# measured from the first message of the burst.
+SQL_MERGE_BOT_JOB = """
+UPDATE bot_jobs
+SET payload = %(payload)s,
+    message_id = %(message_id)s,
+    available_at = LEAST(
+        NOW() + make_interval(secs => %(debounce_seconds)s),
+        created_at + make_interval(secs => %(max_debounce_seconds)s)
+    )
+WHERE id = %(job_id)s
+"""
+
+
+SQL_REQUEST_BOT_JOB_CANCEL = """
+UPDATE bot_jobs
+SET cancel_requested = TRUE
+WHERE id = %(job_id)s
+"""
+
+
+# Running jobs whose lease expired belonged to a worker that died; they are
+# picked up again like queued ones. Only the oldest open job of a
+# conversation is claimable, so one conversation is never processed twice
+# at the same time.
+SQL_CLAIM_BOT_JOB = """
+UPDATE bot_jobs
+SET status = 'running',
+    attempts = attempts + 1,
+    locked_until = NOW() + make_interval(secs => %(lease_seconds)s)
+WHERE id = (
+    SELECT j.id
+    FROM bot_jobs AS j
+    WHERE j.available_at <= NOW()
+      AND (j.status = 'queued' OR (j.status = 'running' AND j.locked_until < NOW()))
+      AND NOT j.cancel_requested
+      AND j.id = (
+          SELECT MIN(o.id)
+          FROM bot_jobs AS o
+          WHERE o.account_id = j.account_id
+            AND o.conversation_id = j.conversation_id
+            AND o.status IN ('queued', 'running')
+            -- A superseded job whose worker died must not block the conversation.
+            AND NOT (o.cancel_requested AND o.locked_until < NOW())
+      )
+    ORDER BY j.available_at, j.id
+    FOR UPDATE SKIP LOCKED
+    LIMIT 1
+)
+RETURNING id, account_id, conversation_id, payload, attempts,
+          EXTRACT(EPOCH FROM (NOW() - available_at)) AS wait_seconds
+"""
+
+
+# The reply is queued in the same transaction, and only if no newer message
+# superseded the job in the meantime.
+SQL_FINISH_BOT_JOB = """
+UPDATE bot_jobs
+SET status = 'done', finished_at = NOW(), locked_until = NULL
+WHERE id = %(job_id)s
+  AND status = 'running'
+  AND NOT cancel_requested
+RETURNING id
+"""
+
+
+SQL_COMPLETE_BOT_JOB = """
+UPDATE bot_jobs
+SET status = 'done', finished_at = NOW(), locked_until = NULL
+WHERE id = %(job_id)s
+  AND status = 'running'
+"""
+
+
+SQL_CANCEL_BOT_JOB = """
+UPDATE bot_jobs
+SET status = 'cancelled', finished_at = NOW(), locked_until = NULL
+WHERE id = %(job_id)s
+  AND status = 'running'
+"""
+
+
+SQL_RETRY_BOT_JOB = """
+UPDATE bot_jobs
+SET status = 'queued',
+    available_at = NOW() + make_interval(secs => %(delay_seconds)s),
+    locked_until = NULL,
+    last_error = %(error)s
+WHERE id = %(job_id)s
+  AND status = 'running'
+"""
+
+
+SQL_FAIL_BOT_JOB = """
+UPDATE bot_jobs
+SET status = 'failed', finished_at = NOW(), locked_until = NULL, last_error = %(error)s
+WHERE id = %(job_id)s
+  AND status = 'running'
+"""
+
+
+SQL_COUNT_READY_BOT_JOBS = """
+SELECT COUNT(*)
+FROM bot_jobs
+WHERE status = 'queued'
+"""
+
+
+SQL_DELETE_FINISHED_BOT_JOBS = """
+DELETE FROM bot_jobs
+WHERE (status IN ('done', 'failed', 'cancelled')
+       AND finished_at < NOW() - make_interval(secs => %(retention_seconds)s))
+   OR (cancel_requested AND locked_until < NOW() - make_interval(secs => %(retention_seconds)s))
+"""
+
+
+SQL_DELETE_OLD_BOT_JOB_MESSAGES = """
+DELETE FROM bot_job_messages
+WHERE created_at < NOW() - make_interval(secs => %(retention_seconds)s)
+"""
+
+
+SQL_CREATE_CHATWOOT_OUTBOX_TABLE = """
+CREATE TABLE IF NOT EXISTS chatwoot_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    account_id BIGINT NOT NULL,
+    conversation_id BIGINT NOT NULL,
+    kind TEXT NOT NULL,
+    body JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_until TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    sent_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS chatwoot_outbox_ready_idx
+    ON chatwoot_outbox (available_at, id) WHERE status IN ('pending', 'sending');
+CREATE INDEX IF NOT EXISTS chatwoot_outbox_conversation_idx
+    ON chatwoot_outbox (account_id, conversation_id, id) WHERE status IN ('pending', 'sending');
+"""
+
+
+SQL_ENQUEUE_CHATWOOT_OUTBOX = """
+INSERT INTO chatwoot_outbox (account_id, conversation_id, kind, body)
+VALUES (%(account_id)s, %(conversation_id)s, %(kind)s, %(body)s)
+"""
+
+
+SQL_CLAIM_CHATWOOT_OUTBOX = """
+UPDATE chatwoot_outbox
+SET status = 'sending',
+    attempts = attempts + 1,
+    locked_until = NOW() + make_interval(secs => %(lease_seconds)s)
+WHERE id IN (
+    SELECT id
+    FROM chatwoot_outbox
+    WHERE available_at <= NOW()
+      AND (status = 'pending' OR (status = 'sending' AND locked_until < NOW()))
+      -- A public message waits until every older public message of its
+      -- conversation was sent or gave up, so a retried reply is never
+      -- overtaken by a newer one.
+      AND NOT (
+          kind = 'message'
+          AND NOT COALESCE((body->>'private')::boolean, FALSE)
+          AND EXISTS (
+              SELECT 1
+              FROM chatwoot_outbox AS older
+              WHERE older.account_id = chatwoot_outbox.account_id
+                AND older.conversation_id = chatwoot_outbox.conversation_id
+                AND older.id < chatwoot_outbox.id
+                AND older.status IN ('pending', 'sending')
+                AND older.kind = 'message'
+                AND NOT COALESCE((older.body->>'private')::boolean, FALSE)
+          )
+      )
+    ORDER BY id
+    FOR UPDATE SKIP LOCKED
+    LIMIT %(limit)s
+)
+RETURNING id, account_id, conversation_id, kind, body, attempts,
+          EXTRACT(EPOCH FROM (NOW() - created_at)) AS wait_seconds
+"""
+
+
+SQL_MARK_CHATWOOT_OUTBOX_SENT = """
+UPDATE chatwoot_outbox
+SET status = 'sent', sent_at = NOW(), locked_until = NULL
+WHERE id = ANY(%(ids)s)
+"""
+
+
+SQL_RETRY_CHATWOOT_OUTBOX = """
+UPDATE chatwoot_outbox
+SET status = 'pending',
+    available_at = NOW() + make_interval(secs => %(delay_seconds)s),
+    locked_until = NULL,
+    last_error = %(error)s
+WHERE id = %(outbox_id)s
+"""
+
+
+SQL_FAIL_CHATWOOT_OUTBOX = """
+UPDATE chatwoot_outbox
+SET status = 'failed', locked_until = NULL, last_error = %(error)s
+WHERE id = %(outbox_id)s
+"""
+
+
+SQL_DELETE_SENT_CHATWOOT_OUTBOX = """
+DELETE FROM chatwoot_outbox
+WHERE status = 'sent'
+  AND sent_at < NOW() - make_interval(secs => %(retention_seconds)s)
+"""
+
+
+SQL_CREATE_INGEST_MANIFEST_TABLE = """
+CREATE TABLE IF NOT EXISTS rag_ingest_manifest (
+    tenant_id BIGINT NOT NULL,
+    path TEXT NOT NULL,
+    folder_name TEXT NOT NULL,
+    size_bytes BIGINT NOT NULL,
+    mtime DOUBLE PRECISION NOT NULL,
+    content_hash TEXT NOT NULL,
+    embed_model TEXT NOT NULL,
+    node_ids TEXT[] NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (tenant_id, path)
+);
+ALTER TABLE rag_ingest_manifest ADD COLUMN IF NOT EXISTS chunk_signatures BYTEA NOT NULL DEFAULT ''::bytea;
+ALTER TABLE rag_ingest_manifest ADD COLUMN IF NOT EXISTS duplicate_of TEXT[] NOT NULL DEFAULT '{}';
+"""
+
+
+SQL_GET_INGEST_MANIFEST = """
+SELECT path, folder_name, size_bytes, mtime, content_hash, embed_model, node_ids,
+       chunk_signatures, duplicate_of
+FROM rag_ingest_manifest
+WHERE tenant_id = %(tenant_id)s
+"""
+
+
+SQL_UPSERT_INGEST_MANIFEST = """
+INSERT INTO rag_ingest_manifest (
+    tenant_id, path, folder_name, size_bytes, mtime, content_hash, embed_model, node_ids,
+    chunk_signatures, duplicate_of, updated_at
+)
+VALUES (
+    %(tenant_id)s, %(path)s, %(folder_name)s, %(size_bytes)s, %(mtime)s,
+    %(content_hash)s, %(embed_model)s, %(node_ids)s,
+    %(chunk_signatures)s, %(duplicate_of)s, NOW()
+)
+ON CONFLICT (tenant_id, path)
+DO UPDATE SET
+    folder_name = EXCLUDED.folder_name,
+    size_bytes = EXCLUDED.size_bytes,
+    mtime = EXCLUDED.mtime,
+    content_hash = EXCLUDED.content_hash,
+    embed_model = EXCLUDED.embed_model,
+    node_ids = EXCLUDED.node_ids,
+    chunk_signatures = EXCLUDED.chunk_signatures,
+    duplicate_of = EXCLUDED.duplicate_of,
+    updated_at = EXCLUDED.updated_at
+"""
+
+
+SQL_DELETE_INGEST_MANIFEST = """
+DELETE FROM rag_ingest_manifest
+WHERE tenant_id = %(tenant_id)s
+  AND path = ANY(%(paths)s)
+"""
+
+
+SQL_CREATE_EMBEDDING_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS rag_embedding_cache (
+    embed_model TEXT NOT NULL,
+    dimensions INT NOT NULL,
+    text_hash BYTEA NOT NULL,
+    embedding BYTEA NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (embed_model, dimensions, text_hash)
+);
+CREATE INDEX IF NOT EXISTS rag_embedding_cache_last_used_idx ON rag_embedding_cache (last_used_at);
+"""
+
+
+# Returns the hits and refreshes last_used_at at most hourly, so hot rows
+# survive pruning without a write on every lookup.
+SQL_GET_CACHED_EMBEDDINGS = """
+WITH hits AS (
+    SELECT text_hash, embedding, last_used_at
+    FROM rag_embedding_cache
+    WHERE embed_model = %(embed_model)s
+      AND dimensions = %(dimensions)s
+      AND text_hash = ANY(%(hashes)s)
+), touched AS (
+    UPDATE rag_embedding_cache AS cache
+    SET last_used_at = NOW()
+    FROM hits
+    WHERE cache.embed_model = %(embed_model)s
+      AND cache.dimensions = %(dimensions)s
+      AND cache.text_hash = hits.text_hash
+      AND hits.last_used_at < NOW() - INTERVAL '1 hour'
+)
+SELECT text_hash, embedding FROM hits
+"""
+
+
+SQL_INSERT_CACHED_EMBEDDING = """
+INSERT INTO rag_embedding_cache (embed_model, dimensions, text_hash, embedding)
+VALUES (%(embed_model)s, %(dimensions)s, %(text_hash)s, %(embedding)s)
+ON CONFLICT (embed_model, dimensions, text_hash) DO NOTHING
+"""
+
+
+SQL_PRUNE_EMBEDDING_CACHE = """
+DELETE FROM rag_embedding_cache
+WHERE ctid IN (
+    SELECT ctid
+    FROM rag_embedding_cache
+    ORDER BY last_used_at
+    LIMIT GREATEST((SELECT COUNT(*) FROM rag_embedding_cache) - %(max_rows)s, 0)
+)
+"""
+
+
+SQL_CREATE_INGEST_JOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id BIGINT NOT NULL,
+    folder_name TEXT NOT NULL,
+    provider TEXT,
+    embed_model TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    attempts INT NOT NULL DEFAULT 0,
+    progress JSONB NOT NULL DEFAULT '{}'::jsonb,
+    report JSONB,
+    last_error TEXT,
+    locked_until TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+-- At most one waiting job per tenant; repeated clicks reuse it.
+CREATE UNIQUE INDEX IF NOT EXISTS ingest_jobs_one_queued_idx
+    ON ingest_jobs (tenant_id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS ingest_jobs_open_idx
+    ON ingest_jobs (id) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS ingest_jobs_tenant_idx ON ingest_jobs (tenant_id, id DESC);
+ALTER TABLE ingest_jobs ADD COLUMN IF NOT EXISTS rebuild BOOLEAN NOT NULL DEFAULT FALSE;
+"""
+
+
+SQL_ENQUEUE_INGEST_JOB = """
+INSERT INTO ingest_jobs (tenant_id, folder_name, provider, embed_model, rebuild)
+VALUES (%(tenant_id)s, %(folder_name)s, %(provider)s, %(embed_model)s, %(rebuild)s)
+ON CONFLICT (tenant_id) WHERE status = 'queued'
+DO UPDATE SET
+    folder_name = EXCLUDED.folder_name,
+    provider = EXCLUDED.provider,
+    embed_model = EXCLUDED.embed_model,
+    rebuild = ingest_jobs.rebuild OR EXCLUDED.rebuild,
+    updated_at = NOW()
+RETURNING id
+"""
+
+
+# A tenant's jobs run one at a time: a queued job waits while another job of
+# the same tenant is running, and a running job whose lease expired (its
+# worker died) is claimed again.
+SQL_CLAIM_INGEST_JOB = """
+WITH next_job AS (
+    SELECT job.id
+    FROM ingest_jobs AS job
+    WHERE NOT job.cancel_requested
+      AND (
+          (job.status = 'queued' AND NOT EXISTS (
+              SELECT 1 FROM ingest_jobs AS other
+              WHERE other.tenant_id = job.tenant_id
+                AND other.status = 'running'
+          ))
+          OR (job.status = 'running' AND job.locked_until < NOW())
+      )
+    ORDER BY job.id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE ingest_jobs
+SET status = 'running',
+    attempts = ingest_jobs.attempts + 1,
+    locked_until = NOW() + make_interval(secs => %(lease_seconds)s),
+    started_at = COALESCE(ingest_jobs.started_at, NOW()),
+    updated_at = NOW()
+FROM next_job
+WHERE ingest_jobs.id = next_job.id
+RETURNING ingest_jobs.id, ingest_jobs.tenant_id, ingest_jobs.folder_name,
+          ingest_jobs.provider, ingest_jobs.embed_model, ingest_jobs.rebuild,
+          ingest_jobs.attempts
+"""
+
+
+# Also renews the lease; returns whether cancellation was requested.
+SQL_UPDATE_INGEST_JOB_PROGRESS = """
+UPDATE ingest_jobs
+SET progress = %(progress)s,
+    locked_until = NOW() + make_interval(secs => %(lease_seconds)s),
+    updated_at = NOW()
+WHERE id = %(job_id)s
+  AND status = 'running'
+RETURNING cancel_requested
+"""
+
+
+SQL_FINISH_INGEST_JOB = """
+UPDATE ingest_jobs
+SET status = %(status)s,
+    progress = COALESCE(%(progress)s, progress),
+    report = %(report)s,
+    last_error = %(error)s,
+    locked_until = NULL,
+    updated_at = NOW(),
+    finished_at = NOW()
+WHERE id = %(job_id)s
+  AND status = 'running'
+"""
+
+
+# Queued jobs are cancelled at once; running ones stop at their next
+# progress update.
+SQL_CANCEL_INGEST_JOB = """
+UPDATE ingest_jobs
+SET cancel_requested = TRUE,
+    status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+    finished_at = CASE WHEN status = 'queued' THEN NOW() ELSE finished_at END,
+    updated_at = NOW()
+WHERE id = %(job_id)s
+  AND (%(tenant_id)s::bigint IS NULL OR tenant_id = %(tenant_id)s)
+  AND status IN ('queued', 'running')
+RETURNING id, status
+"""
+
+
+SQL_GET_INGEST_JOB = """
+SELECT id, tenant_id, folder_name, provider, embed_model, rebuild, status, cancel_requested,
+       attempts, progress, report, last_error, created_at, started_at, updated_at, finished_at
+FROM ingest_jobs
+WHERE id = %(job_id)s
+"""
+
+
+SQL_GET_LATEST_INGEST_JOB = """
+SELECT id, tenant_id, folder_name, provider, embed_model, rebuild, status, cancel_requested,
+       attempts, progress, report, last_error, created_at, started_at, updated_at, finished_at
+FROM ingest_jobs
+WHERE tenant_id = %(tenant_id)s
+ORDER BY id DESC
+LIMIT 1
+"""
+
+
+SQL_COUNT_OPEN_INGEST_JOBS = """
+SELECT COUNT(*)
+FROM ingest_jobs
+WHERE status IN ('queued', 'running')
+"""
+
+
+SQL_DELETE_FINISHED_INGEST_JOBS = """
+DELETE FROM ingest_jobs
+WHERE status IN ('done', 'failed', 'cancelled')
+  AND finished_at < NOW() - make_interval(secs => %(retention_seconds)s)
+"""
+
+
+# Hands a job interrupted by shutdown straight back to the queue without
+# counting the attempt.
+SQL_RELEASE_INGEST_JOB = """
+UPDATE ingest_jobs
+SET locked_until = NOW(),
+    attempts = GREATEST(attempts - 1, 0),
+    updated_at = NOW()
+WHERE id = %(job_id)s
+  AND status = 'running'
+"""
+
+
+# Bulk vector loads: rows are COPYed (binary) into a per-connection temp table
+# and moved into the PGVectorStore table with one INSERT ... SELECT. `{table}`
+# is filled in with psycopg.sql, since the table name is per deployment.
+SQL_CREATE_VECTOR_STAGING_TABLE = """
+CREATE TEMP TABLE IF NOT EXISTS rag_vectors_staging (
+    node_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    metadata_ JSON,
+    embedding REAL[] NOT NULL
+) ON COMMIT DELETE ROWS
+"""
+
+
+SQL_COPY_VECTOR_STAGING = """
+COPY rag_vectors_staging (node_id, text, metadata_, embedding) FROM STDIN (FORMAT BINARY)
+"""
+
+
+# Only for the current transaction: the load can be replayed from the
+# manifest, so it need not wait for the WAL flush, and a larger work_mem
+# keeps the sort below in memory.
+SQL_TUNE_VECTOR_LOAD = """
+SELECT set_config('synchronous_commit', 'off', true),
+       set_config('work_mem', %(work_mem)s, true)
+"""
+
+
+# Sorted so the tenant / ref_doc_id b-tree indexes are updated in key order.
+SQL_MERGE_VECTOR_STAGING = """
+INSERT INTO {table} (node_id, text, metadata_, embedding)
+SELECT node_id, text, metadata_, embedding::vector
+FROM rag_vectors_staging
+ORDER BY metadata_->>'tenant_id', metadata_->>'ref_doc_id'
+"""
+
+
+# Corpus versions: every vector row carries `corpus_version` in its metadata
+# and retrieval only reads the tenant's active version. A rebuild writes a new
+# version next to the live one and switches in one transaction; retired
+# versions are deleted in the background. Version 0 is the rows written before
+# versions existed (no `corpus_version` key) and never has an 'active' row.
+SQL_CREATE_CORPUS_VERSIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS rag_corpus_versions (
+    tenant_id BIGINT NOT NULL,
+    version INT NOT NULL,
+    schema_name TEXT NOT NULL DEFAULT 'public',
+    status TEXT NOT NULL DEFAULT 'building',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    activated_at TIMESTAMPTZ,
+    retired_at TIMESTAMPTZ,
+    PRIMARY KEY (tenant_id, version)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS rag_corpus_versions_active_idx
+    ON rag_corpus_versions (tenant_id) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS rag_corpus_versions_retired_idx
+    ON rag_corpus_versions (retired_at) WHERE status = 'retired';
+"""
+
+
+SQL_GET_ACTIVE_CORPUS_VERSION = """
+SELECT version
+FROM rag_corpus_versions
+WHERE tenant_id = %(tenant_id)s
+  AND status = 'active'
+"""
+
+
+# Session lock held for a whole ingest run, by queue jobs and the CLI alike.
+SQL_LOCK_TENANT_INGEST = """
+SELECT pg_advisory_lock(hashtextextended('rag_ingest:' || %(tenant_id)s::text, 0))
+"""
+
+
+# A tenant's ingests run one at a time (under SQL_LOCK_TENANT_INGEST), so a
+# version still 'building' belongs to a run that died; retire it so its rows
+# are collected.
+SQL_RETIRE_BUILDING_CORPUS_VERSIONS = """
+UPDATE rag_corpus_versions
+SET status = 'retired', retired_at = NOW()
+WHERE tenant_id = %(tenant_id)s
+  AND status = 'building'
+"""
+
+
+SQL_CREATE_CORPUS_VERSION = """
+INSERT INTO rag_corpus_versions (tenant_id, version, schema_name)
+SELECT %(tenant_id)s, COALESCE(MAX(version), 0) + 1, %(schema_name)s
+FROM rag_corpus_versions
+WHERE tenant_id = %(tenant_id)s
+RETURNING version
+"""
+
+
+SQL_RETIRE_CORPUS_VERSION = """
+UPDATE rag_corpus_versions
+SET status = 'retired', retired_at = NOW()
+WHERE tenant_id = %(tenant_id)s
+  AND version = %(version)s
+  AND status IN ('building', 'active')
+"""
+
+
+SQL_RETIRE_ACTIVE_CORPUS_VERSION = """
+UPDATE rag_corpus_versions
+SET status = 'retired', retired_at = NOW()
+WHERE tenant_id = %(tenant_id)s
+  AND status = 'active'
+"""
+
+
+# First switch of a tenant: its unversioned rows become version 0 and retire.
+SQL_RETIRE_LEGACY_CORPUS_VERSION = """
+INSERT INTO rag_corpus_versions (tenant_id, version, schema_name, status, retired_at)
+VALUES (%(tenant_id)s, 0, %(schema_name)s, 'retired', NOW())
+ON CONFLICT (tenant_id, version) DO NOTHING
+"""
+
+
+SQL_ACTIVATE_CORPUS_VERSION = """
+UPDATE rag_corpus_versions
+SET status = 'active', activated_at = NOW()
+WHERE tenant_id = %(tenant_id)s
+  AND version = %(version)s
+  AND status = 'building'
+"""
+
+
+SQL_CLEAR_INGEST_MANIFEST = """
+DELETE FROM rag_ingest_manifest
+WHERE tenant_id = %(tenant_id)s
+"""
+
+
+# Moves rows kept from the previous version (files that failed to parse
+# during a rebuild) into the new one. `{table}` is filled in with psycopg.sql.
+SQL_RETAG_CORPUS_ROWS = """
+UPDATE {table}
+SET metadata_ = (metadata_::jsonb || jsonb_build_object('corpus_version', %(version)s::text))::json
+WHERE node_id = ANY(%(node_ids)s)
+"""
+
+
+SQL_SET_DUPLICATE_SOURCES = """
+UPDATE {table} AS v
+SET metadata_ = CASE
+    WHEN jsonb_array_length(s.sources) = 0 THEN (v.metadata_::jsonb - 'duplicate_sources')::json
+    ELSE jsonb_set(v.metadata_::jsonb, '{{duplicate_sources}}', s.sources)::json
+END
+FROM jsonb_each(%(sources)s::jsonb) AS s(node_id, sources)
+WHERE v.node_id = s.node_id
+  AND v.metadata_->>'tenant_id' = %(tenant_id)s
+"""
+
+
+SQL_GET_RETIRED_CORPUS_VERSIONS = """
+SELECT tenant_id, version, schema_name
+FROM rag_corpus_versions
+WHERE status = 'retired'
+  AND retired_at < NOW() - make_interval(secs => %(grace_seconds)s)
+ORDER BY retired_at
+LIMIT %(limit)s
+"""
+
+
+SQL_DELETE_CORPUS_VERSION_ROWS = """
+DELETE FROM {table}
+WHERE id IN (
+    SELECT id
+    FROM {table}
+    WHERE metadata_->>'tenant_id' = %(tenant_id)s
+      AND COALESCE(metadata_->>'corpus_version', '0') = %(version)s
+    LIMIT %(limit)s
+)
+"""
+
+
+SQL_MARK_CORPUS_VERSION_COLLECTED = """
+UPDATE rag_corpus_versions
+SET status = 'collected'
+WHERE tenant_id = %(tenant_id)s
+  AND version = %(version)s
+  AND status = 'retired'
+"""
+
+
+# Curated FAQ: canonical question/answer pairs answered before retrieval.
+# `embedding` is the question's vector from `embed_model`, packed as
+# little-endian float32.
+SQL_CREATE_FAQ_TABLE = """
+CREATE TABLE IF NOT EXISTS rag_faq (
+    id BIGSERIAL PRIMARY KEY,
+    tenant_id BIGINT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    embed_model TEXT NOT NULL,
+    embedding BYTEA NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (tenant_id, question)
+);
+"""
+
+
+SQL_GET_FAQ_ENTRIES = """
+SELECT id, question, answer, embed_model, embedding, updated_at
+FROM rag_faq
+WHERE tenant_id = %(tenant_id)s
+ORDER BY id
+"""
+
+
+SQL_UPSERT_FAQ_ENTRY = """
+INSERT INTO rag_faq (tenant_id, question, answer, embed_model, embedding)
+VALUES (%(tenant_id)s, %(question)s, %(answer)s, %(embed_model)s, %(embedding)s)
+ON CONFLICT (tenant_id, question)
+DO UPDATE SET
+    answer = EXCLUDED.answer,
+    embed_model = EXCLUDED.embed_model,
+    embedding = EXCLUDED.embedding,
+    updated_at = NOW()
+"""
+
+
+SQL_UPDATE_FAQ_ENTRY = """
+UPDATE rag_faq
+SET question = %(question)s,
+    answer = %(answer)s,
+    embed_model = %(embed_model)s,
+    embedding = %(embedding)s,
+    updated_at = NOW()
+WHERE tenant_id = %(tenant_id)s
+  AND id = %(id)s
+"""
+
+
+SQL_UPDATE_FAQ_EMBEDDING = """
+UPDATE rag_faq
+SET embed_model = %(embed_model)s, embedding = %(embedding)s
+WHERE tenant_id = %(tenant_id)s
+  AND id = %(id)s
+"""
+
+
+SQL_DELETE_FAQ_ENTRIES = """
+DELETE FROM rag_faq
+WHERE tenant_id = %(tenant_id)s
+  AND id = ANY(%(ids)s)
+"""
+
+
+SQL_CLEAR_FAQ_ENTRIES = """
+DELETE FROM rag_faq
+WHERE tenant_id = %(tenant_id)s
+"""
@@ -2,34 +2,26 @@
 
 from __future__ import annotations
 
-import os
 import json
+from contextlib import asynccontextmanager
 from datetime import date
-from typing import Any, Dict
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict
 
 import anyio
+import psycopg
+from psycopg import errors, sql
 from psycopg.rows import dict_row
-from aiocache import Cache
 
-from .connection import get_connection
+from .cache import DEFAULT_TTL as _DEFAULT_TTL, create_cache
+from .connection import get_connection, resolve_database_dsn
+from .notifications import CHANNEL_BOT_JOB_CANCEL, CHANNEL_BOT_JOBS, CHANNEL_INGEST_JOBS
+from .vector_loader import vector_table_identifier
 from . import queries
 
-# --- Cache backend: Memory now, flip to Redis via env without code changes ---
-# MEMORY (default): no external service. For production, set CACHE_BACKEND=REDIS.
-_BACKEND = os.getenv("CACHE_BACKEND", "MEMORY").upper()
-_NAMESPACE = os.getenv("CACHE_NAMESPACE", "veridata")
-_DEFAULT_TTL = int(os.getenv("CACHE_TTL_SECONDS", "300"))  # 5 minutes
-
-if _BACKEND == "REDIS":
-    _cache = Cache(
-        Cache.REDIS,
-        endpoint=os.getenv("REDIS_HOST", "localhost"),
-        port=int(os.getenv("REDIS_PORT", "6379")),
-        password=os.getenv("REDIS_PASSWORD") or None,
-        namespace=_NAMESPACE,
-    )
-else:
-    _cache = Cache(Cache.MEMORY, namespace=_NAMESPACE)
+_cache = create_cache()
+# Short, so other processes see a corpus switch well within the GC grace period.
+_CORPUS_VERSION_TTL = 30
 
 async def get_params_by_omnichannel_id(omnichannel_id: int) -> Dict[str, Any]:
     """
@@ -284,3 +276,875 @@ async def update_omnichannel_settings(
             conn.commit()
 
     await anyio.to_thread.run_sync(_update)
+
+
+async def ensure_bot_sessions_table() -> None:
+    """
+    Create the conversation session table when it does not exist yet.
+    """
+
+    def _create() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_CREATE_BOT_SESSIONS_TABLE)
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_create)
+
+
+async def get_bot_session(session_key: str) -> bytes | None:
+    """
+    Fetch a serialized conversation session. Returns None when missing or expired.
+    """
+
+    def _query() -> bytes | None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_GET_BOT_SESSION, {"session_key": session_key})
+            row = cur.fetchone()
+            return bytes(row[0]) if row else None
+
+    return await anyio.to_thread.run_sync(_query)
+
+
+async def save_bot_sessions(rows: list[Dict[str, Any]], ttl_seconds: int) -> None:
+    """
+    Upsert serialized sessions in one round trip.
+
+    Each row needs `session_key`, `tenant_id` and `payload`.
+    """
+    if not rows:
+        return
+
+    def _upsert() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.executemany(
+                queries.SQL_UPSERT_BOT_SESSION,
+                [{**row, "ttl_seconds": ttl_seconds} for row in rows],
+            )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_upsert)
+
+
+async def delete_expired_bot_sessions() -> int:
+    """
+    Remove expired conversation sessions and return how many were deleted.
+    """
+
+    def _delete() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_DELETE_EXPIRED_BOT_SESSIONS)
+            deleted = cur.rowcount
+            conn.commit()
+            return deleted
+
+    return await anyio.to_thread.run_sync(_delete)
+
+
+async def ensure_bot_queue_tables() -> None:
+    """
+    Create the bot job queue and Chatwoot outbox tables when missing.
+    """
+
+    def _create() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_CREATE_BOT_JOBS_TABLE)
+            cur.execute(queries.SQL_CREATE_CHATWOOT_OUTBOX_TABLE)
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_create)
+
+
+async def enqueue_bot_job(
+    account_id: int,
+    conversation_id: int,
+    message_id: int | None,
+    payload: Dict[str, Any],
+    *,
+    debounce_seconds: float = 0,
+    max_debounce_seconds: float = 0,
+    merge: Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]] | None = None,
+) -> Dict[str, Any]:
+    """
+    Queue an incoming Chatwoot message for the bot workers.
+
+    With `merge`, a message arriving while the conversation already has a
+    queued job is folded into it (debounce). If the conversation's job is
+    running, that job is flagged for cancellation and a new job carrying the
+    merged payload replaces it. A message id that was already accepted is
+    not queued again, whichever process received it. Returns `job_id`,
+    `merged`, `superseded_job_id` and `duplicate`.
+    """
+    params = {"account_id": account_id, "conversation_id": conversation_id}
+
+    def _enqueue() -> Dict[str, Any]:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(queries.SQL_LOCK_BOT_CONVERSATION, params)
+            result: Dict[str, Any] = {"job_id": None, "merged": False, "superseded_job_id": None, "duplicate": False}
+            if message_id is not None:
+                cur.execute(queries.SQL_CLAIM_BOT_MESSAGE, {**params, "message_id": message_id})
+                if cur.fetchone() is None:
+                    conn.rollback()
+                    return {**result, "duplicate": True}
+
+            open_job = None
+            if merge is not None:
+                cur.execute(queries.SQL_GET_OPEN_BOT_JOB, params)
+                open_job = cur.fetchone()
+
+            body = payload
+            if open_job is not None:
+                body = merge(open_job["payload"], payload)
+                if open_job["status"] == "queued":
+                    cur.execute(
+                        queries.SQL_MERGE_BOT_JOB,
+                        {
+                            "job_id": open_job["id"],
+                            "payload": json.dumps(body),
+                            "message_id": message_id,
+                            "debounce_seconds": debounce_seconds,
+                            "max_debounce_seconds": max(max_debounce_seconds, debounce_seconds),
+                        },
+                    )
+                    cur.execute(queries.SQL_NOTIFY, {"channel": CHANNEL_BOT_JOBS, "payload": ""})
+                    conn.commit()
+                    return {**result, "job_id": open_job["id"], "merged": True}
+                cur.execute(queries.SQL_REQUEST_BOT_JOB_CANCEL, {"job_id": open_job["id"]})
+                # The process running it stops the generation at once.
+                cur.execute(
+                    queries.SQL_NOTIFY, {"channel": CHANNEL_BOT_JOB_CANCEL, "payload": str(open_job["id"])}
+                )
+                result["superseded_job_id"] = open_job["id"]
+
+            cur.execute(
+                queries.SQL_ENQUEUE_BOT_JOB,
+                {
+                    **params,
+                    "message_id": message_id,
+                    "payload": json.dumps(body),
+                    "debounce_seconds": debounce_seconds,
+                },
+            )
+            result["job_id"] = cur.fetchone()["id"]
+            cur.execute(queries.SQL_NOTIFY, {"channel": CHANNEL_BOT_JOBS, "payload": ""})
+            conn.commit()
+            return result
+
+    return await anyio.to_thread.run_sync(_enqueue)
+
+
+async def claim_bot_job(lease_seconds: int) -> Dict[str, Any] | None:
+    """
+    Lock the oldest ready job with SKIP LOCKED so workers never contend for a row.
+    """
+
+    def _claim() -> Dict[str, Any] | None:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(queries.SQL_CLAIM_BOT_JOB, {"lease_seconds": lease_seconds})
+            row = cur.fetchone()
+            conn.commit()
+            return row
+
+    return await anyio.to_thread.run_sync(_claim)
+
+
+async def finish_bot_job(job_id: int, outbox_rows: list[Dict[str, Any]]) -> bool:
+    """
+    Mark a running job done and queue its Chatwoot calls atomically.
+
+    Returns False (and queues nothing) when a newer message superseded the job.
+    """
+
+    def _finish() -> bool:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_FINISH_BOT_JOB, {"job_id": job_id})
+            if cur.fetchone() is None:
+                conn.rollback()
+                return False
+            if outbox_rows:
+                cur.executemany(
+                    queries.SQL_ENQUEUE_CHATWOOT_OUTBOX,
+                    [{**row, "body": json.dumps(row["body"])} for row in outbox_rows],
+                )
+            conn.commit()
+            return True
+
+    return await anyio.to_thread.run_sync(_finish)
+
+
+async def cancel_bot_job(job_id: int) -> None:
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_CANCEL_BOT_JOB, {"job_id": job_id})
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def complete_bot_job(job_id: int) -> None:
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_COMPLETE_BOT_JOB, {"job_id": job_id})
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def retry_bot_job(job_id: int, delay_seconds: float, error: str) -> None:
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_RETRY_BOT_JOB,
+                {"job_id": job_id, "delay_seconds": delay_seconds, "error": error},
+            )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def fail_bot_job(job_id: int, error: str) -> None:
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_FAIL_BOT_JOB, {"job_id": job_id, "error": error})
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def count_ready_bot_jobs() -> int:
+    """
+    Return the number of queued bot jobs (the queue depth).
+    """
+
+    def _count() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_COUNT_READY_BOT_JOBS)
+            return int(cur.fetchone()[0])
+
+    return await anyio.to_thread.run_sync(_count)
+
+
+async def delete_finished_bot_jobs(retention_seconds: int) -> int:
+    def _delete() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_DELETE_FINISHED_BOT_JOBS,
+                {"retention_seconds": retention_seconds},
+            )
+            deleted = cur.rowcount
+            cur.execute(
+                queries.SQL_DELETE_OLD_BOT_JOB_MESSAGES,
+                {"retention_seconds": retention_seconds},
+            )
+            conn.commit()
+            return deleted
+
+    return await anyio.to_thread.run_sync(_delete)
+
+
+async def enqueue_chatwoot_outbox(rows: list[Dict[str, Any]]) -> None:
+    """
+    Queue outbound Chatwoot calls in one transaction.
+
+    Each row needs `account_id`, `conversation_id`, `kind` and `body`.
+    """
+    if not rows:
+        return
+
+    def _insert() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.executemany(
+                queries.SQL_ENQUEUE_CHATWOOT_OUTBOX,
+                [{**row, "body": json.dumps(row["body"])} for row in rows],
+            )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_insert)
+
+
+async def claim_chatwoot_outbox(limit: int, lease_seconds: int) -> list[Dict[str, Any]]:
+    def _claim() -> list[Dict[str, Any]]:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(
+                queries.SQL_CLAIM_CHATWOOT_OUTBOX,
+                {"limit": limit, "lease_seconds": lease_seconds},
+            )
+            rows = cur.fetchall()
+            conn.commit()
+            return rows
+
+    return await anyio.to_thread.run_sync(_claim)
+
+
+async def mark_chatwoot_outbox_sent(outbox_ids: list[int]) -> None:
+    if not outbox_ids:
+        return
+
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_MARK_CHATWOOT_OUTBOX_SENT, {"ids": outbox_ids})
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def retry_chatwoot_outbox(outbox_id: int, delay_seconds: float, error: str) -> None:
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_RETRY_CHATWOOT_OUTBOX,
+                {"outbox_id": outbox_id, "delay_seconds": delay_seconds, "error": error},
+            )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def fail_chatwoot_outbox(outbox_id: int, error: str) -> None:
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_FAIL_CHATWOOT_OUTBOX,
+                {"outbox_id": outbox_id, "error": error},
+            )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def delete_sent_chatwoot_outbox(retention_seconds: int) -> int:
+    def _delete() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_DELETE_SENT_CHATWOOT_OUTBOX,
+                {"retention_seconds": retention_seconds},
+            )
+            deleted = cur.rowcount
+            conn.commit()
+            return deleted
+
+    return await anyio.to_thread.run_sync(_delete)
+
+
+async def ensure_ingest_manifest_table() -> None:
+    """
+    Create the per-tenant document manifest used by incremental ingest.
+    """
+
+    def _create() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_CREATE_INGEST_MANIFEST_TABLE)
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_create)
+
+
+async def get_ingest_manifest(tenant_id: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Return the tenant's ingested files keyed by path.
+    """
+
+    def _query() -> Dict[str, Dict[str, Any]]:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(queries.SQL_GET_INGEST_MANIFEST, {"tenant_id": tenant_id})
+            return {row["path"]: row for row in cur.fetchall()}
+
+    return await anyio.to_thread.run_sync(_query)
+
+
+async def save_ingest_manifest(
+    tenant_id: int,
+    entries: list[Dict[str, Any]],
+    removed_paths: list[str],
+) -> None:
+    """
+    Upsert changed manifest entries and drop removed ones in one transaction.
+
+    Each entry needs `path`, `folder_name`, `size_bytes`, `mtime`,
+    `content_hash`, `embed_model`, `node_ids`, `chunk_signatures` and
+    `duplicate_of`.
+    """
+    if not entries and not removed_paths:
+        return
+
+    def _save() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            if entries:
+                cur.executemany(
+                    queries.SQL_UPSERT_INGEST_MANIFEST,
+                    [{**entry, "tenant_id": tenant_id} for entry in entries],
+                )
+            if removed_paths:
+                cur.execute(
+                    queries.SQL_DELETE_INGEST_MANIFEST,
+                    {"tenant_id": tenant_id, "paths": removed_paths},
+                )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_save)
+
+
+async def ensure_ingest_jobs_table() -> None:
+    """
+    Create the background ingest job table when missing.
+    """
+
+    def _create() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_CREATE_INGEST_JOBS_TABLE)
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_create)
+
+
+async def enqueue_ingest_job(
+    tenant_id: int,
+    folder_name: str,
+    provider: str | None = None,
+    embed_model: str | None = None,
+    rebuild: bool = False,
+) -> int:
+    """
+    Queue an ingest for the tenant, reusing its waiting job if there is one.
+    """
+
+    def _enqueue() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_ENQUEUE_INGEST_JOB,
+                {
+                    "tenant_id": tenant_id,
+                    "folder_name": folder_name,
+                    "provider": provider,
+                    "embed_model": embed_model,
+                    "rebuild": rebuild,
+                },
+            )
+            job_id = cur.fetchone()[0]
+            cur.execute(queries.SQL_NOTIFY, {"channel": CHANNEL_INGEST_JOBS, "payload": ""})
+            conn.commit()
+            return job_id
+
+    return await anyio.to_thread.run_sync(_enqueue)
+
+
+async def claim_ingest_job(lease_seconds: int) -> Dict[str, Any] | None:
+    def _claim() -> Dict[str, Any] | None:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(queries.SQL_CLAIM_INGEST_JOB, {"lease_seconds": lease_seconds})
+            row = cur.fetchone()
+            conn.commit()
+            return row
+
+    return await anyio.to_thread.run_sync(_claim)
+
+
+async def update_ingest_job_progress(job_id: int, progress: Dict[str, Any], lease_seconds: int) -> bool:
+    """
+    Store progress counters and renew the lease.
+
+    Returns True when the job should stop: cancellation was requested or the
+    job is no longer ours.
+    """
+
+    def _update() -> bool:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_UPDATE_INGEST_JOB_PROGRESS,
+                {"job_id": job_id, "progress": json.dumps(progress), "lease_seconds": lease_seconds},
+            )
+            row = cur.fetchone()
+            conn.commit()
+            return row is None or bool(row[0])
+
+    return await anyio.to_thread.run_sync(_update)
+
+
+async def finish_ingest_job(
+    job_id: int,
+    status: str,
+    *,
+    progress: Dict[str, Any] | None = None,
+    report: Dict[str, Any] | None = None,
+    error: str | None = None,
+) -> None:
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_FINISH_INGEST_JOB,
+                {
+                    "job_id": job_id,
+                    "status": status,
+                    "progress": json.dumps(progress) if progress is not None else None,
+                    "report": json.dumps(report) if report is not None else None,
+                    "error": error,
+                },
+            )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def cancel_ingest_job(job_id: int, tenant_id: int | None = None) -> Dict[str, Any] | None:
+    """
+    Request cancellation; returns the job's id and status, or None if it already finished.
+    """
+
+    def _update() -> Dict[str, Any] | None:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(queries.SQL_CANCEL_INGEST_JOB, {"job_id": job_id, "tenant_id": tenant_id})
+            row = cur.fetchone()
+            conn.commit()
+            return row
+
+    return await anyio.to_thread.run_sync(_update)
+
+
+async def get_ingest_job(job_id: int) -> Dict[str, Any] | None:
+    def _query() -> Dict[str, Any] | None:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(queries.SQL_GET_INGEST_JOB, {"job_id": job_id})
+            return cur.fetchone()
+
+    return await anyio.to_thread.run_sync(_query)
+
+
+async def get_latest_ingest_job(tenant_id: int) -> Dict[str, Any] | None:
+    def _query() -> Dict[str, Any] | None:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(queries.SQL_GET_LATEST_INGEST_JOB, {"tenant_id": tenant_id})
+            return cur.fetchone()
+
+    return await anyio.to_thread.run_sync(_query)
+
+
+async def count_open_ingest_jobs() -> int:
+    def _query() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_COUNT_OPEN_INGEST_JOBS)
+            return int(cur.fetchone()[0])
+
+    return await anyio.to_thread.run_sync(_query)
+
+
+async def delete_finished_ingest_jobs(retention_seconds: int) -> int:
+    def _delete() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_DELETE_FINISHED_INGEST_JOBS,
+                {"retention_seconds": retention_seconds},
+            )
+            deleted = cur.rowcount
+            conn.commit()
+            return deleted
+
+    return await anyio.to_thread.run_sync(_delete)
+
+
+async def release_ingest_job(job_id: int) -> None:
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_RELEASE_INGEST_JOB, {"job_id": job_id})
+            # Another process's idle worker can resume it at once.
+            cur.execute(queries.SQL_NOTIFY, {"channel": CHANNEL_INGEST_JOBS, "payload": ""})
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def ensure_corpus_versions_table() -> None:
+    """
+    Create the per-tenant corpus version table when missing.
+    """
+
+    def _create() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_CREATE_CORPUS_VERSIONS_TABLE)
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_create)
+
+
+async def get_active_corpus_version(tenant_id: int) -> int:
+    """
+    Version retrieval should read for the tenant (0 = unversioned rows), cached briefly.
+    """
+    cache_key = f"corpus_version:{tenant_id}"
+    cached = await _cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    def _query() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_GET_ACTIVE_CORPUS_VERSION, {"tenant_id": tenant_id})
+            row = cur.fetchone()
+            return int(row[0]) if row else 0
+
+    version = await anyio.to_thread.run_sync(_query)
+    await _cache.set(cache_key, version, ttl=_CORPUS_VERSION_TTL)
+    return version
+
+
+@asynccontextmanager
+async def tenant_ingest_lock(tenant_id: int) -> AsyncIterator[None]:
+    """
+    Hold the tenant's ingest lock for the duration of the block.
+
+    The lock lives on its own connection and is released when it closes, also
+    when the process dies, so a crashed run never blocks the tenant.
+    """
+    conn = await anyio.to_thread.run_sync(partial(psycopg.connect, resolve_database_dsn(), autocommit=True))
+    try:
+        await anyio.to_thread.run_sync(conn.execute, queries.SQL_LOCK_TENANT_INGEST, {"tenant_id": tenant_id})
+        yield
+    finally:
+        with anyio.CancelScope(shield=True):
+            await anyio.to_thread.run_sync(conn.close)
+
+
+async def begin_corpus_version(tenant_id: int, schema_name: str) -> int:
+    """
+    Reserve the tenant's next corpus version for a rebuild.
+    """
+
+    def _begin() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            params = {"tenant_id": tenant_id, "schema_name": schema_name}
+            cur.execute(queries.SQL_RETIRE_BUILDING_CORPUS_VERSIONS, params)
+            cur.execute(queries.SQL_CREATE_CORPUS_VERSION, params)
+            version = cur.fetchone()[0]
+            conn.commit()
+            return version
+
+    return await anyio.to_thread.run_sync(_begin)
+
+
+async def retire_corpus_version(tenant_id: int, version: int) -> None:
+    def _retire() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_RETIRE_CORPUS_VERSION, {"tenant_id": tenant_id, "version": version})
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_retire)
+
+
+async def activate_corpus_version(
+    tenant_id: int,
+    version: int,
+    *,
+    schema_name: str,
+    vector_table: str,
+    entries: list[Dict[str, Any]],
+    carried_node_ids: list[str],
+) -> None:
+    """
+    Switch retrieval to `version` and replace the manifest in one transaction.
+
+    `carried_node_ids` are rows of the previous version that move into the
+    new one (files that could not be re-parsed keep their old vectors).
+    """
+
+    def _activate() -> None:
+        params = {"tenant_id": tenant_id, "version": version, "schema_name": schema_name}
+        with get_connection() as conn, conn.cursor() as cur:
+            if carried_node_ids:
+                cur.execute(
+                    sql.SQL(queries.SQL_RETAG_CORPUS_ROWS).format(
+                        table=vector_table_identifier(schema_name, vector_table)
+                    ),
+                    {"version": str(version), "node_ids": carried_node_ids},
+                )
+            cur.execute(queries.SQL_RETIRE_ACTIVE_CORPUS_VERSION, params)
+            if cur.rowcount == 0:
+                cur.execute(queries.SQL_RETIRE_LEGACY_CORPUS_VERSION, params)
+            cur.execute(queries.SQL_ACTIVATE_CORPUS_VERSION, params)
+            if cur.rowcount != 1:
+                conn.rollback()
+                raise RuntimeError(f"Corpus version {version} of tenant {tenant_id} is no longer being built.")
+            cur.execute(queries.SQL_CLEAR_INGEST_MANIFEST, params)
+            if entries:
+                cur.executemany(
+                    queries.SQL_UPSERT_INGEST_MANIFEST,
+                    [{**entry, "tenant_id": tenant_id} for entry in entries],
+                )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_activate)
+    await _cache.delete(f"corpus_version:{tenant_id}")
+
+
+async def set_duplicate_sources(
+    tenant_id: int,
+    schema_name: str,
+    vector_table: str,
+    sources: Dict[str, list[str]],
+) -> None:
+    """
+    Record on each canonical chunk the other files its text was found in.
+
+    An empty list removes the key.
+    """
+    if not sources:
+        return
+
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                sql.SQL(queries.SQL_SET_DUPLICATE_SOURCES).format(
+                    table=vector_table_identifier(schema_name, vector_table)
+                ),
+                {"tenant_id": str(tenant_id), "sources": json.dumps(sources)},
+            )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def get_retired_corpus_versions(grace_seconds: float, limit: int = 10) -> list[Dict[str, Any]]:
+    def _query() -> list[Dict[str, Any]]:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(
+                queries.SQL_GET_RETIRED_CORPUS_VERSIONS,
+                {"grace_seconds": grace_seconds, "limit": limit},
+            )
+            return cur.fetchall()
+
+    return await anyio.to_thread.run_sync(_query)
+
+
+async def delete_corpus_version_rows(
+    schema_name: str,
+    vector_table: str,
+    tenant_id: int,
+    version: int,
+    limit: int,
+) -> int:
+    """
+    Delete up to `limit` vector rows of a retired version; returns the count.
+    """
+
+    def _delete() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            try:
+                cur.execute(
+                    sql.SQL(queries.SQL_DELETE_CORPUS_VERSION_ROWS).format(
+                        table=vector_table_identifier(schema_name, vector_table)
+                    ),
+                    {"tenant_id": str(tenant_id), "version": str(version), "limit": limit},
+                )
+            except errors.UndefinedTable:
+                # A build that failed before writing anything.
+                conn.rollback()
+                return 0
+            deleted = cur.rowcount
+            conn.commit()
+            return deleted
+
+    return await anyio.to_thread.run_sync(_delete)
+
+
+async def mark_corpus_version_collected(tenant_id: int, version: int) -> None:
+    def _mark() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                queries.SQL_MARK_CORPUS_VERSION_COLLECTED,
+                {"tenant_id": tenant_id, "version": version},
+            )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_mark)
+
+
+async def ensure_faq_table() -> None:
+    """
+    Create the curated FAQ table when missing.
+    """
+
+    def _create() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_CREATE_FAQ_TABLE)
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_create)
+
+
+async def get_faq_entries(tenant_id: int) -> list[Dict[str, Any]]:
+    def _query() -> list[Dict[str, Any]]:
+        with get_connection() as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(queries.SQL_GET_FAQ_ENTRIES, {"tenant_id": tenant_id})
+            return cur.fetchall()
+
+    return await anyio.to_thread.run_sync(_query)
+
+
+async def upsert_faq_entries(
+    tenant_id: int,
+    entries: list[Dict[str, Any]],
+    *,
+    replace: bool = False,
+) -> None:
+    """
+    Insert FAQ entries, updating the answer of questions that already exist.
+
+    With `replace`, the tenant's other entries are deleted in the same transaction.
+    """
+
+    def _upsert() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            if replace:
+                cur.execute(queries.SQL_CLEAR_FAQ_ENTRIES, {"tenant_id": tenant_id})
+            if entries:
+                cur.executemany(
+                    queries.SQL_UPSERT_FAQ_ENTRY,
+                    [{**entry, "tenant_id": tenant_id} for entry in entries],
+                )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_upsert)
+
+
+async def update_faq_entry(tenant_id: int, entry_id: int, entry: Dict[str, Any]) -> bool:
+    """
+    Edit one FAQ entry; False when it does not exist for the tenant.
+    """
+
+    def _update() -> bool:
+        with get_connection() as conn, conn.cursor() as cur:
+            try:
+                cur.execute(
+                    queries.SQL_UPDATE_FAQ_ENTRY,
+                    {**entry, "tenant_id": tenant_id, "id": entry_id},
+                )
+            except errors.UniqueViolation as exc:
+                conn.rollback()
+                raise ValueError("Another FAQ entry already has this question.") from exc
+            updated = cur.rowcount == 1
+            conn.commit()
+            return updated
+
+    return await anyio.to_thread.run_sync(_update)
+
+
+async def update_faq_embeddings(tenant_id: int, entries: list[Dict[str, Any]]) -> None:
+    if not entries:
+        return
+
+    def _update() -> None:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.executemany(
+                queries.SQL_UPDATE_FAQ_EMBEDDING,
+                [{**entry, "tenant_id": tenant_id} for entry in entries],
+            )
+            conn.commit()
+
+    await anyio.to_thread.run_sync(_update)
+
+
+async def delete_faq_entries(tenant_id: int, entry_ids: list[int]) -> int:
+    def _delete() -> int:
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(queries.SQL_DELETE_FAQ_ENTRIES, {"tenant_id": tenant_id, "ids": entry_ids})
+            deleted = cur.rowcount
+            conn.commit()
+            return deleted
+
+    return await anyio.to_thread.run_sync(_delete)
@@ -0,0 +1,118 @@
+"""Bulk writes of embedded nodes into the PGVectorStore table.
+
+`PGVectorStore.add` issues one ORM insert per node. During ingestion the
+loader instead buffers rows and, every `VECTOR_LOAD_FLUSH_ROWS`, streams them
+with binary `COPY` into a temp staging table (no WAL, no indexes) and moves
+them into the real table with a single `INSERT ... SELECT`, so index
+maintenance happens once per flush in key order. Rows use the same columns
+and metadata layout as `PGVectorStore`, so retrieval and deletes by node id
+keep working unchanged.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import psycopg
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from psycopg import sql
+from psycopg.types.json import Json
+
+from app.metrics import metrics
+
+from . import queries
+from .connection import resolve_database_dsn
+
+VECTOR_LOAD_FLUSH_ROWS = int(os.getenv("VECTOR_LOAD_FLUSH_ROWS", "5000"))
+VECTOR_LOAD_WORK_MEM = os.getenv("VECTOR_LOAD_WORK_MEM", "64MB")
+_STAGING_TYPES = ["text", "text", "json", "float4[]"]
+
+
+def vector_table_identifier(schema_name: str, table_name: str) -> sql.Identifier:
+    """The table PGVectorStore keeps `table_name` in ("data_<name>", lower-cased)."""
+    return sql.Identifier(schema_name, f"data_{table_name}".lower())
+
+
+class VectorBulkLoader:
+    """Context manager holding one connection for the whole write phase."""
+
+    def __init__(
+        self,
+        schema_name: str,
+        table_name: str,
+        *,
+        flat_metadata: bool = False,
+        flush_rows: int = VECTOR_LOAD_FLUSH_ROWS,
+    ) -> None:
+        self._table = vector_table_identifier(schema_name, table_name)
+        self._flat_metadata = flat_metadata
+        self._flush_rows = max(flush_rows, 1)
+        self._conn: Optional[psycopg.Connection] = None
+        self._buffer: List[tuple] = []
+        self.rows_loaded = 0
+        self.copy_seconds = 0.0
+        self.merge_seconds = 0.0
+
+    def __enter__(self) -> "VectorBulkLoader":
+        self._conn = psycopg.connect(resolve_database_dsn(), autocommit=True)
+        self._conn.execute(queries.SQL_CREATE_VECTOR_STAGING_TABLE)
+        return self
+
+    def __exit__(self, exc_type: Any, *exc_info: Any) -> None:
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self._buffer = []
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _row(self, node: BaseNode) -> tuple:
+        metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=self._flat_metadata)
+        return (
+            node.node_id,
+            node.get_content(metadata_mode=MetadataMode.NONE),
+            Json(metadata),
+            node.get_embedding(),
+        )
+
+    def add(self, nodes: Sequence[BaseNode]) -> List[str]:
+        """Queue embedded nodes; they are written once `flush_rows` are waiting."""
+        self._buffer.extend(self._row(node) for node in nodes)
+        if len(self._buffer) >= self._flush_rows:
+            self.flush()
+        return [node.node_id for node in nodes]
+
+    def flush(self) -> int:
+        rows, self._buffer = self._buffer, []
+        if not rows or self._conn is None:
+            return 0
+        with self._conn.transaction(), self._conn.cursor() as cur:
+            cur.execute(queries.SQL_TUNE_VECTOR_LOAD, {"work_mem": VECTOR_LOAD_WORK_MEM})
+            started = time.perf_counter()
+            with cur.copy(queries.SQL_COPY_VECTOR_STAGING) as copy:
+                copy.set_types(_STAGING_TYPES)
+                for row in rows:
+                    copy.write_row(row)
+            copied = time.perf_counter()
+            cur.execute(sql.SQL(queries.SQL_MERGE_VECTOR_STAGING).format(table=self._table))
+            merged = time.perf_counter()
+        self.copy_seconds += copied - started
+        self.merge_seconds += merged - copied
+        self.rows_loaded += len(rows)
+        metrics.incr("vector_load_rows", len(rows))
+        metrics.observe("vector_load_flush_seconds", merged - started)
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        seconds = self.copy_seconds + self.merge_seconds
+        return {
+            "rows": self.rows_loaded,
+            "copy_seconds": round(self.copy_seconds, 3),
+            "merge_seconds": round(self.merge_seconds, 3),
+            "rows_per_second": round(self.rows_loaded / seconds, 1) if seconds else 0.0,
+        }
@@ -1,14 +1,52 @@
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-from fastapi import FastAPI, File, Request, UploadFile
+from fastapi import FastAPI, File, Form, Query, Request, UploadFile
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 import json
+import time
 
-from .controller import rag_docs, rag_ingest, webhooks
+from .chatwoot.client import close_chatwoot_clients
+from .chatwoot.outbox import chatwoot_outbox
+from .controller import rag_docs, rag_faq, rag_ingest, webhooks
 from .controller import bot as bot_controller
+from .db.connection import close_idle_connections
+from .db.notifications import database_listener
+from .metrics import metrics
+from .rag_engine.embed_scheduler import budget_stats
+from .rag_engine.rag_sessions import conversation_store
 from .web.views import router as web_router
+from .workers.bot_queue import bot_queue
+from .workers.ingest_queue import ingest_queue
+from .workers.n8n_coalescer import n8n_coalescer
+from .workers.n8n_forwarder import n8n_forwarder
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await conversation_store.start()
+    await chatwoot_outbox.start()
+    await n8n_forwarder.start()
+    await bot_queue.start(bot_controller.process_bot_request)
+    await ingest_queue.start()
+    # After the queues, so their channels are subscribed before LISTEN.
+    await database_listener.start()
+    try:
+        yield
+    finally:
+        await database_listener.stop()
+        await ingest_queue.stop()
+        await bot_queue.stop()
+        await chatwoot_outbox.stop()
+        await n8n_coalescer.stop()
+        await n8n_forwarder.stop()
+        await conversation_store.stop()
+        await close_chatwoot_clients()
+        close_idle_connections()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(web_router)
 
@@ -16,9 +54,48 @@ static_dir = Path(__file__).resolve().parent / "static"
 static_dir.mkdir(parents=True, exist_ok=True)
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
+def _record_bot_webhook(rejected: bool, started: float) -> None:
+    metrics.incr("bot_webhooks_total")
+    if rejected:
+        metrics.incr("bot_webhooks_rejected")
+        metrics.observe("bot_webhook_reject_seconds", time.perf_counter() - started)
+    metrics.gauge(
+        "bot_webhook_reject_ratio",
+        round(metrics.counter("bot_webhooks_rejected") / metrics.counter("bot_webhooks_total"), 4),
+    )
+
+
+async def _prefilter_bot_webhook(request: Request, call_next):
+    """Reject Chatwoot noise on /bot with one cheap parse and no payload logging."""
+    started = time.perf_counter()
+    body = await request.body()
+    data, reason = bot_controller.parse_bot_webhook(body)
+    if reason:
+        _record_bot_webhook(True, started)
+        return JSONResponse({"message": reason})
+
+    _record_bot_webhook(False, started)
+    # Parsed once here; the route reuses it instead of calling request.json().
+    request.state.bot_payload = data
+    print(
+        f"\n🟢 [REQ] POST /bot account={data['account']['id']} "
+        f"conversation={data['conversation']['id']} message={data.get('id')}",
+        flush=True,
+    )
+    response = await call_next(request)
+    print(f"🔵 [RES] {response.status_code} /bot", flush=True)
+    return response
+
+
 @app.middleware("http")
 async def log_request_payload(request: Request, call_next):
+    if request.method == "POST" and request.url.path == "/bot":
+        return await _prefilter_bot_webhook(request, call_next)
     try:
+        # Skip static and health
+        if request.url.path.startswith("/static") or request.url.path in ("/health", "/metrics"):
+            return await call_next(request)
+
         # 🚀 Incoming request
         print(f"\n🟢 [REQ] {request.method} {request.url.path} qs={dict(request.query_params)}", flush=True)
 
@@ -26,10 +103,6 @@ async def log_request_payload(request: Request, call_next):
         body = await request.body()
         ctype = request.headers.get("content-type", "")
 
-        # Skip static and health
-        if request.url.path.startswith("/static") or request.url.path == "/health":
-            return await call_next(request)
-
         if ctype.startswith("multipart/"):
             print("📂 [BODY] multipart/form-data omitted", flush=True)
         else:
@@ -67,6 +140,17 @@ async def health():
     return {"message": "Status OK"}
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    snapshot = metrics.snapshot()
+    snapshot["sessions"] = conversation_store.stats()
+    snapshot["bot_workers"] = bot_queue.stats()
+    snapshot["ingest_workers"] = ingest_queue.stats()
+    snapshot["embedding_budgets"] = budget_stats()
+    snapshot["n8n_coalescer"] = n8n_coalescer.stats()
+    return snapshot
+
+
 @app.post("/rag/docs/{folder_name}")
 async def upload_documents(folder_name: str, files: list[UploadFile] = File(...)):
     return await rag_docs.upload_documents(folder_name, files)
@@ -87,24 +171,61 @@ async def delete_folder(folder_name: str):
     return rag_docs.delete_folder(folder_name)
 
 
-@app.post("/rag/ingest")
+@app.get("/rag/faq/{tenant_id}")
+async def list_faq(tenant_id: int):
+    return await rag_faq.list_faq(tenant_id)
+
+
+@app.post("/rag/faq/{tenant_id}")
+async def create_faq_entry(tenant_id: int, payload: rag_faq.FaqEntry):
+    return await rag_faq.save_faq_entry(tenant_id, payload)
+
+
+@app.put("/rag/faq/{tenant_id}/{entry_id}")
+async def update_faq_entry(tenant_id: int, entry_id: int, payload: rag_faq.FaqEntry):
+    return await rag_faq.save_faq_entry(tenant_id, payload, entry_id)
+
+
+@app.post("/rag/faq/{tenant_id}/import")
+async def import_faq(tenant_id: int, file: UploadFile = File(...), replace: bool = Form(False)):
+    return await rag_faq.import_faq_csv(tenant_id, await file.read(), replace=replace)
+
+
+@app.delete("/rag/faq/{tenant_id}")
+async def delete_faq_entries(tenant_id: int, ids: list[int] = Query(...)):
+    return await rag_faq.delete_faq(tenant_id, ids)
+
+
+@app.post("/rag/ingest", status_code=202)
 async def trigger_ingest(payload: rag_ingest.IngestRequest):
     return await rag_ingest.trigger_ingest(payload)
 
 
+@app.get("/rag/ingest/jobs/{job_id}")
+async def ingest_job_status(job_id: int):
+    return await rag_ingest.ingest_job_status(job_id)
+
+
+@app.post("/rag/ingest/jobs/{job_id}/cancel")
+async def cancel_ingest_job(job_id: int):
+    return await rag_ingest.cancel_ingest(job_id)
+
+
 @app.post("/chatwoot/webhook")
 async def webhook(request: Request):
     payload = await request.json()
-    return webhooks.process_chatwoot_webhook(payload)
+    return await webhooks.process_chatwoot_webhook(payload)
 
 
 @app.post("/twenty/webhook")
 async def twenty_webhook(request: Request):
     payload = await request.json()
-    return webhooks.process_twenty_webhook(payload)
+    return await webhooks.process_twenty_webhook(payload)
 
 
 @app.post("/bot")
 async def bot_endpoint(request: Request):
-    data = await request.json()
-    return await bot_controller.process_bot_request(data)
+    data = getattr(request.state, "bot_payload", None)
+    if data is None:
+        data = await request.json()
+    return await bot_controller.accept_bot_request(data)
@@ -0,0 +1,98 @@
+"""In-process counters and latency timings exposed on `/metrics`.
+
+Metrics are per worker process and reset on restart; they are meant for
+quick operational checks, not long-term storage.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator
+
+# Recent samples kept per timing to estimate percentiles.
+_SAMPLE_WINDOW = 512
+
+
+def _metric_name(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    suffix = ",".join(f"{key}={labels[key]}" for key in sorted(labels))
+    return f"{name}{{{suffix}}}"
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    index = min(len(ordered) - 1, max(math.ceil(fraction * len(ordered)) - 1, 0))
+    return ordered[index]
+
+
+@dataclass(slots=True)
+class _Timing:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    samples: Deque[float] = field(default_factory=lambda: deque(maxlen=_SAMPLE_WINDOW))
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def snapshot(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(_percentile(ordered, 0.5) * 1000, 2) if ordered else 0.0,
+            "p95_ms": round(_percentile(ordered, 0.95) * 1000, 2) if ordered else 0.0,
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, _Timing] = {}
+        self._started = time.time()
+
+    def incr(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = _metric_name(name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name: str, **labels: Any) -> float:
+        return self._counters.get(_metric_name(name, labels), 0)
+
+    def gauge(self, name: str, value: float, **labels: Any) -> None:
+        self._gauges[_metric_name(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        key = _metric_name(name, labels)
+        timing = self._timings.get(key)
+        if timing is None:
+            timing = self._timings[key] = _Timing()
+        timing.add(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Record the duration of the block, including when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "uptime_seconds": round(time.time() - self._started, 1),
+            "counters": dict(sorted(self._counters.items())),
+            "gauges": dict(sorted(self._gauges.items())),
+            "timings": {key: timing.snapshot() for key, timing in sorted(self._timings.items())},
+        }
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,132 @@
+"""Embedding wrapper that consults the shared embedding cache first.
+
+Every batch is looked up with a single `ANY(...)` query; only the misses are
+sent to the provider, and their vectors are written back. Query embeddings
+are keyed separately from document embeddings because some providers embed
+them differently. Cache errors never fail an embedding call: the batch falls
+back to the provider.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Any, Dict, List, Sequence
+
+import anyio
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+
+from app.db.embedding_cache import embedding_cache_store
+from app.metrics import metrics
+
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() not in {"0", "false", "no"}
+
+_TEXT = "text"
+_QUERY = "query"
+
+
+def text_hash(text: str, kind: str = _TEXT) -> bytes:
+    return hashlib.sha256(f"{kind}\0{text}".encode("utf-8")).digest()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Serve embeddings from the cache table; only misses reach the wrapped model."""
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _dimensions: int = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, *, dimensions: int = 0, **kwargs: Any) -> None:
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs,
+        )
+        self._inner = inner
+        self._dimensions = dimensions or int(getattr(inner, "dimensions", None) or 0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    def _lookup(self, hashes: List[bytes]) -> Dict[bytes, Embedding]:
+        try:
+            return embedding_cache_store.lookup(self.model_name, self._dimensions, hashes)
+        except Exception as exc:
+            print(f"⚠️ Embedding cache lookup failed: {exc}")
+            metrics.incr("embedding_cache_errors", op="lookup")
+            return {}
+
+    def _store(self, vectors: Dict[bytes, Embedding]) -> None:
+        try:
+            embedding_cache_store.store(self.model_name, self._dimensions, vectors.items())
+        except Exception as exc:
+            print(f"⚠️ Embedding cache write failed: {exc}")
+            metrics.incr("embedding_cache_errors", op="store")
+
+    def _split(self, texts: Sequence[str], hashes: Sequence[bytes], kind: str, cached: Dict[bytes, Embedding]) -> Dict[bytes, str]:
+        """Unique texts of the batch that still need the provider, by hash."""
+        missing = {key: text for key, text in zip(hashes, texts) if key not in cached}
+        metrics.incr("embedding_cache_hits", len(texts) - len(missing), kind=kind)
+        metrics.incr("embedding_cache_misses", len(missing), kind=kind)
+        return missing
+
+    def _embed_sync(self, texts: List[str], kind: str) -> List[Embedding]:
+        hashes = [text_hash(text, kind) for text in texts]
+        cached = self._lookup(list(set(hashes)))
+        missing = self._split(texts, hashes, kind, cached)
+        if missing:
+            keys = list(missing)
+            if kind == _QUERY:
+                fresh = [self._inner._get_query_embedding(missing[key]) for key in keys]
+            else:
+                fresh = self._inner._get_text_embeddings([missing[key] for key in keys])
+            computed = dict(zip(keys, fresh))
+            self._store(computed)
+            cached.update(computed)
+        return [cached[key] for key in hashes]
+
+    async def _embed_async(self, texts: List[str], kind: str) -> List[Embedding]:
+        hashes = [text_hash(text, kind) for text in texts]
+        cached = await anyio.to_thread.run_sync(self._lookup, list(set(hashes)))
+        missing = self._split(texts, hashes, kind, cached)
+        if missing:
+            keys = list(missing)
+            if kind == _QUERY:
+                fresh = [await self._inner._aget_query_embedding(missing[key]) for key in keys]
+            else:
+                fresh = await self._inner._aget_text_embeddings([missing[key] for key in keys])
+            computed = dict(zip(keys, fresh))
+            await anyio.to_thread.run_sync(self._store, computed)
+            cached.update(computed)
+        return [cached[key] for key in hashes]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed_sync([query], _QUERY)[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return (await self._embed_async([query], _QUERY))[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed_sync([text], _TEXT)[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._embed_async([text], _TEXT))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed_sync(texts, _TEXT)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self._embed_async(texts, _TEXT)
+
+
+def with_embedding_cache(embedder: BaseEmbedding, dimensions: int = 0) -> BaseEmbedding:
+    """Wrap an embedder with the shared cache unless `EMBED_CACHE_ENABLED` is off."""
+    if not EMBED_CACHE_ENABLED or isinstance(embedder, CachedEmbedding):
+        return embedder
+    return CachedEmbedding(embedder, dimensions=dimensions)
+
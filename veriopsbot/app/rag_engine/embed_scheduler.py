@@ -0,0 +1,227 @@
+"""Concurrent, rate-limit-aware embedding for ingestion.
+
+`EmbeddingScheduler` sends several batches to the embedding API at once and
+yields them back in order. How many requests may be in flight is decided by
+an `EmbeddingBudget` shared by every ingest job using the same provider,
+model and API key: the window grows by one request per round of successful
+calls and halves on a 429, and a `Retry-After` pauses everyone on that budget
+(AIMD, as in TCP congestion control). Requests that hit a rate limit or a
+transient error are retried here, so the provider clients are built with
+their own retries turned off.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional
+
+import httpx
+import openai
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from app.metrics import metrics
+
+# Requests one ingest job keeps in flight at most.
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+# Ceiling of a shared budget, i.e. across all jobs on one API key and model.
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "16"))
+INGEST_EMBED_MAX_RETRIES = int(os.getenv("INGEST_EMBED_MAX_RETRIES", "8"))
+_DEFAULT_RETRY_SECONDS = 1.0
+_MAX_RETRY_SECONDS = 60.0
+
+
+def rate_limit_delay(exc: BaseException) -> Optional[float]:
+    """Seconds to back off if `exc` is an HTTP 429 (honouring Retry-After), else None."""
+    response = getattr(exc, "response", None)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None) or getattr(exc, "code", None)
+    if status != 429:
+        return None
+    headers = getattr(response, "headers", None) or {}
+    retry_ms = headers.get("retry-after-ms")
+    retry_after = headers.get("retry-after")
+    try:
+        if retry_ms:
+            return min(float(retry_ms) / 1000, _MAX_RETRY_SECONDS)
+        if retry_after:
+            return min(float(retry_after), _MAX_RETRY_SECONDS)
+    except ValueError:
+        try:
+            return min(max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0), _MAX_RETRY_SECONDS)
+        except (TypeError, ValueError):
+            pass
+    return _DEFAULT_RETRY_SECONDS
+
+
+def _is_transient(exc: BaseException) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return True
+    return isinstance(exc, (openai.APIConnectionError, httpx.TransportError, ConnectionError, TimeoutError))
+
+
+class EmbeddingBudget:
+    """AIMD window of concurrent embedding requests, shared between threads."""
+
+    def __init__(self, name: str, *, ceiling: int = EMBED_MAX_CONCURRENCY, initial: int = INGEST_EMBED_CONCURRENCY) -> None:
+        self.name = name
+        self._ceiling = max(ceiling, 1)
+        self._limit = float(min(max(initial, 1), self._ceiling))
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self) -> float:
+        """Wait for a slot; returns a ticket to hand back to `release`."""
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self._in_flight >= int(self._limit):
+                    self._cond.wait()
+                else:
+                    self._in_flight += 1
+                    return time.monotonic()
+
+    def release(self, ticket: float, *, ok: bool = True, retry_after: Optional[float] = None) -> None:
+        """Return a slot; `retry_after` (seconds) reports that the request was rate limited."""
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if retry_after is None:
+                if ok:
+                    # Additive increase: about one more slot per window of successes.
+                    self._limit = min(self._limit + 1 / self._limit, float(self._ceiling))
+            else:
+                # Halve once per congestion event, not once per request that
+                # was already in flight when it started.
+                if ticket >= self._last_decrease:
+                    self._limit = max(self._limit / 2, 1.0)
+                    self._last_decrease = now
+                self._paused_until = max(self._paused_until, now + retry_after)
+            metrics.gauge("embed_concurrency_limit", self.limit, budget=self.name)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "paused_seconds": round(max(self._paused_until - time.monotonic(), 0.0), 2),
+        }
+
+
+_budgets: Dict[str, EmbeddingBudget] = {}
+_budgets_lock = threading.Lock()
+
+
+def embedding_budget(provider: str, model: str, api_key: str) -> EmbeddingBudget:
+    """The budget shared by every job embedding with this provider, model and key."""
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    key = f"{provider}:{model}:{key_hash}"
+    with _budgets_lock:
+        budget = _budgets.get(key)
+        if budget is None:
+            budget = _budgets[key] = EmbeddingBudget(f"{provider}:{model}")
+        return budget
+
+
+def budget_stats() -> Dict[str, Dict[str, Any]]:
+    with _budgets_lock:
+        return {budget.name: budget.stats() for budget in _budgets.values()}
+
+
+_total_slots: Optional[threading.BoundedSemaphore] = None
+
+
+def limit_total_concurrency(limit: Optional[int]) -> None:
+    """Cap requests in flight across every budget of the process (None removes the cap)."""
+    global _total_slots
+    _total_slots = threading.BoundedSemaphore(max(limit, 1)) if limit else None
+
+
+class EmbeddingScheduler:
+    """Embed node batches concurrently within a shared budget, in order."""
+
+    def __init__(
+        self,
+        embedder: BaseEmbedding,
+        budget: EmbeddingBudget,
+        *,
+        concurrency: int = INGEST_EMBED_CONCURRENCY,
+        max_retries: int = INGEST_EMBED_MAX_RETRIES,
+    ) -> None:
+        self._embedder = embedder
+        self._budget = budget
+        self._concurrency = max(concurrency, 1)
+        self._max_retries = max(max_retries, 0)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            ticket = self._budget.acquire()
+            slots = _total_slots
+            if slots is not None:
+                slots.acquire()
+            try:
+                try:
+                    vectors = self._embedder._get_text_embeddings(texts)
+                finally:
+                    if slots is not None:
+                        slots.release()
+            except Exception as exc:
+                delay = rate_limit_delay(exc)
+                if delay is not None:
+                    metrics.incr("embed_rate_limited", budget=self._budget.name)
+                    self._budget.release(ticket, retry_after=delay)
+                else:
+                    self._budget.release(ticket, ok=False)
+                    if not _is_transient(exc):
+                        raise
+                attempt += 1
+                if attempt > self._max_retries:
+                    raise
+                if delay is None:
+                    time.sleep(min(_DEFAULT_RETRY_SECONDS * 2 ** (attempt - 1), _MAX_RETRY_SECONDS) * random.uniform(0.5, 1.0))
+                metrics.incr("embed_retries", budget=self._budget.name)
+                continue
+            self._budget.release(ticket)
+            metrics.incr("embed_requests", budget=self._budget.name)
+            return vectors
+
+    def _embed_nodes(self, batch: List[BaseNode]) -> List[BaseNode]:
+        vectors = self._embed([node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch])
+        for node, vector in zip(batch, vectors):
+            node.embedding = vector
+        return batch
+
+    def embed(self, batches: Iterable[List[BaseNode]]) -> Iterator[List[BaseNode]]:
+        """Set each node's embedding; batches come back in the order they went in."""
+        pending: Deque[Future] = deque()
+        source = iter(batches)
+        executor = ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix="embed")
+        try:
+            while True:
+                while len(pending) < self._concurrency * 2:
+                    batch = next(source, None)
+                    if batch is None:
+                        break
+                    pending.append(executor.submit(self._embed_nodes, batch))
+                if not pending:
+                    return
+                yield pending.popleft().result()
+        finally:
+            # Requests already sent finish in the background; queued ones are dropped.
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -4,9 +4,10 @@ from __future__ import annotations
 
 import json
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 
 from llama_index.core import Settings, StorageContext, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.postprocessor.llm_rerank import LLMRerank
 from llama_index.core.query_engine.retriever_query_engine import RetrieverQueryEngine
 from llama_index.core.response_synthesizers import get_response_synthesizer
@@ -14,11 +15,15 @@ from llama_index.core.retrievers.fusion_retriever import QueryFusionRetriever
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.llms.openai import OpenAI
 from llama_index.vector_stores.postgres import PGVectorStore
+from sqlalchemy import func
 
 from app.db.connection import resolve_sqlalchemy_urls
-from app.db.repository import get_params_by_omnichannel_id
+from app.db.repository import get_active_corpus_version, get_params_by_omnichannel_id
 
-from .ingest import EMBED_DIMENSIONS, SHARED_VECTOR_TABLE
+from .embed_cache import with_embedding_cache
+from .ingest import CORPUS_VERSION_KEY, EMBED_DIMENSIONS, SHARED_VECTOR_TABLE
+from .rag_diversity import DEFAULT_DIVERSITY_CUTOFF, DEFAULT_MMR_LAMBDA, CandidateVectorStore, DiversityFilter
+from .rag_prompt import llm_model_name
 
 DEFAULT_MODEL_ANSWER = "gpt-4o-mini"
 DEFAULT_EMBED_MODEL = "text-embedding-3-small"
@@ -65,7 +70,7 @@ async def load_runtime_config(account_id: int) -> Dict[str, Any]:
     return config
 
 
-def configure_llm_from_config(config: Dict[str, Any]) -> Dict[str, Any]:
+def _resolve_openai_settings(config: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
     llm_params = _parse_params(config.get("llm_params"))
     provider = (config.get("llm_name") or llm_params.get("provider") or "openai").lower()
     api_key = config.get("llm_api_key") or llm_params.get("api_key") or os.getenv("OPENAI_API_KEY")
@@ -73,17 +78,43 @@ def configure_llm_from_config(config: Dict[str, Any]) -> Dict[str, Any]:
         raise RuntimeError(f"Provider '{provider}' is not supported for retrieval yet.")
     if not api_key:
         raise RuntimeError("Missing OpenAI API key in tenant configuration.")
+    return llm_params, api_key
+
 
+def _openai_llm(api_key: str, llm_params: Dict[str, Any]) -> OpenAI:
     model_answer = llm_params.get("model_answer") or DEFAULT_MODEL_ANSWER
     temperature = _coerce_float(llm_params.get("temperature"), DEFAULT_TEMPERATURE)
+    return OpenAI(api_key=api_key, model=model_answer, temperature=temperature)
+
+
+def build_llm_from_config(config: Dict[str, Any]) -> Tuple[OpenAI, Dict[str, Any]]:
+    """Build the tenant's chat LLM without touching the global `Settings`."""
+    llm_params, api_key = _resolve_openai_settings(config)
+    return _openai_llm(api_key, llm_params), llm_params
+
+
+def _openai_embedding(api_key: str, llm_params: Dict[str, Any]) -> BaseEmbedding:
     embed_model = (
         llm_params.get("openai_embed_model")
         or llm_params.get("embed_model")
         or DEFAULT_EMBED_MODEL
     )
+    return with_embedding_cache(
+        OpenAIEmbedding(api_key=api_key, model=embed_model),
+        EMBED_DIMENSIONS.get(embed_model, 0),
+    )
+
+
+def build_embed_model_from_config(config: Dict[str, Any]) -> BaseEmbedding:
+    """Build the tenant's query embedder without touching the global `Settings`."""
+    llm_params, api_key = _resolve_openai_settings(config)
+    return _openai_embedding(api_key, llm_params)
 
-    Settings.llm = OpenAI(api_key=api_key, model=model_answer, temperature=temperature)
-    Settings.embed_model = OpenAIEmbedding(api_key=api_key, model=embed_model)
+
+def configure_llm_from_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    llm_params, api_key = _resolve_openai_settings(config)
+    Settings.llm = _openai_llm(api_key, llm_params)
+    Settings.embed_model = _openai_embedding(api_key, llm_params)
     return llm_params
 
 
@@ -93,9 +124,15 @@ def _resolve_embed_dim(embed_model: str) -> int:
     return EMBED_DIMENSIONS.get(DEFAULT_EMBED_MODEL, 1536)
 
 
-def _tenant_query_customizer(tenant_id: int):
+def _tenant_query_customizer(tenant_id: int, corpus_version: int = 0):
     def _customize(stmt, table, **kwargs):
-        return stmt.where(table.metadata_["tenant_id"].astext == str(tenant_id))
+        stmt = stmt.where(table.metadata_["tenant_id"].astext == str(tenant_id))
+        # Rows of a rebuild in progress or of a retired version stay hidden.
+        # Version 0 is the rows written before versions existed, which carry
+        # no version key.
+        return stmt.where(
+            func.coalesce(table.metadata_[CORPUS_VERSION_KEY].astext, "0") == str(corpus_version)
+        )
 
     return _customize
 
@@ -104,19 +141,20 @@ def _vector_store_from_config(
     tenant_id: int,
     llm_params: Dict[str, Any],
     embed_model: str,
+    corpus_version: int = 0,
 ) -> PGVectorStore:
     table_name = SHARED_VECTOR_TABLE
     schema_name = llm_params.get("rag_schema_name") or "public"
     embed_dim = _resolve_embed_dim(embed_model)
     sync_url, async_url = resolve_sqlalchemy_urls()
-    return PGVectorStore.from_params(
+    return CandidateVectorStore.from_params(
         connection_string=sync_url,
         async_connection_string=async_url,
         table_name=table_name,
         schema_name=schema_name,
         embed_dim=embed_dim,
         indexed_metadata_keys={("tenant_id", "text")},
-        customize_query_fn=_tenant_query_customizer(tenant_id),
+        customize_query_fn=_tenant_query_customizer(tenant_id, corpus_version),
     )
 
 
@@ -136,7 +174,8 @@ async def get_query_engine(
         or DEFAULT_EMBED_MODEL
     )
 
-    vector_store = _vector_store_from_config(tenant_id, runtime_llm_params, embed_model)
+    corpus_version = await get_active_corpus_version(tenant_id)
+    vector_store = _vector_store_from_config(tenant_id, runtime_llm_params, embed_model, corpus_version)
     storage_context = StorageContext.from_defaults(vector_store=vector_store)
     index = VectorStoreIndex.from_vector_store(
         vector_store=vector_store,
@@ -168,7 +207,19 @@ async def get_query_engine(
         verbose=False,
     )
 
-    reranker = LLMRerank(llm=Settings.llm, top_n=rerank_top_n)
+    postprocessors = []
+    # Near-identical candidates are dropped before they cost rerank tokens;
+    # a cutoff of 1 or more turns this off.
+    diversity_cutoff = _coerce_float(runtime_llm_params.get("diversity_cutoff"), DEFAULT_DIVERSITY_CUTOFF)
+    if diversity_cutoff < 1:
+        postprocessors.append(
+            DiversityFilter(
+                similarity_cutoff=diversity_cutoff,
+                mmr_lambda=_coerce_float(runtime_llm_params.get("mmr_lambda"), DEFAULT_MMR_LAMBDA),
+                model=llm_model_name(Settings.llm),
+            )
+        )
+    postprocessors.append(LLMRerank(llm=Settings.llm, top_n=rerank_top_n))
     response_synthesizer = get_response_synthesizer(
         llm=Settings.llm,
         response_mode="compact",
@@ -176,6 +227,6 @@ async def get_query_engine(
 
     return RetrieverQueryEngine(
         retriever=fusion_retriever,
-        node_postprocessors=[reranker],
+        node_postprocessors=postprocessors,
         response_synthesizer=response_synthesizer,
     )
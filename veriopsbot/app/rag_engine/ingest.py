@@ -2,18 +2,20 @@
 
 from __future__ import annotations
 
+import argparse
+import contextlib
+import hashlib
 import json
-from dataclasses import dataclass
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from functools import partial
 from pathlib import Path
-from typing import Dict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence
 
 import anyio
-from llama_index.core import SimpleDirectoryReader, StorageContext, VectorStoreIndex
-from llama_index.core.vector_stores.types import (
-    FilterOperator,
-    MetadataFilter,
-    MetadataFilters,
-)
+from llama_index.core.schema import BaseNode, MetadataMode
 from llama_index.vector_stores.postgres import PGVectorStore
 
 try:
@@ -29,14 +31,49 @@ except ImportError:  # pragma: no cover - optional dependency
     GeminiEmbedding = None  # type: ignore
 
 from app.db.connection import resolve_sqlalchemy_urls
-from app.db.repository import get_params_by_tenant_id
-from app.controller.rag_docs import STORAGE_ROOT
+from app.db.repository import (
+    activate_corpus_version,
+    begin_corpus_version,
+    ensure_corpus_versions_table,
+    ensure_ingest_manifest_table,
+    get_active_corpus_version,
+    get_ingest_manifest,
+    get_params_by_tenant_id,
+    retire_corpus_version,
+    save_ingest_manifest,
+    set_duplicate_sources,
+    tenant_ingest_lock,
+)
+from app.db.vector_loader import VectorBulkLoader
+from app.metrics import metrics
+
+from .embed_cache import with_embedding_cache
+from .embed_scheduler import (
+    EMBED_MAX_CONCURRENCY,
+    EmbeddingScheduler,
+    embedding_budget,
+    limit_total_concurrency,
+)
+from .ingest_dedup import (
+    INGEST_DEDUP,
+    ChunkIndex,
+    ChunkSignature,
+    chunk_signature,
+    pack_signatures,
+    unpack_signatures,
+)
+from .ingest_parse import FileParser, ParseTask
+from .ingest_pipeline import Stage, StageStats, run_pipeline
 
 
 class IngestError(RuntimeError):
     """Raised when ingestion preconditions are not met."""
 
 
+class IngestCancelled(IngestError):
+    """Raised by a progress callback to stop an ingest that was cancelled."""
+
+
 EMBED_DIMENSIONS: Dict[str, int] = {
     "text-embedding-3-small": 1536,
     "text-embedding-3-large": 3072,
@@ -50,6 +87,22 @@ DEFAULT_EMBED_MODELS: Dict[str, str] = {
 }
 
 SHARED_VECTOR_TABLE = "rag_vectors"
+DEFAULT_ANSWER_MODEL = "gpt-4o-mini"
+# Node metadata key holding the file name a chunk came from.
+SOURCE_PATH_KEY = "source_path"
+# Node metadata key holding the corpus version a chunk belongs to.
+CORPUS_VERSION_KEY = "corpus_version"
+# Node metadata key listing the other files a deduplicated chunk was found in.
+DUPLICATE_SOURCES_KEY = "duplicate_sources"
+_HASH_CHUNK_BYTES = 1 << 20
+# Chunks per embedding request and per vector store write.
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "128"))
+# Files waiting for a parser and embedded batches waiting to be written.
+INGEST_PARSE_QUEUE_SIZE = int(os.getenv("INGEST_PARSE_QUEUE_SIZE", "2"))
+INGEST_WRITE_QUEUE_SIZE = int(os.getenv("INGEST_WRITE_QUEUE_SIZE", "2"))
+# COPY rows into the vector table instead of PGVectorStore's per-node inserts.
+INGEST_BULK_LOAD = os.getenv("INGEST_BULK_LOAD", "true").lower() not in {"0", "false", "no"}
+_manifest_table_ready = False
 
 
 @dataclass(frozen=True)
@@ -61,18 +114,63 @@ class IngestConfig:
     embed_model: str
     table_name: str
     schema_name: str
-
-
-def _tenant_metadata_filter(tenant_id: int) -> MetadataFilters:
-    return MetadataFilters(
-        filters=[
-            MetadataFilter(
-                key="tenant_id",
-                value=str(tenant_id),
-                operator=FilterOperator.EQ,
-            )
-        ]
-    )
+    answer_model: str = DEFAULT_ANSWER_MODEL
+
+
+@dataclass
+class IngestReport:
+    """What an incremental ingest changed, by file name."""
+
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    # File name -> why it could not be parsed; those files keep their old vectors.
+    failed: Dict[str, str] = field(default_factory=dict)
+    nodes_added: int = 0
+    nodes_removed: int = 0
+    stages: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    load: Dict[str, Any] = field(default_factory=dict)
+    corpus_version: int = 0
+    rebuild: bool = False
+    dedup: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def embedded(self) -> int:
+        return len(self.added) + len(self.updated)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "added": self.added,
+            "updated": self.updated,
+            "removed": self.removed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "nodes_added": self.nodes_added,
+            "nodes_removed": self.nodes_removed,
+            "stages": self.stages,
+            "load": self.load,
+            "corpus_version": self.corpus_version,
+            "rebuild": self.rebuild,
+            "dedup": self.dedup,
+        }
+
+
+@dataclass
+class IngestProgress:
+    files_total: int = 0
+    files_parsed: int = 0
+    files_failed: int = 0
+    chunks_total: int = 0
+    chunks_duplicate: int = 0
+    chunks_embedded: int = 0
+    rows_written: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+ProgressCallback = Callable[[Dict[str, int]], None]
 
 
 def _parse_params(raw: object) -> Dict[str, object]:
@@ -89,25 +187,37 @@ def _parse_params(raw: object) -> Dict[str, object]:
     return {}
 
 
+def _storage_root() -> Path:
+    # Imported late: the controller package imports this module.
+    from app.controller.rag_docs import STORAGE_ROOT
+
+    return STORAGE_ROOT
+
+
 def _docs_directory(folder_name: str) -> Path:
-    folder = STORAGE_ROOT / Path(folder_name).name
+    storage_root = _storage_root()
+    folder = storage_root / Path(folder_name).name
     if not folder.exists() or not folder.is_dir():
-        raise IngestError(f"Folder '{folder_name}' was not found under {STORAGE_ROOT}.")
+        raise IngestError(f"Folder '{folder_name}' was not found under {storage_root}.")
     return folder
 
 
 def _select_embedder(config: IngestConfig):
     provider = config.provider.lower()
 
+    dimensions = EMBED_DIMENSIONS.get(config.embed_model, 0)
     if provider == "openai":
-        return OpenAIEmbedding(api_key=config.api_key, model=config.embed_model), config.embed_model
+        # Rate limits and retries are handled by the embedding scheduler.
+        embedder = OpenAIEmbedding(api_key=config.api_key, model=config.embed_model, max_retries=0)
+        return with_embedding_cache(embedder, dimensions), config.embed_model
 
     if provider == "gemini":
         if GeminiEmbedding is None:
             raise IngestError(
                 "Gemini provider requested but llama-index Gemini integration is not installed."
             )
-        return GeminiEmbedding(api_key=config.api_key, model_name=config.embed_model), config.embed_model
+        embedder = GeminiEmbedding(api_key=config.api_key, model_name=config.embed_model)
+        return with_embedding_cache(embedder, dimensions), config.embed_model
 
     raise IngestError(f"Embedding provider '{config.provider}' is not supported yet.")
 
@@ -119,50 +229,425 @@ def _embed_dimensions(model_name: str, embedder) -> int:
     return len(sample)
 
 
-def _ingest_sync(config: IngestConfig) -> int:
-    docs_dir = _docs_directory(config.folder_name)
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(_HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    embedder, embed_model = _select_embedder(config)
-    embed_dim = _embed_dimensions(embed_model, embedder)
 
-    documents = SimpleDirectoryReader(str(docs_dir)).load_data()
-    if not documents:
-        raise IngestError(f"No documents found in folder '{config.folder_name}'.")
-    tenant_metadata = _tenant_metadata_filter(config.tenant_id)
-    for doc in documents:
-        metadata = dict(doc.metadata or {})
-        metadata["tenant_id"] = str(config.tenant_id)
-        metadata["folder_name"] = config.folder_name
-        doc.metadata = metadata
+def _scan_folder(docs_dir: Path) -> Dict[str, Path]:
+    # Same selection as SimpleDirectoryReader: top-level, non-hidden files.
+    return {
+        path.name: path
+        for path in sorted(docs_dir.iterdir())
+        if path.is_file() and not path.name.startswith(".")
+    }
+
 
+def _vector_store(table_name: str, schema_name: str, embed_dim: int) -> PGVectorStore:
     sync_url, async_url = resolve_sqlalchemy_urls()
-    vector_store = PGVectorStore.from_params(
+    return PGVectorStore.from_params(
         connection_string=sync_url,
         async_connection_string=async_url,
-        table_name=config.table_name,
-        schema_name=config.schema_name,
+        table_name=table_name,
+        schema_name=schema_name,
         embed_dim=embed_dim,
         indexed_metadata_keys={("tenant_id", "text")},
     )
-    vector_store.delete_nodes(filters=tenant_metadata)
 
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    VectorStoreIndex.from_documents(
-        documents,
-        storage_context=storage_context,
-        embed_model=embedder,
-    )
 
-    return len(documents)
+def _plan_files(
+    config: IngestConfig,
+    files: Dict[str, Path],
+    manifest: Dict[str, Dict[str, Any]],
+    report: IngestReport,
+) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split the folder into files to embed and unchanged files whose stat changed."""
+    changed: List[Dict[str, Any]] = []
+    touched: List[Dict[str, Any]] = []
+    for name, path in files.items():
+        stat = path.stat()
+        previous = manifest.get(name)
+        entry: Dict[str, Any] = {
+            "path": name,
+            "folder_name": config.folder_name,
+            "size_bytes": stat.st_size,
+            "mtime": stat.st_mtime,
+            "embed_model": config.embed_model,
+            "chunk_signatures": b"",
+            "duplicate_of": [],
+        }
+        same_model = bool(previous) and previous["embed_model"] == config.embed_model
+        if same_model and previous["size_bytes"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+            report.skipped.append(name)
+            continue
+        entry["content_hash"] = _file_hash(path)
+        if same_model and previous["content_hash"] == entry["content_hash"]:
+            # Re-uploaded or touched without edits: keep the existing vectors.
+            touched.append(
+                {
+                    **entry,
+                    "node_ids": list(previous["node_ids"]),
+                    "chunk_signatures": previous["chunk_signatures"],
+                    "duplicate_of": list(previous["duplicate_of"]),
+                }
+            )
+            report.skipped.append(name)
+            continue
+        (report.updated if previous else report.added).append(name)
+        changed.append(entry)
+    return changed, touched
+
+
+def _embed_files(
+    config: IngestConfig,
+    docs_dir: Path,
+    changed: List[Dict[str, Any]],
+    vector_store: PGVectorStore,
+    embedder,
+    progress: IngestProgress,
+    notify: Callable[[], None],
+    version: int = 0,
+    index: ChunkIndex | None = None,
+) -> tuple[List[StageStats], Dict[str, Any], Dict[str, int]]:
+    """Stream the changed files through parse, dedup, embed and write stages.
+
+    Files are parsed and chunked in the `FileParser` process pool. Each
+    file's new node ids are recorded on its entry, or `error` if it could not
+    be parsed. With an `index`, chunks that duplicate one already in it are
+    dropped before embedding and the canonical node id is recorded in the
+    entry's `duplicate_of`; counts are returned with the stage stats.
+    `notify` runs on this thread while the stages work and may raise
+    `IngestCancelled`; rows written by this call are then deleted again.
+    Rows go through `VectorBulkLoader` unless `INGEST_BULK_LOAD` is off; its
+    stats are returned with the stage stats.
+    """
+    written: List[str] = []
+    load: Dict[str, Any] = {}
+    dedup_counts = {"chunks": 0, "exact": 0, "near": 0}
+
+    def discover() -> Iterator[ParseTask]:
+        for entry in changed:
+            metadata = {
+                "tenant_id": str(config.tenant_id),
+                "folder_name": config.folder_name,
+                SOURCE_PATH_KEY: entry["path"],
+            }
+            yield ParseTask(str(docs_dir / entry["path"]), metadata, key=entry)
+
+    def parse(tasks: Iterator[ParseTask]) -> Iterator[BaseNode]:
+        for result in parser.parse(tasks):
+            entry = result.task.key
+            if result.error is not None:
+                entry["error"] = result.error
+                progress.files_failed += 1
+                print(f"⚠️ Skipping {entry['path']}: {result.error}")
+                continue
+            for node in result.nodes:
+                _tag_corpus_version(node, version)
+            entry["node_ids"] = [node.node_id for node in result.nodes]
+            progress.files_parsed += 1
+            progress.chunks_total += len(result.nodes)
+            yield from result.nodes
+
+    def dedup(nodes: Iterator[BaseNode]) -> Iterator[BaseNode]:
+        entries = {entry["path"]: entry for entry in changed}
+        signatures: Dict[str, ChunkSignature] = {}
+        for node in nodes:
+            entry = entries[node.metadata[SOURCE_PATH_KEY]]
+            signature = chunk_signature(node.get_content(metadata_mode=MetadataMode.NONE))
+            canonical, kind = index.find(signature)
+            dedup_counts["chunks"] += 1
+            if canonical is None:
+                index.add(node.node_id, signature)
+                signatures[node.node_id] = signature
+                yield node
+                continue
+            dedup_counts[kind] += 1
+            progress.chunks_duplicate += 1
+            if canonical not in entry["duplicate_of"]:
+                entry["duplicate_of"].append(canonical)
+        for entry in entries.values():
+            if "error" not in entry:
+                entry["node_ids"] = [node_id for node_id in entry["node_ids"] if node_id in signatures]
+                entry["chunk_signatures"] = pack_signatures([signatures[node_id] for node_id in entry["node_ids"]])
+
+    scheduler = EmbeddingScheduler(embedder, embedding_budget(config.provider, config.embed_model, config.api_key))
+
+    def embed(nodes: Iterator[BaseNode]) -> Iterator[List[BaseNode]]:
+        for batch in scheduler.embed(_batched(nodes, INGEST_EMBED_BATCH_SIZE)):
+            progress.chunks_embedded += len(batch)
+            yield batch
+
+    def write(batches: Iterator[List[BaseNode]]) -> Iterator[int]:
+        if not INGEST_BULK_LOAD:
+            for batch in batches:
+                written.extend(vector_store.add(batch))
+                progress.rows_written = len(written)
+                yield len(batch)
+            return
+        vector_store._initialize()  # creates the table on a fresh database
+        with VectorBulkLoader(config.schema_name, config.table_name, flat_metadata=vector_store.flat_metadata) as loader:
+            for batch in batches:
+                written.extend(loader.add(batch))
+                progress.rows_written = loader.rows_loaded
+                yield len(batch)
+        progress.rows_written = loader.rows_loaded
+        load.update(loader.stats())
+
+    try:
+        with FileParser(config.answer_model) as parser:
+            stages = run_pipeline(
+                [
+                    Stage("discover", discover, queue_size=INGEST_PARSE_QUEUE_SIZE),
+                    Stage("parse", parse, queue_size=INGEST_EMBED_BATCH_SIZE * 2),
+                    *([Stage("dedup", dedup, queue_size=INGEST_EMBED_BATCH_SIZE * 2)] if index is not None else []),
+                    Stage("embed", embed, queue_size=INGEST_WRITE_QUEUE_SIZE),
+                    Stage("write", write),
+                ],
+                on_tick=notify,
+            )
+    except BaseException:
+        if written:
+            vector_store.delete_nodes(node_ids=written)
+        raise
+    return stages, load, dedup_counts if index is not None else {}
+
+
+def _tag_corpus_version(node: BaseNode, version: int) -> None:
+    node.metadata[CORPUS_VERSION_KEY] = str(version)
+    # Bookkeeping only: a rebuild must not change the embedded text (and so
+    # miss the embedding cache) or the prompt. Duplicate sources are added
+    # to the stored row later.
+    for key in (CORPUS_VERSION_KEY, DUPLICATE_SOURCES_KEY):
+        if key not in node.excluded_embed_metadata_keys:
+            node.excluded_embed_metadata_keys.append(key)
+        if key not in node.excluded_llm_metadata_keys:
+            node.excluded_llm_metadata_keys.append(key)
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch: List[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _plan_folder(
+    config: IngestConfig,
+    manifest: Dict[str, Dict[str, Any]],
+    report: IngestReport,
+) -> tuple[Path, List[Dict[str, Any]], List[Dict[str, Any]]]:
+    docs_dir = _docs_directory(config.folder_name)
+    files = _scan_folder(docs_dir)
+    if not files and not manifest:
+        raise IngestError(f"No documents found in folder '{config.folder_name}'.")
+
+    # A rebuild embeds every file into the new version.
+    changed, touched = _plan_files(config, files, {} if report.rebuild else manifest, report)
+    if report.rebuild:
+        report.updated = [name for name in report.added if name in manifest]
+        report.added = [name for name in report.added if name not in manifest]
+    report.removed = sorted(set(manifest) - set(files))
+    if not report.rebuild:
+        _requeue_duplicates(config, manifest, changed, touched, report)
+    return docs_dir, changed, touched
+
+
+def _requeue_duplicates(
+    config: IngestConfig,
+    manifest: Dict[str, Dict[str, Any]],
+    changed: List[Dict[str, Any]],
+    touched: List[Dict[str, Any]],
+    report: IngestReport,
+) -> None:
+    """Re-embed unchanged files whose deduplicated chunks point at vectors about to go."""
+    while True:
+        replaced = {entry["path"] for entry in changed} | set(report.removed)
+        live = {node_id for name, entry in manifest.items() if name not in replaced for node_id in entry["node_ids"]}
+        orphaned = [
+            name
+            for name in report.skipped
+            if name not in replaced and not set(manifest[name]["duplicate_of"]) <= live
+        ]
+        if not orphaned:
+            return
+        for name in orphaned:
+            current = next((entry for entry in touched if entry["path"] == name), manifest[name])
+            touched[:] = [entry for entry in touched if entry["path"] != name]
+            report.skipped.remove(name)
+            report.updated.append(name)
+            changed.append(
+                {
+                    "path": name,
+                    "folder_name": config.folder_name,
+                    "size_bytes": current["size_bytes"],
+                    "mtime": current["mtime"],
+                    "content_hash": current["content_hash"],
+                    "embed_model": config.embed_model,
+                    "chunk_signatures": b"",
+                    "duplicate_of": [],
+                }
+            )
 
 
-async def ingest_documents(
+def _ingest_sync(
+    config: IngestConfig,
+    manifest: Dict[str, Dict[str, Any]],
+    on_progress: ProgressCallback | None = None,
+    *,
+    version: int = 0,
+    rebuild: bool = False,
+) -> IngestReport:
+    progress = IngestProgress()
+
+    def notify() -> None:
+        if on_progress is not None:
+            on_progress(progress.as_dict())
+
+    report = IngestReport(corpus_version=version, rebuild=rebuild)
+    docs_dir, changed, touched = _plan_folder(config, manifest, report)
+    progress.files_total = len(changed)
+    notify()
+
+    vector_store = None
+    if changed or (report.removed and not rebuild):
+        embedder, embed_model = _select_embedder(config)
+        vector_store = _vector_store(config.table_name, config.schema_name, _embed_dimensions(embed_model, embedder))
+        if changed:
+            index = _dedup_index(manifest, changed, report) if INGEST_DEDUP else None
+            stages, report.load, report.dedup = _embed_files(
+                config, docs_dir, changed, vector_store, embedder, progress, notify, version, index
+            )
+            notify()
+            report.stages = {stats.name: stats.as_dict() for stats in stages}
+            if report.load:
+                print(
+                    f"💾 Loaded {report.load['rows']} vector rows at {report.load['rows_per_second']} rows/s "
+                    f"(copy {report.load['copy_seconds']}s, merge {report.load['merge_seconds']}s)"
+                )
+            print(
+                "📈 Ingest throughput: "
+                + ", ".join(f"{stats.name} {stats.items_per_second:.1f}/s" for stats in stages)
+            )
+            if report.dedup:
+                dropped = report.dedup["exact"] + report.dedup["near"]
+                metrics.incr("ingest_chunks_deduplicated", report.dedup["exact"], kind="exact")
+                metrics.incr("ingest_chunks_deduplicated", report.dedup["near"], kind="near")
+                print(
+                    f"🧬 Dropped {dropped} of {report.dedup['chunks']} chunks as duplicates "
+                    f"({report.dedup['exact']} exact, {report.dedup['near']} near)"
+                )
+
+    # Files that failed to parse keep their previous vectors and manifest row
+    # and are retried by the next ingest.
+    report.failed = {entry["path"]: entry["error"] for entry in changed if "error" in entry}
+    changed = [entry for entry in changed if "error" not in entry]
+    report.added = [name for name in report.added if name not in report.failed]
+    report.updated = [name for name in report.updated if name not in report.failed]
+    report.nodes_added = sum(len(entry["node_ids"]) for entry in changed)
+
+    if rebuild:
+        # Rows deduplicated onto another file's previous version cannot be carried.
+        kept = [
+            manifest[name]
+            for name in report.failed
+            if name in manifest
+            and manifest[name]["embed_model"] == config.embed_model
+            and not manifest[name]["duplicate_of"]
+        ]
+        carried_ids = [node_id for entry in kept for node_id in entry["node_ids"]]
+        _record_duplicate_sources(config, changed + kept, [])
+        # Retrieval moves to the new version in one transaction; the previous
+        # version's rows are deleted later by the corpus garbage collector.
+        anyio.from_thread.run(
+            partial(
+                activate_corpus_version,
+                config.tenant_id,
+                version,
+                schema_name=config.schema_name,
+                vector_table=config.table_name,
+                entries=changed + kept,
+                carried_node_ids=carried_ids,
+            )
+        )
+        report.nodes_removed = sum(len(entry["node_ids"]) for entry in manifest.values()) - len(carried_ids)
+        return report
+
+    stale_ids = [
+        node_id
+        for name in report.removed + report.updated
+        for node_id in manifest[name]["node_ids"]
+    ]
+    final = {name: entry for name, entry in manifest.items() if name not in report.removed}
+    final.update((entry["path"], entry) for entry in changed + touched)
+    _record_duplicate_sources(
+        config,
+        list(final.values()),
+        [manifest[name] for name in report.removed + report.updated],
+    )
+    # New vectors are stored before the old ones are deleted, so retrieval
+    # never sees a gap for an updated file.
+    anyio.from_thread.run(save_ingest_manifest, config.tenant_id, changed + touched, report.removed)
+    if stale_ids and vector_store is not None:
+        vector_store.delete_nodes(node_ids=stale_ids)
+        report.nodes_removed = len(stale_ids)
+    return report
+
+
+def _dedup_index(
+    manifest: Dict[str, Dict[str, Any]],
+    changed: List[Dict[str, Any]],
+    report: IngestReport,
+) -> ChunkIndex:
+    """Index of the chunks that stay; a rebuild starts empty."""
+    index = ChunkIndex()
+    if report.rebuild:
+        return index
+    replaced = {entry["path"] for entry in changed} | set(report.removed)
+    for name, entry in manifest.items():
+        if name not in replaced:
+            for node_id, signature in zip(entry["node_ids"], unpack_signatures(entry["chunk_signatures"])):
+                index.add(node_id, signature)
+    return index
+
+
+def _record_duplicate_sources(
+    config: IngestConfig,
+    entries: List[Dict[str, Any]],
+    previous: List[Dict[str, Any]],
+) -> None:
+    """Set `duplicate_sources` on canonical chunks whose duplicates changed.
+
+    `entries` is the manifest after this ingest; `previous` the replaced
+    rows, whose canonical chunks may have lost a source.
+    """
+    owners = {node_id: entry["path"] for entry in entries for node_id in entry["node_ids"]}
+    sources: Dict[str, set[str]] = {}
+    for entry in entries:
+        for node_id in entry["duplicate_of"]:
+            if owners.get(node_id, entry["path"]) != entry["path"]:
+                sources.setdefault(node_id, set()).add(entry["path"])
+    affected = set(sources) | {node_id for entry in previous for node_id in entry["duplicate_of"]}
+    payload = {node_id: sorted(sources.get(node_id, ())) for node_id in affected if node_id in owners}
+    if payload:
+        anyio.from_thread.run(
+            set_duplicate_sources, config.tenant_id, config.schema_name, config.table_name, payload
+        )
+
+
+async def _resolve_config(
     tenant_id: int,
     folder_name: str,
-    provider: str | None = None,
-    *,
-    embed_model: str | None = None,
-) -> tuple[int, str, str]:
+    provider: str | None,
+    embed_model: str | None,
+) -> IngestConfig:
     tenant_config = await get_params_by_tenant_id(tenant_id)
     if not tenant_config:
         raise IngestError(f"No tenant configuration found for id {tenant_id}.")
@@ -196,7 +681,7 @@ async def ingest_documents(
     schema_name = llm_params.get("rag_schema_name") or "public"
     table_name = SHARED_VECTOR_TABLE
 
-    config = IngestConfig(
+    return IngestConfig(
         tenant_id=tenant_id,
         folder_name=folder_name,
         provider=provider_name,
@@ -204,6 +689,279 @@ async def ingest_documents(
         embed_model=str(embed_model_name),
         table_name=table_name,
         schema_name=str(schema_name),
+        answer_model=str(llm_params.get("model_answer") or DEFAULT_ANSWER_MODEL),
+    )
+
+
+async def ingest_documents(
+    tenant_id: int,
+    folder_name: str,
+    provider: str | None = None,
+    *,
+    embed_model: str | None = None,
+    on_progress: ProgressCallback | None = None,
+    limiter: anyio.CapacityLimiter | None = None,
+    rebuild: bool = False,
+) -> tuple[IngestReport, str, str]:
+    """
+    Embed new and changed files of the folder and drop vectors of removed ones.
+
+    `on_progress` is called from the ingest thread with `IngestProgress`
+    counters and may raise `IngestCancelled` to stop the run. `limiter` keeps
+    the ingest thread off the default pool that database calls share.
+
+    With `rebuild` (implied for a tenant's first ingest and when the embedding
+    model changed) every file is embedded into a new corpus version that
+    retrieval switches to only once it is complete.
+
+    Runs of one tenant wait for each other on a database lock, so the CLI and
+    the ingest workers never build corpus versions side by side.
+    """
+    config = await _resolve_config(tenant_id, folder_name, provider, embed_model)
+    await _ensure_manifest_table()
+    async with tenant_ingest_lock(tenant_id):
+        manifest = await get_ingest_manifest(tenant_id)
+        rebuild = _needs_rebuild(config, manifest, rebuild)
+        if rebuild:
+            version = await begin_corpus_version(tenant_id, config.schema_name)
+        else:
+            version = await get_active_corpus_version(tenant_id)
+        run = partial(_ingest_sync, config, manifest, on_progress, version=version, rebuild=rebuild)
+        try:
+            report = await anyio.to_thread.run_sync(run, limiter=limiter)
+        except BaseException:
+            if rebuild:
+                # Rows already written by the aborted build are collected later.
+                with anyio.CancelScope(shield=True):
+                    await retire_corpus_version(tenant_id, version)
+            raise
+    return report, config.provider, config.embed_model
+
+
+async def plan_ingest(
+    tenant_id: int,
+    folder_name: str,
+    provider: str | None = None,
+    *,
+    embed_model: str | None = None,
+    rebuild: bool = False,
+) -> IngestReport:
+    """
+    Report what `ingest_documents` would add, update and remove, without
+    embedding or writing anything.
+    """
+    config = await _resolve_config(tenant_id, folder_name, provider, embed_model)
+    await _ensure_manifest_table()
+    manifest = await get_ingest_manifest(tenant_id)
+    report = IngestReport(
+        corpus_version=await get_active_corpus_version(tenant_id),
+        rebuild=_needs_rebuild(config, manifest, rebuild),
     )
-    ingested = await anyio.to_thread.run_sync(_ingest_sync, config)
-    return ingested, provider_name, str(embed_model_name)
+    await anyio.to_thread.run_sync(_plan_folder, config, manifest, report)
+    return report
+
+
+def _needs_rebuild(config: IngestConfig, manifest: Dict[str, Dict[str, Any]], rebuild: bool) -> bool:
+    return (
+        rebuild
+        or not manifest
+        or any(entry["embed_model"] != config.embed_model for entry in manifest.values())
+    )
+
+
+async def _ensure_manifest_table() -> None:
+    global _manifest_table_ready
+    if not _manifest_table_ready:
+        await ensure_ingest_manifest_table()
+        await ensure_corpus_versions_table()
+        _manifest_table_ready = True
+
+
+async def remove_ingested_files(tenant_id: int, file_names: Sequence[str]) -> tuple[int, List[str]]:
+    """
+    Delete the vectors of files removed from the tenant folder.
+
+    A file whose chunks other files were deduplicated against keeps its vectors
+    and manifest row, so those files still have their text; the next ingest of
+    the folder re-embeds them and then drops it. Returns the deleted node count
+    and the files kept for that reason.
+    """
+    await _ensure_manifest_table()
+    async with tenant_ingest_lock(tenant_id):
+        manifest = await get_ingest_manifest(tenant_id)
+        requested = [name for name in file_names if name in manifest]
+        relied_on = {
+            node_id
+            for name, entry in manifest.items()
+            if name not in requested
+            for node_id in entry["duplicate_of"]
+        }
+        held = [name for name in requested if relied_on & set(manifest[name]["node_ids"])]
+        paths = [name for name in requested if name not in held]
+        if not paths:
+            return 0, held
+        node_ids = [node_id for name in paths for node_id in manifest[name]["node_ids"]]
+
+        if node_ids:
+            tenant_config = await get_params_by_tenant_id(tenant_id)
+            llm_params = _parse_params((tenant_config or {}).get("llm_params"))
+            schema_name = str(llm_params.get("rag_schema_name") or "public")
+            embed_dim = EMBED_DIMENSIONS.get(
+                manifest[paths[0]]["embed_model"], EMBED_DIMENSIONS["text-embedding-3-small"]
+            )
+            vector_store = _vector_store(SHARED_VECTOR_TABLE, schema_name, embed_dim)
+            await anyio.to_thread.run_sync(lambda: vector_store.delete_nodes(node_ids=node_ids))
+
+        await save_ingest_manifest(tenant_id, [], paths)
+    return len(node_ids), held
+
+
+@dataclass
+class _TenantRun:
+    tenant_id: int
+    folder_name: str
+    report: IngestReport | None = None
+    error: str | None = None
+    seconds: float = 0.0
+
+
+def _cli_targets(args: argparse.Namespace) -> List[tuple[int, str]]:
+    from app.controller.rag_docs import list_all_folders, tenant_folder_name, tenant_id_from_folder
+
+    if args.all:
+        folders = [(tenant_id_from_folder(folder), folder) for folder in list_all_folders()]
+        return [(tenant_id, folder) for tenant_id, folder in folders if tenant_id is not None]
+    return [(tenant_id, args.folder or tenant_folder_name(tenant_id)) for tenant_id in dict.fromkeys(args.tenants)]
+
+
+async def _run_cli(args: argparse.Namespace, targets: List[tuple[int, str]]) -> List[_TenantRun]:
+    runs = [_TenantRun(tenant_id, folder_name) for tenant_id, folder_name in targets]
+    slots = anyio.Semaphore(args.jobs)
+    limiter = anyio.CapacityLimiter(args.jobs)
+
+    async def run(item: _TenantRun) -> None:
+        async with slots:
+            print(f"📚 Tenant {item.tenant_id}: {'planning' if args.dry_run else 'ingesting'} {item.folder_name}")
+            started = time.perf_counter()
+            try:
+                if args.dry_run:
+                    item.report = await plan_ingest(
+                        item.tenant_id,
+                        item.folder_name,
+                        args.provider,
+                        embed_model=args.embed_model,
+                        rebuild=args.rebuild,
+                    )
+                else:
+                    item.report, _, _ = await ingest_documents(
+                        item.tenant_id,
+                        item.folder_name,
+                        args.provider,
+                        embed_model=args.embed_model,
+                        limiter=limiter,
+                        rebuild=args.rebuild,
+                    )
+            except Exception as exc:
+                item.error = f"{type(exc).__name__}: {exc}"
+                print(f"❌ Tenant {item.tenant_id}: {item.error}")
+            item.seconds = time.perf_counter() - started
+
+    async with anyio.create_task_group() as tg:
+        for item in runs:
+            tg.start_soon(run, item)
+    return runs
+
+
+def _print_cli_report(runs: List[_TenantRun], seconds: float, dry_run: bool) -> None:
+    header = f"{'tenant':>8} {'folder':<16} {'status':<10} {'added':>6} {'updated':>7} {'removed':>7} {'skipped':>7} {'failed':>6}"
+    print(header + ("" if dry_run else f" {'chunks':>8} {'seconds':>8} {'chunks/s':>9}"))
+    files = chunks = 0
+    for item in runs:
+        report = item.report or IngestReport()
+        if item.error:
+            status = "error"
+        elif dry_run:
+            status = "rebuild" if report.rebuild else "update"
+        else:
+            status = "rebuilt" if report.rebuild else "ok"
+        line = (
+            f"{item.tenant_id:>8} {item.folder_name:<16} {status:<10} {len(report.added):>6} {len(report.updated):>7} "
+            f"{len(report.removed):>7} {len(report.skipped):>7} {len(report.failed):>6}"
+        )
+        if not dry_run:
+            rate = report.nodes_added / item.seconds if item.seconds else 0.0
+            line += f" {report.nodes_added:>8} {item.seconds:>8.1f} {rate:>9.1f}"
+        print(line)
+        files += report.embedded
+        chunks += report.nodes_added
+    failed = sum(1 for item in runs if item.error)
+    summary = f"{len(runs)} tenant(s), {failed} failed, {files} file(s) to embed"
+    if not dry_run:
+        summary = (
+            f"{len(runs)} tenant(s), {failed} failed, {files} file(s) and {chunks} chunks embedded in {seconds:.1f} s "
+            f"({files / seconds if seconds else 0.0:.1f} files/s, {chunks / seconds if seconds else 0.0:.1f} chunks/s)"
+        )
+    print(f"📈 {summary}")
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Entry point of the `rag-ingest` command; returns the exit status."""
+    parser = argparse.ArgumentParser(
+        prog="rag-ingest",
+        description="Ingest tenant document folders into the vector store without the web app.",
+    )
+    targets = parser.add_mutually_exclusive_group(required=True)
+    targets.add_argument("--tenant", type=int, action="append", dest="tenants", metavar="ID", help="tenant id; repeat for several")
+    targets.add_argument("--all", action="store_true", help="every client-<tenant id> folder under the storage root")
+    parser.add_argument("--folder", help="folder to ingest for a single --tenant (default client-<tenant id>)")
+    parser.add_argument("--provider", help="override the tenant's embedding provider")
+    parser.add_argument("--embed-model", help="override the tenant's embedding model")
+    parser.add_argument("--rebuild", action="store_true", help="re-embed every file into a new corpus version")
+    parser.add_argument("--dry-run", action="store_true", help="only report which files would change")
+    parser.add_argument("--jobs", type=int, default=2, help="tenants ingested at the same time")
+    parser.add_argument(
+        "--embed-concurrency",
+        type=int,
+        default=EMBED_MAX_CONCURRENCY,
+        help="embedding requests in flight across all tenants",
+    )
+    parser.add_argument("--json", action="store_true", help="print the reports as JSON")
+    args = parser.parse_args(argv)
+    if args.folder and (args.all or len(args.tenants) != 1):
+        parser.error("--folder needs exactly one --tenant")
+    if args.jobs < 1 or args.embed_concurrency < 1:
+        parser.error("--jobs and --embed-concurrency must be at least 1")
+
+    tenants = _cli_targets(args)
+    if not tenants:
+        print("⚠️ No tenant folders found to ingest.")
+        return 0
+    limit_total_concurrency(args.embed_concurrency)
+    started = time.perf_counter()
+    # Keep stdout clean for the JSON report.
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        runs = anyio.run(_run_cli, args, tenants)
+    seconds = time.perf_counter() - started
+    if args.json:
+        print(
+            json.dumps(
+                [
+                    {
+                        "tenant_id": item.tenant_id,
+                        "folder": item.folder_name,
+                        "seconds": round(item.seconds, 3),
+                        "error": item.error,
+                        "report": item.report.as_dict() if item.report else None,
+                    }
+                    for item in runs
+                ],
+                indent=2,
+            )
+        )
+    else:
+        _print_cli_report(runs, seconds, args.dry_run)
+    return 1 if any(item.error for item in runs) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,129 @@
+"""Exact and near-duplicate chunk detection for ingestion, per tenant.
+
+Every chunk gets a signature: a digest of its normalised text (exact
+duplicates) and a MinHash of its word 3-grams (near duplicates). `ChunkIndex`
+holds the signatures of a tenant's kept chunks and buckets the MinHashes by
+LSH bands, so a new chunk is only compared with chunks that share a band.
+A candidate counts as a duplicate when the estimated Jaccard similarity
+reaches `INGEST_DEDUP_THRESHOLD`.
+
+Signatures are stored packed (`SIGNATURE_BYTES` per chunk, in node order) in
+the ingest manifest, so later incremental ingests dedupe against files that
+were not re-embedded.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "true").lower() not in {"0", "false", "no"}
+INGEST_DEDUP_THRESHOLD = float(os.getenv("INGEST_DEDUP_THRESHOLD", "0.85"))
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs near the threshold almost always share a band,
+# pairs under ~0.6 almost never do.
+_BANDS = 16
+_ROWS = NUM_PERM // _BANDS
+_SHINGLE_WORDS = 3
+# Shorter chunks ("Contact us", headings) are only removed when identical.
+_MIN_SHINGLES = 8
+_DIGEST_BYTES = 16
+SIGNATURE_BYTES = _DIGEST_BYTES + NUM_PERM * 4
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass(frozen=True, eq=False)
+class ChunkSignature:
+    digest: bytes
+    minhash: Optional[np.ndarray]
+
+    def pack(self) -> bytes:
+        minhash = self.minhash if self.minhash is not None else np.zeros(NUM_PERM, dtype=np.uint32)
+        return self.digest + minhash.astype("<u4").tobytes()
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "ChunkSignature":
+        minhash = np.frombuffer(data[_DIGEST_BYTES:SIGNATURE_BYTES], dtype="<u4").astype(np.uint32)
+        return cls(bytes(data[:_DIGEST_BYTES]), minhash if minhash.any() else None)
+
+
+def chunk_signature(text: str) -> ChunkSignature:
+    words = _WORD_RE.findall(text.lower())
+    digest = hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=_DIGEST_BYTES).digest()
+    shingles = {" ".join(words[i : i + _SHINGLE_WORDS]) for i in range(len(words) - _SHINGLE_WORDS + 1)}
+    if len(shingles) < _MIN_SHINGLES:
+        return ChunkSignature(digest, None)
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # Universal hashing (a*x + b) mod p, one row per permutation; uint64
+    # overflow is part of the hash family.
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % _MERSENNE
+    return ChunkSignature(digest, (permuted & np.uint64(0xFFFFFFFF)).min(axis=0).astype(np.uint32))
+
+
+def pack_signatures(signatures: Sequence[ChunkSignature]) -> bytes:
+    return b"".join(signature.pack() for signature in signatures)
+
+
+def unpack_signatures(data: Optional[bytes]) -> List[ChunkSignature]:
+    data = bytes(data or b"")
+    return [
+        ChunkSignature.unpack(data[start : start + SIGNATURE_BYTES])
+        for start in range(0, len(data) - SIGNATURE_BYTES + 1, SIGNATURE_BYTES)
+    ]
+
+
+class ChunkIndex:
+    """Signatures of kept chunks; `find` returns the chunk a new one duplicates."""
+
+    def __init__(self, threshold: float = INGEST_DEDUP_THRESHOLD) -> None:
+        self._threshold = threshold
+        self._exact: Dict[bytes, str] = {}
+        self._bands: Dict[Tuple[int, bytes], List[int]] = {}
+        self._node_ids: List[str] = []
+        self._minhashes: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def add(self, node_id: str, signature: ChunkSignature) -> None:
+        self._exact.setdefault(signature.digest, node_id)
+        if signature.minhash is None:
+            return
+        position = len(self._node_ids)
+        self._node_ids.append(node_id)
+        self._minhashes.append(signature.minhash)
+        for key in self._band_keys(signature.minhash):
+            self._bands.setdefault(key, []).append(position)
+
+    def find(self, signature: ChunkSignature) -> Tuple[Optional[str], str]:
+        """(canonical node id, "exact" or "near"), or (None, "") for a new chunk."""
+        node_id = self._exact.get(signature.digest)
+        if node_id is not None:
+            return node_id, "exact"
+        if signature.minhash is None:
+            return None, ""
+        checked = set()
+        for key in self._band_keys(signature.minhash):
+            for position in self._bands.get(key, ()):
+                if position in checked:
+                    continue
+                checked.add(position)
+                similarity = float(np.mean(self._minhashes[position] == signature.minhash))
+                if similarity >= self._threshold:
+                    return self._node_ids[position], "near"
+        return None, ""
+
+    @staticmethod
+    def _band_keys(minhash: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, minhash[band * _ROWS : (band + 1) * _ROWS].tobytes()) for band in range(_BANDS)]
@@ -0,0 +1,216 @@
+"""Parse and chunk ingest files in a pool of worker processes.
+
+Reading PDFs, DOCX and HTML and splitting them into nodes is CPU-bound, so
+`FileParser` hands one file per task to a `ProcessPoolExecutor` and yields
+the results in submission order. A file that raises, hangs past
+`INGEST_PARSE_TIMEOUT_SECONDS` or crashes its worker is reported as failed
+instead of failing the whole ingest; the pool is rebuilt when a worker has to
+be killed.
+
+This module is imported by the worker processes, so it must stay light: no
+database, FastAPI or vector store imports.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from llama_index.core import Settings, SimpleDirectoryReader
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import BaseNode, MetadataMode, TransformComponent
+
+from .rag_prompt import TOKEN_COUNT_KEY, count_tokens
+
+# 0 parses in the calling thread (no timeouts).
+INGEST_PARSE_PROCESSES = int(os.getenv("INGEST_PARSE_PROCESSES", str(min(os.cpu_count() or 1, 4))))
+INGEST_PARSE_TIMEOUT_SECONDS = float(os.getenv("INGEST_PARSE_TIMEOUT_SECONDS", "120"))
+# A file whose worker crashed this many times is given up on.
+_MAX_CRASHES = 2
+
+
+class TokenCountAnnotator(TransformComponent):
+    """Store each chunk's token count so prompt packing never re-tokenizes it."""
+
+    model: str | None = None
+
+    def __call__(self, nodes: Sequence[BaseNode], **kwargs: Any) -> List[BaseNode]:
+        for node in nodes:
+            text = node.get_content(metadata_mode=MetadataMode.NONE)
+            node.metadata[TOKEN_COUNT_KEY] = count_tokens(text, self.model)
+            # Bookkeeping only: keep it out of the embedded and prompted text.
+            if TOKEN_COUNT_KEY not in node.excluded_embed_metadata_keys:
+                node.excluded_embed_metadata_keys.append(TOKEN_COUNT_KEY)
+            if TOKEN_COUNT_KEY not in node.excluded_llm_metadata_keys:
+                node.excluded_llm_metadata_keys.append(TOKEN_COUNT_KEY)
+        return list(nodes)
+
+
+def parse_file(path: str, metadata: Dict[str, Any], answer_model: str | None = None) -> List[BaseNode]:
+    """Load one file, tag its documents with `metadata` and split it into nodes."""
+    documents = SimpleDirectoryReader(input_files=[path]).load_data()
+    for doc in documents:
+        doc.metadata = {**(doc.metadata or {}), **metadata}
+    return run_transformations(documents, [Settings.node_parser, TokenCountAnnotator(model=answer_model)])
+
+
+@dataclass
+class ParseTask:
+    path: str
+    metadata: Dict[str, Any]
+    # Handed back untouched with the result (e.g. the manifest entry).
+    key: Any = None
+
+
+@dataclass
+class ParseResult:
+    task: ParseTask
+    nodes: List[BaseNode] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def _needs_retry(future: Future) -> bool:
+    if not future.done() or future.cancelled():
+        return True
+    return isinstance(future.exception(), BrokenProcessPool)
+
+
+@dataclass
+class _Pending:
+    task: ParseTask
+    future: Optional[Future] = None
+    deadline: Optional[float] = None
+    crashes: int = 0
+
+
+class FileParser:
+    """Stream `ParseResult`s for a sequence of files, in order.
+
+    Use it as a context manager: the worker pool starts with the first file
+    and is shut down on exit.
+
+    Timeouts count from the moment a task is among the first `processes`
+    unfinished ones, i.e. roughly when a worker picks it up. Results arrive
+    in order, so one slow file holds back the ones queued behind it (but not
+    the workers parsing them).
+    """
+
+    def __init__(
+        self,
+        answer_model: str | None = None,
+        *,
+        processes: int = INGEST_PARSE_PROCESSES,
+        timeout: float = INGEST_PARSE_TIMEOUT_SECONDS,
+    ) -> None:
+        self._answer_model = answer_model
+        self._processes = max(processes, 0)
+        self._timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _start(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned workers do not inherit the server's threads, sockets or locks.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _stop(self, kill: bool = False) -> None:
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        if kill:
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.kill()
+        executor.shutdown(wait=not kill, cancel_futures=True)
+
+    def _reset(self, pending: Deque[_Pending]) -> None:
+        """Kill the pool; every task that had not finished will be submitted again."""
+        self._stop(kill=True)
+        for item in pending:
+            if item.future is not None and _needs_retry(item.future):
+                item.future = None
+                item.deadline = None
+
+    def _parse_inline(self, tasks: Iterable[ParseTask]) -> Iterator[ParseResult]:
+        for task in tasks:
+            try:
+                yield ParseResult(task, parse_file(task.path, task.metadata, self._answer_model))
+            except Exception as exc:
+                yield ParseResult(task, error=f"{type(exc).__name__}: {exc}")
+
+    def parse(self, tasks: Iterable[ParseTask]) -> Iterator[ParseResult]:
+        if self._processes == 0:
+            yield from self._parse_inline(tasks)
+            return
+
+        source = iter(tasks)
+        pending: Deque[_Pending] = deque()
+        finished = False
+        try:
+            while True:
+                while not finished and len(pending) < self._processes * 2:
+                    task = next(source, None)
+                    if task is None:
+                        finished = True
+                    else:
+                        pending.append(_Pending(task))
+                if not pending:
+                    return
+                # After a crash the suspects run one at a time, so a second
+                # crash (or a timeout) is pinned on the right file.
+                in_flight = 1 if any(item.crashes for item in pending) else len(pending)
+                now = time.monotonic()
+                for index, item in enumerate(pending):
+                    if index >= in_flight:
+                        break
+                    if item.future is None:
+                        item.future = self._start().submit(parse_file, item.task.path, item.task.metadata, self._answer_model)
+                    if item.deadline is None and index < self._processes:
+                        item.deadline = now + self._timeout
+
+                head = pending[0]
+                wait([head.future], timeout=max(head.deadline - now, 0.0))
+                if not head.future.done():
+                    pending.popleft()
+                    self._reset(pending)
+                    yield ParseResult(head.task, error=f"Parsing timed out after {self._timeout:g}s.")
+                    continue
+                error = head.future.exception()
+                if isinstance(error, BrokenProcessPool):
+                    # A worker died (e.g. a segfault in a PDF library); every
+                    # file that was being parsed is a suspect.
+                    for item in pending:
+                        if item.deadline is not None and _needs_retry(item.future):
+                            item.crashes += 1
+                    self._reset(pending)
+                    if head.crashes >= _MAX_CRASHES:
+                        pending.popleft()
+                        yield ParseResult(head.task, error="Parser process crashed.")
+                    continue
+                pending.popleft()
+                if error is not None:
+                    yield ParseResult(head.task, error=f"{type(error).__name__}: {error}")
+                else:
+                    yield ParseResult(head.task, head.future.result())
+        finally:
+            if pending:
+                # Stopped early (cancellation or a failure downstream): do
+                # not wait for files nobody will read.
+                self._stop(kill=True)
+
+    def close(self) -> None:
+        self._stop()
+
+    def __enter__(self) -> "FileParser":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
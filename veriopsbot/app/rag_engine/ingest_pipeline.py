@@ -0,0 +1,168 @@
+"""Bounded, staged generator pipeline used by ingestion.
+
+Each stage is a generator function that consumes the previous stage's items
+and runs in its own thread; stages are connected by bounded queues, so a
+fast parser blocks instead of piling parsed documents up in memory while the
+embedding API catches up. Memory therefore depends on the queue sizes and
+the batch size, not on the size of the corpus.
+
+Every stage records how many items it produced and how long it was busy
+(excluding time spent waiting on its neighbours), which gives its throughput.
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from app.metrics import metrics
+
+# First stage takes no input; later stages take the previous stage's items.
+StageFn = Callable[..., Iterable[Any]]
+
+_DONE = object()
+_POLL_SECONDS = 0.2
+_TICK_SECONDS = 0.25
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    fn: StageFn
+    # Capacity of the queue that feeds this stage's output to the next one.
+    queue_size: int = 4
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    busy_seconds: float = 0.0
+    waiting_seconds: float = 0.0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "waiting_seconds": round(self.waiting_seconds, 3),
+            "items_per_second": round(self.items_per_second, 2),
+        }
+
+
+class _Pipeline:
+    def __init__(self, stages: Sequence[Stage]) -> None:
+        self.stages = list(stages)
+        self.queues = [queue.Queue(maxsize=max(stage.queue_size, 1)) for stage in self.stages[:-1]]
+        self.stats = [StageStats(stage.name) for stage in self.stages]
+        self.stop = threading.Event()
+        self.error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+
+    def fail(self, exc: BaseException) -> None:
+        with self._lock:
+            if self.error is None:
+                self.error = exc
+        self.stop.set()
+
+    def _put(self, index: int, item: Any) -> bool:
+        target = self.queues[index]
+        started = time.perf_counter()
+        try:
+            while not self.stop.is_set():
+                try:
+                    target.put(item, timeout=_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.stats[index].waiting_seconds += time.perf_counter() - started
+
+    def _upstream(self, index: int) -> Iterator[Any]:
+        """Items produced by stage `index - 1`, ending early when the pipeline stops."""
+        source = self.queues[index - 1]
+        stats = self.stats[index]
+        while not self.stop.is_set():
+            started = time.perf_counter()
+            try:
+                item = source.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            finally:
+                stats.waiting_seconds += time.perf_counter() - started
+            if item is _DONE:
+                return
+            yield item
+
+    def run_stage(self, index: int) -> None:
+        stage, stats = self.stages[index], self.stats[index]
+        last = index == len(self.stages) - 1
+        started = time.perf_counter()
+        try:
+            produced = stage.fn(self._upstream(index)) if index else stage.fn()
+            for item in produced:
+                stats.items += 1
+                if not last and not self._put(index, item):
+                    break
+        except BaseException as exc:
+            self.fail(exc)
+        finally:
+            stats.busy_seconds = max(time.perf_counter() - started - stats.waiting_seconds, 0.0)
+            if not last:
+                # Always deliver the end marker, even if the queue is full of
+                # items nobody will read after a failure.
+                while True:
+                    try:
+                        self.queues[index].put(_DONE, timeout=_POLL_SECONDS)
+                        break
+                    except queue.Full:
+                        if self.stop.is_set():
+                            try:
+                                self.queues[index].get_nowait()
+                            except queue.Empty:
+                                pass
+
+
+def run_pipeline(
+    stages: Sequence[Stage],
+    *,
+    on_tick: Optional[Callable[[], None]] = None,
+    metric_prefix: str = "ingest_stage",
+) -> List[StageStats]:
+    """Run the stages to completion and return their stats.
+
+    `on_tick` runs on the calling thread while the stages work (e.g. to
+    report progress); if it raises, the pipeline stops. The first exception
+    from a stage or from `on_tick` is re-raised once every stage thread has
+    finished.
+    """
+    pipeline = _Pipeline(stages)
+    threads = [
+        threading.Thread(target=pipeline.run_stage, args=(index,), name=f"{metric_prefix}-{stage.name}", daemon=True)
+        for index, stage in enumerate(pipeline.stages)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(_TICK_SECONDS)
+            if on_tick is not None and not pipeline.stop.is_set():
+                try:
+                    on_tick()
+                except BaseException as exc:
+                    pipeline.fail(exc)
+
+    for stats in pipeline.stats:
+        metrics.incr(f"{metric_prefix}_items", stats.items, stage=stats.name)
+        metrics.observe(f"{metric_prefix}_busy_seconds", stats.busy_seconds, stage=stats.name)
+        metrics.gauge(f"{metric_prefix}_items_per_second", round(stats.items_per_second, 2), stage=stats.name)
+    if pipeline.error is not None:
+        raise pipeline.error
+    return pipeline.stats
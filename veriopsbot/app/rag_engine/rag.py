@@ -2,21 +2,90 @@
 
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+import anyio
 from llama_index.core import Settings
-from llama_index.core.schema import NodeWithScore
+from llama_index.core.schema import NodeWithScore, QueryBundle
 
-from .helpers import configure_llm_from_config, get_query_engine
+from .helpers import (
+    DEFAULT_MODEL_ANSWER,
+    build_embed_model_from_config,
+    build_llm_from_config,
+    configure_llm_from_config,
+    get_query_engine,
+)
+from .rag_compress import compress_snippets, compression_budget
+from .rag_faq import faq_reply, match_faq
 from .rag_handleInput import classify_user_message
 from .rag_llm import chat_completion
 from .rag_memory import MemoryState
+from .rag_prompt import (
+    NO_HISTORY,
+    NO_KNOWLEDGE,
+    count_tokens,
+    fit_message,
+    llm_model_name,
+    log_prompt_tokens,
+    pack_history,
+    pack_snippets,
+    remaining_budget,
+    stage_budget,
+)
+from .rag_summary import schedule_summary_refresh
 
 
 def initial_state() -> MemoryState:
     return MemoryState()
 
 
+def hydrated_state(
+    turns: Iterable[Tuple[str, str]],
+    *,
+    tenant_id: int,
+    llm_params: Optional[Dict[str, Any]] = None,
+) -> MemoryState:
+    """Rebuild memory from stored (role, content) turns, oldest first.
+
+    Only the newest turns that fit the compose stage's history budget are
+    kept; anything beyond the verbatim window is folded into the summary by
+    the usual background refresh.
+    """
+    budget = stage_budget("compose", llm_params)
+    history_tokens = int(budget.total * budget.history_share)
+    model = (llm_params or {}).get("model_answer") or DEFAULT_MODEL_ANSWER
+
+    state = MemoryState(tenant_id=tenant_id)
+    kept: List[Tuple[str, str]] = []
+    used = 0
+    for role, content in reversed(list(turns)[-state.max_turns :]):
+        cost = count_tokens(f"{role}: {content}", model)
+        if kept and used + cost > history_tokens:
+            break
+        kept.append((role, content))
+        used += cost
+    for role, content in reversed(kept):
+        state.remember(role, content)
+    return state
+
+
+def schedule_memory_refresh(
+    state: MemoryState,
+    *,
+    runtime_config: Optional[Dict[str, Any]] = None,
+) -> Optional[asyncio.Task]:
+    """Fold evicted turns into the rolling summary once the reply is out."""
+    if not state.needs_summary():
+        return None
+    try:
+        llm, llm_params = build_llm_from_config(runtime_config or {})
+    except RuntimeError as exc:
+        print(f"⚠️ Skipping conversation summary refresh: {exc}")
+        return None
+    return schedule_summary_refresh(llm, state, llm_params=llm_params)
+
+
 async def handle_input(
     state: MemoryState,
     user_message: str,
@@ -32,7 +101,12 @@ async def handle_input(
 
     llm = getattr(Settings, "llm", None)
     print("🤖 Starting Intent classification...")
-    intent, reason = await classify_user_message(llm, state, user_message)
+    intent, reason = await classify_user_message(
+        llm,
+        state,
+        user_message,
+        llm_params=llm_params,
+    )
     print(f"🤖 Intent: {intent}, Reason: {reason}")
 
     state.remember("user", user_message)
@@ -44,10 +118,20 @@ async def handle_input(
                 "smalltalk_system_prompt",
                 "You are a warm, professional assistant. Reply concisely in the same language as the user.",
             )
+            model = llm_model_name(llm)
+            budget = stage_budget("smalltalk", llm_params)
+            latest = fit_message(user_message, budget, model=model)
+            history = pack_history(
+                state,
+                remaining_budget(budget, system_prompt, latest, model=model),
+                model=model,
+                max_turns=budget.max_turns,
+            )
             user_prompt = (
-                f"Conversation to date:\n{state.transcript() or '(no history)'}\n\n"
-                f"Most recent user message:\n{user_message}"
+                f"Conversation to date:\n{history or NO_HISTORY}\n\n"
+                f"Most recent user message:\n{latest}"
             )
+            log_prompt_tokens("smalltalk", system_prompt, user_prompt, model=model, budget=budget)
             try:
                 reply = await chat_completion(llm, user_prompt, system_prompt=system_prompt)
             except Exception:
@@ -66,6 +150,23 @@ async def handle_input(
     if intent == "handoff":
         return state, "human_agent", "handoff"
 
+    # Not `Settings.embed_model`: other tenants' requests reconfigure it
+    # while this one awaits. The FAQ lookup and retrieval share the vector,
+    # so the message is embedded once.
+    embed_model = build_embed_model_from_config(config)
+    query_embedding = await embed_model.aget_query_embedding(user_message)
+    faq = await match_faq(
+        state.tenant_id,
+        user_message,
+        embed_model,
+        query_embedding=query_embedding,
+        llm_params=llm_params,
+    )
+    if faq is not None:
+        reply = await faq_reply(llm, faq, user_message, llm_params)
+        state.remember("assistant", reply)
+        return state, reply, "faq"
+
     query_engine = await get_query_engine(
         account_id=int(config.get("omnichannel_id", tenant_id)),
         tenant_id=state.tenant_id,
@@ -73,7 +174,7 @@ async def handle_input(
         llm_params=llm_params,
     )
 
-    response = query_engine.query(user_message)
+    response = query_engine.query(QueryBundle(user_message, embedding=query_embedding))
     retrieved_nodes = list(getattr(response, "source_nodes", []) or [])
     raw_answer = (getattr(response, "response", None) or str(response or "")).strip()
 
@@ -120,12 +221,6 @@ async def _compose_conversational_answer(
             return f"Aqui está o que encontrei:\n{snippets}"
         return "I couldn't find information related to that yet."
 
-    conversation = memory.transcript() or "(no history)"
-    knowledge = "\n\n".join(
-        f"Source {idx + 1} (score={node.score:.2f}):\n{node.node.get_content()}"
-        for idx, node in enumerate(nodes)
-    ) or "No supporting documents were retrieved."
-
     system_prompt = llm_params.get(
         "rag_system_prompt",
         "You are a knowledgeable support assistant. "
@@ -134,12 +229,46 @@ async def _compose_conversational_answer(
         "If the knowledge snippets are helpful, weave them into the reply naturally. "
         "If you do not know, say so politely.",
     )
+    instructions = "Compose a concise, helpful reply in the same language as the user."
+
+    # Split the free budget between the conversation and the retrieved
+    # snippets; whatever the history does not use goes to the snippets.
+    model = llm_model_name(llm)
+    budget = stage_budget("compose", llm_params)
+    latest = fit_message(user_message, budget, model=model)
+    available = remaining_budget(budget, system_prompt, latest, instructions, model=model)
+    conversation = pack_history(
+        memory,
+        int(available * budget.history_share),
+        model=model,
+        max_turns=budget.max_turns,
+    )
+    knowledge_budget = remaining_budget(
+        budget,
+        system_prompt,
+        latest,
+        instructions,
+        conversation,
+        model=model,
+    )
+    # Keep only the sentences that answer the question when that fits a
+    # smaller budget; fall back to whole chunks when nothing matches.
+    knowledge = None
+    compressed_budget = compression_budget(llm_params, knowledge_budget)
+    if nodes and compressed_budget:
+        knowledge = await anyio.to_thread.run_sync(
+            lambda: compress_snippets(nodes, latest, compressed_budget, model=model)
+        )
+    if knowledge is None:
+        knowledge = pack_snippets(nodes, knowledge_budget, model=model)
+
     user_prompt = (
-        f"Conversation history:\n{conversation}\n\n"
-        f"Knowledge snippets:\n{knowledge}\n\n"
-        f"Latest user message:\n{user_message}\n\n"
-        "Compose a concise, helpful reply in the same language as the user."
+        f"Conversation history:\n{conversation or NO_HISTORY}\n\n"
+        f"Knowledge snippets:\n{knowledge or NO_KNOWLEDGE}\n\n"
+        f"Latest user message:\n{latest}\n\n"
+        f"{instructions}"
     )
+    log_prompt_tokens("compose", system_prompt, user_prompt, model=model, budget=budget)
 
     try:
         reply = await chat_completion(llm, user_prompt, system_prompt=system_prompt)
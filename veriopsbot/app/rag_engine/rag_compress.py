@@ -0,0 +1,166 @@
+"""Query-time compression of retrieved chunks for the compose prompt.
+
+Usually only a sentence or two of each retrieved chunk answers the question.
+`compress_snippets` splits the nodes into sentences, scores each one against
+the user's message with BM25 (IDF taken over the retrieved sentences, so it
+works for any language without a model or an API call), and keeps the
+best-scoring sentences that fit the token budget. Kept sentences are put back
+in document order under their source, with "…" where text was skipped. It is
+CPU-bound and meant to run in a worker thread.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from app.metrics import metrics
+
+from .rag_prompt import count_tokens
+
+DEFAULT_COMPRESSION_TOKENS = 800
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+|\n+")
+_WORD_RE = re.compile(r"\w+")
+_SOURCE_KEYS = ("source_path", "file_name")
+
+
+@dataclass
+class _Sentence:
+    source: int
+    position: int
+    text: str
+    terms: Counter
+    tokens: int
+    score: float = 0.0
+
+
+@dataclass
+class _Source:
+    label: str
+    sentences: List[_Sentence] = field(default_factory=list)
+
+
+def compression_budget(llm_params: Optional[Mapping[str, Any]], knowledge_budget: int) -> int:
+    """Token budget for compressed snippets; 0 when the tenant turned it off
+    (`context_compression_tokens` <= 0)."""
+    try:
+        tokens = int(float((llm_params or {}).get("context_compression_tokens", DEFAULT_COMPRESSION_TOKENS)))
+    except (TypeError, ValueError):
+        tokens = DEFAULT_COMPRESSION_TOKENS
+    return min(max(tokens, 0), knowledge_budget)
+
+
+def _terms(text: str) -> List[str]:
+    # Folding a trailing "s" matches most English and Portuguese plurals.
+    return [
+        word[:-1] if len(word) > 3 and word.endswith("s") else word
+        for word in _WORD_RE.findall(text.lower())
+        if len(word) > 1 or word.isdigit()
+    ]
+
+
+def _source_label(node: Any, index: int) -> str:
+    inner = getattr(node, "node", node)
+    metadata: Dict[str, Any] = getattr(inner, "metadata", None) or {}
+    name = next((metadata[key] for key in _SOURCE_KEYS if metadata.get(key)), None)
+    score = getattr(node, "score", None)
+    score_label = f"score={score:.2f}" if isinstance(score, (int, float)) else "score=n/a"
+    return f"Source {index + 1} ({name}, {score_label})" if name else f"Source {index + 1} ({score_label})"
+
+
+def _split(nodes: Sequence[Any], model: Optional[str]) -> List[_Source]:
+    sources: List[_Source] = []
+    for index, node in enumerate(nodes):
+        inner = getattr(node, "node", node)
+        try:
+            text = inner.get_content()
+        except AttributeError:
+            text = str(inner)
+        source = _Source(_source_label(node, index))
+        for part in _SENTENCE_RE.split(text):
+            part = part.strip()
+            if part:
+                source.sentences.append(
+                    _Sentence(index, len(source.sentences), part, Counter(_terms(part)), count_tokens(part, model))
+                )
+        sources.append(source)
+    return sources
+
+
+def _score(sentences: List[_Sentence], query: str) -> None:
+    query_terms = set(_terms(query))
+    if not query_terms or not sentences:
+        return
+    documents = len(sentences)
+    average_length = sum(sum(s.terms.values()) for s in sentences) / documents or 1.0
+    frequency = Counter(term for s in sentences for term in query_terms & s.terms.keys())
+    idf = {term: math.log(1 + (documents - count + 0.5) / (count + 0.5)) for term, count in frequency.items()}
+    for sentence in sentences:
+        length = sum(sentence.terms.values())
+        for term, weight in idf.items():
+            hits = sentence.terms.get(term, 0)
+            if hits:
+                norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * length / average_length)
+                sentence.score += weight * hits * (_BM25_K1 + 1) / (hits + norm)
+
+
+def compress_snippets(
+    nodes: Sequence[Any],
+    query: str,
+    budget: int,
+    *,
+    model: Optional[str] = None,
+) -> Optional[str]:
+    """Knowledge snippets within `budget` tokens, or None when compressing
+    would not help (nothing matches the query, or everything already fits)."""
+    sources = _split(nodes, model)
+    sentences = [sentence for source in sources for sentence in source.sentences]
+    total = sum(sentence.tokens for sentence in sentences)
+    if budget <= 0 or total <= budget:
+        return None
+    _score(sentences, query)
+    if not any(sentence.score for sentence in sentences):
+        return None
+
+    kept: set[tuple[int, int]] = set()
+    used = sum(count_tokens(source.label, model) + 2 for source in sources)
+    # Earlier (better ranked) sources win ties.
+    candidates = sorted(
+        (sentence for sentence in sentences if sentence.score > 0),
+        key=lambda sentence: (-sentence.score, sentence.source, sentence.position),
+    )
+    for sentence in candidates:
+        if used + sentence.tokens > budget:
+            continue
+        kept.add((sentence.source, sentence.position))
+        used += sentence.tokens
+    if not kept:
+        return None
+
+    blocks: List[str] = []
+    for source in sources:
+        parts: List[str] = []
+        previous = -1
+        for sentence in source.sentences:
+            if (sentence.source, sentence.position) not in kept:
+                continue
+            if parts and sentence.position != previous + 1:
+                parts.append("…")
+            parts.append(sentence.text)
+            previous = sentence.position
+        if parts:
+            blocks.append(f"{source.label}:\n" + " ".join(parts))
+
+    compressed = "\n\n".join(blocks)
+    saved = max(total - count_tokens(compressed, model), 0)
+    metrics.incr("rag_context_tokens_saved", saved)
+    print(
+        f"✂️ Context compression: {total} → {total - saved} tokens "
+        f"({len(kept)}/{len(sentences)} sentences from {len(blocks)} sources)"
+    )
+    return compressed
@@ -0,0 +1,137 @@
+"""Drop redundant retrieval candidates before they are reranked.
+
+Overlapping chunks of one document tend to come back together, and each of
+them would otherwise be sent to `LLMRerank` and packed into the compose
+prompt. `CandidateVectorStore` returns every candidate's stored embedding with
+the query results, and `DiversityFilter`, the first node postprocessor, orders
+the fused candidates by maximal marginal relevance over those embeddings and
+drops each one whose cosine similarity to a kept candidate reaches the cutoff.
+"""
+
+from __future__ import annotations
+
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import (
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.vector_stores.postgres import PGVectorStore
+
+from app.metrics import metrics
+
+from .rag_prompt import TOKEN_COUNT_KEY, count_tokens
+
+DEFAULT_DIVERSITY_CUTOFF = 0.92
+DEFAULT_MMR_LAMBDA = 0.7
+
+
+class CandidateVectorStore(PGVectorStore):
+    """PGVectorStore whose similarity queries also return each row's embedding."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CandidateVectorStore"
+
+    def _with_embeddings(self, rows: List[Any]) -> VectorStoreQueryResult:
+        result = self._db_rows_to_query_result([row for row, _ in rows])
+        for node, (_, embedding) in zip(result.nodes or [], rows):
+            node.embedding = embedding or None
+        return result
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            return super().query(query, **kwargs)
+        self._initialize()
+        return self._with_embeddings(
+            self._query_with_embedding(query.query_embedding, query.similarity_top_k, query.filters, **kwargs)
+        )
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            return await super().aquery(query, **kwargs)
+        self._initialize()
+        return self._with_embeddings(
+            await self._async_query_with_embedding(
+                query.query_embedding, query.similarity_top_k, query.filters, **kwargs
+            )
+        )
+
+
+def _candidate_tokens(node: NodeWithScore, model: Optional[str]) -> int:
+    stored = node.node.metadata.get(TOKEN_COUNT_KEY)
+    try:
+        return int(stored)
+    except (TypeError, ValueError):
+        return count_tokens(node.node.get_content(metadata_mode=MetadataMode.LLM), model)
+
+
+def redundant_candidates(
+    embeddings: np.ndarray,
+    relevance: np.ndarray,
+    *,
+    cutoff: float,
+    mmr_lambda: float,
+) -> List[int]:
+    """Indexes to drop: MMR picks candidates in turn, and every candidate at
+    least `cutoff` similar to a picked one is dropped."""
+    vectors = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    closest = np.zeros(len(vectors), dtype=np.float32)
+    open_ = np.ones(len(vectors), dtype=bool)
+    dropped: List[int] = []
+    while open_.any():
+        mmr = np.where(open_, mmr_lambda * relevance - (1 - mmr_lambda) * closest, -np.inf)
+        pick = int(np.argmax(mmr))
+        open_[pick] = False
+        closest = np.maximum(closest, similarity[pick])
+        redundant = open_ & (similarity[pick] >= cutoff)
+        dropped.extend(int(index) for index in np.flatnonzero(redundant))
+        open_ &= ~redundant
+    return sorted(dropped)
+
+
+class DiversityFilter(BaseNodePostprocessor):
+    """Drop candidates that repeat a more relevant one; logs the tokens saved."""
+
+    similarity_cutoff: float = Field(default=DEFAULT_DIVERSITY_CUTOFF)
+    mmr_lambda: float = Field(default=DEFAULT_MMR_LAMBDA)
+    model: Optional[str] = Field(default=None, description="Tokenizer for candidates without a stored count.")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "DiversityFilter"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        # Candidates without an embedding are never compared, only kept.
+        positions = [index for index, node in enumerate(nodes) if node.node.embedding]
+        if len(positions) < 2:
+            return nodes
+        embeddings = np.asarray([nodes[index].node.embedding for index in positions], dtype=np.float32)
+        scores = np.asarray([nodes[index].score or 0.0 for index in positions], dtype=np.float32)
+        spread = float(scores.max() - scores.min())
+        relevance = (scores - scores.min()) / spread if spread else np.ones_like(scores)
+        dropped = {
+            positions[index]
+            for index in redundant_candidates(
+                embeddings, relevance, cutoff=self.similarity_cutoff, mmr_lambda=self.mmr_lambda
+            )
+        }
+
+        metrics.incr("rag_candidates", len(nodes))
+        if not dropped:
+            return nodes
+        saved = sum(_candidate_tokens(nodes[index], self.model) for index in dropped)
+        metrics.incr("rag_candidates_dropped", len(dropped))
+        metrics.incr("rag_candidate_tokens_saved", saved)
+        print(f"🧹 Diversity filter dropped {len(dropped)}/{len(nodes)} candidates (~{saved} tokens saved)")
+        return [node for index, node in enumerate(nodes) if index not in dropped]
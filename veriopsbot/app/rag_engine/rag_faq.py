@@ -0,0 +1,215 @@
+"""Curated FAQ answered before the RAG pipeline.
+
+Tenants keep canonical question/answer pairs in `rag_faq`; each question is
+embedded when it is saved. `FaqIndex` holds a tenant's questions as one
+normalised float32 matrix, so matching a message is a single matrix-vector
+product. When the best cosine similarity reaches the tenant's threshold the
+stored answer is the reply and retrieval, rerank and compose are skipped.
+
+Indexes are cached per process for `FAQ_INDEX_TTL` seconds; saving through the
+controller drops the local copy at once, other processes catch up within the
+TTL. Questions embedded with another model than the tenant's current one are
+re-embedded the next time the index loads.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from app.db.repository import ensure_faq_table, get_faq_entries, update_faq_embeddings
+from app.metrics import metrics
+
+from .rag_llm import chat_completion
+
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.9"))
+FAQ_INDEX_TTL = float(os.getenv("FAQ_INDEX_TTL", "30"))
+FAQ_MAX_ENTRIES = int(os.getenv("FAQ_MAX_ENTRIES", "500"))
+
+_FAQ_REPHRASE_PROMPT = (
+    "You answer customer messages with an approved answer. Adapt the approved answer so it replies "
+    "naturally to the user's message, in the user's language. Keep every fact, number, link and "
+    "instruction exactly as given and add no new information. Reply with the adapted answer only."
+)
+
+_indexes: Dict[int, "FaqIndex"] = {}
+_table_ready = False
+
+
+@dataclass(frozen=True)
+class FaqMatch:
+    entry_id: int
+    question: str
+    answer: str
+    score: float
+
+
+@dataclass(frozen=True, eq=False)
+class FaqIndex:
+    embed_model: str
+    ids: List[int]
+    questions: List[str]
+    answers: List[str]
+    matrix: np.ndarray
+    loaded_at: float
+
+    @classmethod
+    def build(cls, embed_model: str, rows: Sequence[Dict[str, Any]]) -> "FaqIndex":
+        vectors = [unpack_embedding(row["embedding"]) for row in rows]
+        dims = {len(vector) for vector in vectors}
+        if len(dims) > 1:
+            raise ValueError(f"FAQ embeddings of {embed_model} have mixed dimensions {sorted(dims)}.")
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return cls(
+            embed_model=embed_model,
+            ids=[int(row["id"]) for row in rows],
+            questions=[row["question"] for row in rows],
+            answers=[row["answer"] for row in rows],
+            matrix=matrix,
+            loaded_at=time.monotonic(),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def match(self, vector: Sequence[float], threshold: float) -> Optional[FaqMatch]:
+        """The closest question when its cosine similarity reaches `threshold`."""
+        if not self.ids:
+            return None
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape[0] != self.matrix.shape[1]:
+            return None
+        scores = self.matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < threshold:
+            return None
+        return FaqMatch(self.ids[best], self.questions[best], self.answers[best], score)
+
+
+def pack_embedding(vector: Sequence[float]) -> bytes:
+    return np.asarray(vector, dtype="<f4").tobytes()
+
+
+def unpack_embedding(data: bytes) -> np.ndarray:
+    return np.frombuffer(bytes(data), dtype="<f4").astype(np.float32)
+
+
+async def embed_questions(embed_model: BaseEmbedding, questions: Sequence[str]) -> List[bytes]:
+    if not questions:
+        return []
+    vectors = await embed_model.aget_text_embedding_batch(list(questions))
+    return [pack_embedding(vector) for vector in vectors]
+
+
+async def ensure_faq_store() -> None:
+    global _table_ready
+    if not _table_ready:
+        await ensure_faq_table()
+        _table_ready = True
+
+
+def invalidate_faq_index(tenant_id: int) -> None:
+    _indexes.pop(tenant_id, None)
+
+
+async def load_faq_index(tenant_id: int, embed_model: BaseEmbedding) -> FaqIndex:
+    model_name = embed_model.model_name
+    cached = _indexes.get(tenant_id)
+    if (
+        cached is not None
+        and cached.embed_model == model_name
+        and time.monotonic() - cached.loaded_at < FAQ_INDEX_TTL
+    ):
+        return cached
+
+    await ensure_faq_store()
+    rows = await get_faq_entries(tenant_id)
+    stale = [row for row in rows if row["embed_model"] != model_name]
+    if stale:
+        embeddings = await embed_questions(embed_model, [row["question"] for row in stale])
+        for row, embedding in zip(stale, embeddings):
+            row["embed_model"] = model_name
+            row["embedding"] = embedding
+        await update_faq_embeddings(
+            tenant_id,
+            [{"id": row["id"], "embed_model": model_name, "embedding": row["embedding"]} for row in stale],
+        )
+        print(f"🔁 Re-embedded {len(stale)} FAQ question(s) of tenant {tenant_id} with {model_name}")
+
+    index = FaqIndex.build(model_name, rows)
+    _indexes[tenant_id] = index
+    return index
+
+
+def faq_threshold(llm_params: Optional[Dict[str, Any]]) -> float:
+    """Tenant's `faq_threshold`; 1 or more turns the FAQ off."""
+    try:
+        return float((llm_params or {}).get("faq_threshold", FAQ_MATCH_THRESHOLD))
+    except (TypeError, ValueError):
+        return FAQ_MATCH_THRESHOLD
+
+
+async def match_faq(
+    tenant_id: int,
+    user_message: str,
+    embed_model: Optional[BaseEmbedding],
+    *,
+    query_embedding: Optional[Sequence[float]] = None,
+    llm_params: Optional[Dict[str, Any]] = None,
+) -> Optional[FaqMatch]:
+    """The tenant's FAQ entry that answers `user_message`, if one is close enough.
+
+    Pass the message's `query_embedding` when retrieval reuses it; otherwise
+    the message is embedded here. Errors are logged and treated as no match,
+    so the RAG pipeline still answers.
+    """
+    threshold = faq_threshold(llm_params)
+    if embed_model is None or threshold >= 1 or not user_message.strip():
+        return None
+    started = time.perf_counter()
+    try:
+        index = await load_faq_index(tenant_id, embed_model)
+        if not len(index):
+            return None
+        vector = query_embedding
+        if vector is None:
+            vector = await embed_model.aget_query_embedding(user_message)
+        match = index.match(vector, threshold)
+    except Exception as exc:
+        print(f"⚠️ FAQ lookup failed for tenant {tenant_id}: {exc}")
+        metrics.incr("rag_faq_errors")
+        return None
+
+    metrics.incr("rag_faq_lookups")
+    metrics.observe("rag_faq_match_seconds", time.perf_counter() - started)
+    if match is None:
+        return None
+    metrics.incr("rag_faq_hits")
+    print(f"⚡ FAQ match #{match.entry_id} (score={match.score:.3f}): {match.question[:80]}")
+    return match
+
+
+async def faq_reply(
+    llm: Any,
+    match: FaqMatch,
+    user_message: str,
+    llm_params: Optional[Dict[str, Any]] = None,
+) -> str:
+    """The stored answer, lightly rephrased when the tenant enables `faq_rephrase`."""
+    rephrase = str((llm_params or {}).get("faq_rephrase", "")).lower() in {"1", "true", "yes"}
+    if not rephrase or llm is None:
+        return match.answer
+    user_prompt = f"User message:\n{user_message}\n\nApproved answer:\n{match.answer}"
+    try:
+        reply = await chat_completion(llm, user_prompt, system_prompt=_FAQ_REPHRASE_PROMPT)
+    except Exception as exc:
+        print(f"⚠️ FAQ rephrase failed, sending the stored answer: {exc}")
+        return match.answer
+    return reply.strip() or match.answer
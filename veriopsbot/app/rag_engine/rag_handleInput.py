@@ -4,10 +4,19 @@ from __future__ import annotations
 
 import json
 import logging
-from typing import Any, Literal, Optional, Tuple
+from typing import Any, Dict, Literal, Optional, Tuple
 
 from .rag_llm import chat_completion
 from .rag_memory import MemoryState
+from .rag_prompt import (
+    NO_HISTORY,
+    fit_message,
+    llm_model_name,
+    log_prompt_tokens,
+    pack_history,
+    remaining_budget,
+    stage_budget,
+)
 
 Intent = Literal["smalltalk", "rag", "handoff"]
 
@@ -18,6 +27,8 @@ async def classify_user_message(
     llm: Optional[Any],
     memory: MemoryState,
     message: str,
+    *,
+    llm_params: Optional[Dict[str, Any]] = None,
 ) -> Tuple[Intent, Optional[str]]:
     """Ask the LLM to decide how to handle the incoming message."""
     if not llm:
@@ -29,7 +40,6 @@ async def classify_user_message(
             return "smalltalk", None
         return "rag", None
 
-    transcript = memory.transcript()
     system_prompt = (
         "You are an intent classifier for an AI support assistant. "
         "Classify the user's request into exactly one of these intents:\n"
@@ -40,12 +50,28 @@ async def classify_user_message(
         "\"reason\" if it helps explain your choice."
     )
 
+    # The intent rarely depends on more than the last few exchanges, so the
+    # classifier only sees a small, token-bounded slice of the conversation.
+    model = llm_model_name(llm)
+    budget = stage_budget("classify", llm_params)
+    message = fit_message(message, budget, model=model)
+    instructions = "Respond ONLY with JSON like {\"intent\": \"rag\"} and optional \"reason\"."
+    history_budget = remaining_budget(budget, system_prompt, message, instructions, model=model)
+    transcript = pack_history(
+        memory,
+        history_budget,
+        model=model,
+        max_turns=budget.max_turns,
+        include_summary=False,
+    )
+
     user_prompt = (
         "Conversation so far:\n"
-        f"{transcript or '(no history)'}\n\n"
+        f"{transcript or NO_HISTORY}\n\n"
         f"Incoming message: {message}\n"
-        "Respond ONLY with JSON like {\"intent\": \"rag\"} and optional \"reason\"."
+        f"{instructions}"
     )
+    log_prompt_tokens("classify", system_prompt, user_prompt, model=model, budget=budget)
 
     try:
         raw = await chat_completion(llm, user_prompt, system_prompt=system_prompt)
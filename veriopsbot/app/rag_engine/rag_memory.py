@@ -2,37 +2,133 @@
 
 from __future__ import annotations
 
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Dict, List
+from itertools import islice
+from typing import Any, Deque, Dict, Iterator, List
 
 
-@dataclass
+@dataclass(slots=True)
 class MemoryTurn:
     role: str
     content: str
+    # Token count cached by the prompt packer for `token_model`.
+    tokens: int = field(default=-1, compare=False, repr=False)
+    token_model: str | None = field(default=None, compare=False, repr=False)
 
+    def line(self) -> str:
+        return f"{self.role}: {self.content}"
 
-@dataclass
+    def as_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+
+@dataclass(slots=True)
 class MemoryState:
-    """Conversation memory shared across RAG pipeline components."""
+    """Conversation memory shared across RAG pipeline components.
+
+    `turns` holds at most `max_turns` turns not yet covered by `summary`. The
+    last `window_turns` of them are the verbatim window; older ones are pending
+    until a background refresh folds them into the rolling summary, so the
+    memory (and the prompts built from it) stays roughly constant in size.
+
+    Turns live in a single deque, so remembering a turn is O(1). The plain-text
+    transcript is built on first use and then updated incrementally as turns
+    are appended or evicted; sessions that never ask for it pay nothing.
+    """
 
     tenant_id: int | None = None
-    turns: List[MemoryTurn] = field(default_factory=list)
+    turns: Deque[MemoryTurn] = field(default_factory=deque)
     max_turns: int = 20
+    window_turns: int = 6
+    summary: str = ""
+    summarizing: bool = field(default=False, compare=False, repr=False)
+    _body: str | None = field(default=None, init=False, compare=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.turns = deque(self.turns)
+        while len(self.turns) > self.max_turns:
+            self.turns.popleft()
+
+    def _evict_oldest(self) -> MemoryTurn:
+        turn = self.turns.popleft()
+        if self._body is not None:
+            # The evicted turn is always the first line of the body.
+            self._body = self._body[len(turn.line()) + 1 :]
+        return turn
 
     def remember(self, role: str, content: str) -> None:
-        self.turns.append(MemoryTurn(role=role, content=content))
-        if len(self.turns) > self.max_turns:
-            # Keep only the most recent turns to bound memory usage.
-            self.turns = self.turns[-self.max_turns :]
+        if len(self.turns) >= self.max_turns:
+            # Summaries are refreshed in the background; if they fall behind,
+            # drop the oldest unsummarized turn to bound memory usage.
+            self._evict_oldest()
+        turn = MemoryTurn(role=role, content=content)
+        self.turns.append(turn)
+        if self._body is not None:
+            self._body = f"{self._body}\n{turn.line()}" if self._body else turn.line()
+
+    @property
+    def pending_count(self) -> int:
+        """Number of turns that fell out of the verbatim window."""
+        return max(len(self.turns) - self.window_turns, 0)
+
+    def pending_turns(self) -> Iterator[MemoryTurn]:
+        """Turns waiting to be folded into the summary, oldest first."""
+        return islice(self.turns, self.pending_count)
+
+    def window(self) -> List[MemoryTurn]:
+        """The verbatim window, oldest first."""
+        return list(islice(self.turns, self.pending_count, None))
 
-    def as_dict(self) -> Dict[str, List[Dict[str, str]]]:
+    def recent_turns(self) -> Iterator[MemoryTurn]:
+        """Turns not yet covered by the summary, oldest first."""
+        return iter(self.turns)
+
+    def newest_turns(self) -> Iterator[MemoryTurn]:
+        """Turns not yet covered by the summary, newest first."""
+        return reversed(self.turns)
+
+    def needs_summary(self, min_pending: int = 1) -> bool:
+        return self.pending_count >= max(min_pending, 1) and not self.summarizing
+
+    def apply_summary(self, summary: str, folded: List[MemoryTurn]) -> None:
+        """Replace the summary after the `folded` pending turns were merged into it.
+
+        Turns are matched by identity: some of them may already have been
+        evicted while the summary was being generated.
+        """
+        folded_ids = {id(turn) for turn in folded}
+        while self.turns and id(self.turns[0]) in folded_ids:
+            self._evict_oldest()
+        self.summary = summary.strip()
+
+    def checkpoint(self) -> MemoryTurn | None:
+        """Mark the current end of the conversation for `rollback`."""
+        return self.turns[-1] if self.turns else None
+
+    def rollback(self, checkpoint: MemoryTurn | None) -> None:
+        """Drop turns remembered after `checkpoint` (e.g. a superseded reply).
+
+        Nothing is dropped if the checkpoint turn was evicted or summarized in
+        the meantime, since the turns after it can no longer be told apart.
+        """
+        if checkpoint is not None and not any(turn is checkpoint for turn in self.turns):
+            return
+        while self.turns and self.turns[-1] is not checkpoint:
+            self.turns.pop()
+            self._body = None
+
+    def as_dict(self) -> Dict[str, Any]:
         return {
             "tenant_id": self.tenant_id,
-            "turns": [turn.__dict__ for turn in self.turns],
+            "summary": self.summary,
+            "turns": [turn.as_dict() for turn in self.turns],
         }
 
     def transcript(self) -> str:
         """Return a plain-text transcript useful for prompts."""
-        return "\n".join(f"{turn.role}: {turn.content}" for turn in self.turns)
-
+        if self._body is None:
+            self._body = "\n".join(turn.line() for turn in self.turns)
+        if not self.summary:
+            return self._body
+        return f"summary: {self.summary}\n{self._body}".rstrip("\n")
@@ -0,0 +1,242 @@
+"""Token-budgeted prompt assembly for the chat pipeline."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Dict, List, Optional, Sequence
+
+from .rag_memory import MemoryState, MemoryTurn
+
+try:  # tiktoken ships with llama-index, but keep prompts working without it
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None  # type: ignore
+
+TOKEN_COUNT_KEY = "token_count"
+NO_HISTORY = "(no history)"
+NO_KNOWLEDGE = "No supporting documents were retrieved."
+
+# Per-stage input budgets (system + user prompt). Tenants can override them via
+# `prompt_budget_<stage>` inside `llm_params`.
+DEFAULT_STAGE_BUDGETS: Dict[str, int] = {
+    "classify": 800,
+    "smalltalk": 1500,
+    "compose": 4000,
+}
+# Maximum number of verbatim turns each stage may look at (None = all).
+DEFAULT_STAGE_TURNS: Dict[str, Optional[int]] = {
+    "classify": 4,
+    "smalltalk": 8,
+    "compose": None,
+}
+# Share of the free budget that the conversation may take in the compose
+# stage; retrieved snippets get the rest plus whatever history leaves unused.
+DEFAULT_COMPOSE_HISTORY_SHARE = 0.35
+# The latest user message may never take more than this share of the budget.
+_MAX_MESSAGE_SHARE = 0.5
+_CHARS_PER_TOKEN = 4
+
+
+@dataclass(frozen=True)
+class StageBudget:
+    stage: str
+    total: int
+    max_turns: Optional[int]
+    history_share: float
+
+
+def _coerce_positive_int(value: Any) -> Optional[int]:
+    try:
+        parsed = int(float(value))
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed > 0 else None
+
+
+def stage_budget(stage: str, llm_params: Optional[Dict[str, Any]] = None) -> StageBudget:
+    params = llm_params or {}
+    total = _coerce_positive_int(params.get(f"prompt_budget_{stage}")) or DEFAULT_STAGE_BUDGETS[stage]
+    max_turns = DEFAULT_STAGE_TURNS.get(stage)
+    if stage == "classify":
+        max_turns = _coerce_positive_int(params.get("classifier_history_turns")) or max_turns
+    try:
+        history_share = float(params.get("prompt_history_share", DEFAULT_COMPOSE_HISTORY_SHARE))
+    except (TypeError, ValueError):
+        history_share = DEFAULT_COMPOSE_HISTORY_SHARE
+    history_share = min(max(history_share, 0.0), 1.0)
+    return StageBudget(stage=stage, total=total, max_turns=max_turns, history_share=history_share)
+
+
+def llm_model_name(llm: Any) -> Optional[str]:
+    model = getattr(llm, "model", None)
+    if isinstance(model, str):
+        return model
+    metadata = getattr(llm, "metadata", None)
+    model = getattr(metadata, "model_name", None)
+    return model if isinstance(model, str) else None
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    try:
+        if model:
+            return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception:  # pragma: no cover - encoding download failures
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:  # pragma: no cover - encoding download failures
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Count tokens with the model's tokenizer, estimating when unavailable."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return max(1, len(text) // _CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, limit: int, model: Optional[str] = None) -> str:
+    if limit <= 0:
+        return ""
+    encoding = _encoding(model)
+    if encoding is None:
+        max_chars = limit * _CHARS_PER_TOKEN
+        return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= limit:
+        return text
+    return encoding.decode(tokens[:limit]).rstrip() + "…"
+
+
+def turn_tokens(turn: MemoryTurn, model: Optional[str] = None) -> int:
+    """Token count of a transcript line, cached on the turn after the first call."""
+    if turn.tokens < 0 or turn.token_model != model:
+        turn.tokens = count_tokens(turn.line(), model)
+        turn.token_model = model
+    return turn.tokens
+
+
+def pack_history(
+    memory: MemoryState,
+    budget: int,
+    *,
+    model: Optional[str] = None,
+    max_turns: Optional[int] = None,
+    include_summary: bool = True,
+) -> str:
+    """Return the rolling summary plus the most recent turns that fit into `budget` tokens.
+
+    The summary may take at most half of the budget; turns are added from the
+    newest backwards and returned oldest first.
+    """
+    turns = memory.newest_turns()
+    if max_turns is not None:
+        turns = islice(turns, max(max_turns, 0))
+
+    header: List[str] = []
+    used = 0
+    if include_summary and memory.summary:
+        summary_line = f"Summary of earlier conversation: {memory.summary}"
+        summary_line = truncate_to_tokens(summary_line, budget // 2, model)
+        if summary_line:
+            header.append(summary_line)
+            used += count_tokens(summary_line, model) + 1
+
+    lines: List[str] = []
+    for turn in turns:
+        cost = turn_tokens(turn, model) + 1
+        if used + cost > budget:
+            remaining = budget - used
+            if not lines and remaining > 0:
+                # Always keep a trimmed version of the latest turn for context.
+                lines.append(truncate_to_tokens(turn.line(), remaining, model))
+            break
+        lines.append(turn.line())
+        used += cost
+    lines.reverse()
+    return "\n".join(header + lines)
+
+
+def _node_text(node: Any) -> str:
+    inner = getattr(node, "node", node)
+    try:
+        return inner.get_content()
+    except AttributeError:
+        return str(inner)
+
+
+def _node_tokens(node: Any, text: str, model: Optional[str]) -> int:
+    inner = getattr(node, "node", node)
+    metadata = getattr(inner, "metadata", None) or {}
+    stored = _coerce_positive_int(metadata.get(TOKEN_COUNT_KEY))
+    return stored if stored is not None else count_tokens(text, model)
+
+
+def pack_snippets(
+    nodes: Sequence[Any],
+    budget: int,
+    *,
+    model: Optional[str] = None,
+) -> str:
+    """Pack retrieved nodes in rank order, skipping those that no longer fit.
+
+    Uses the token counts stored on each chunk at ingest time, so packing does
+    not re-tokenize the retrieved text.
+    """
+    blocks: List[str] = []
+    used = 0
+    for idx, node in enumerate(nodes):
+        score = getattr(node, "score", None)
+        score_label = f"{score:.2f}" if isinstance(score, (int, float)) else "n/a"
+        header = f"Source {idx + 1} (score={score_label}):\n"
+        text = _node_text(node)
+        cost = _node_tokens(node, text, model) + count_tokens(header, model) + 2
+        if used + cost > budget:
+            remaining = budget - used - count_tokens(header, model) - 2
+            if not blocks and remaining > 0:
+                blocks.append(header + truncate_to_tokens(text, remaining, model))
+                used = budget
+            # A smaller, lower-ranked snippet may still fit.
+            continue
+        blocks.append(header + text)
+        used += cost
+    return "\n\n".join(blocks)
+
+
+def fit_message(message: str, budget: StageBudget, *, model: Optional[str] = None) -> str:
+    return truncate_to_tokens(message, int(budget.total * _MAX_MESSAGE_SHARE), model)
+
+
+def remaining_budget(budget: StageBudget, *fixed_parts: str, model: Optional[str] = None) -> int:
+    used = sum(count_tokens(part, model) for part in fixed_parts if part)
+    return max(budget.total - used, 0)
+
+
+def log_prompt_tokens(
+    stage: str,
+    system_prompt: str,
+    user_prompt: str,
+    *,
+    model: Optional[str] = None,
+    budget: Optional[StageBudget] = None,
+) -> int:
+    system_tokens = count_tokens(system_prompt, model)
+    user_tokens = count_tokens(user_prompt, model)
+    total = system_tokens + user_tokens
+    limit = budget.total if budget else "n/a"
+    print(
+        f"🧮 Prompt tokens [{stage}]: system={system_tokens} user={user_tokens} "
+        f"total={total} budget={limit}"
+    )
+    return total
+
@@ -0,0 +1,351 @@
+"""Conversation session store: bounded LRU+TTL tier with optional shared backing.
+
+Sessions are keyed by (tenant id, Chatwoot conversation id) so two Chatwoot
+accounts can never see each other's history. The in-process tier is bounded
+by `SESSION_MAX_ENTRIES` and expires idle sessions after `SESSION_TTL_SECONDS`.
+
+Set `SESSION_BACKEND=REDIS` or `SESSION_BACKEND=POSTGRES` to share sessions
+between uvicorn workers and survive restarts. Writes are buffered and
+flushed every `SESSION_FLUSH_INTERVAL_SECONDS` (write-behind); with a shared
+backend, local copies are re-read after `SESSION_LOCAL_TTL_SECONDS` so a
+conversation that moves between workers picks up the latest state.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol, Tuple
+
+from aiocache.serializers import NullSerializer
+
+from app.db.cache import CACHE_NAMESPACE, create_cache
+from app.db.repository import (
+    delete_expired_bot_sessions,
+    ensure_bot_sessions_table,
+    get_bot_session,
+    save_bot_sessions,
+)
+
+from .rag_memory import MemoryState, MemoryTurn
+
+SessionKey = Tuple[int, int]
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "MEMORY").upper()
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 60 * 60)))
+SESSION_LOCAL_TTL_SECONDS = int(os.getenv("SESSION_LOCAL_TTL_SECONDS", "60"))
+SESSION_FLUSH_INTERVAL_SECONDS = float(os.getenv("SESSION_FLUSH_INTERVAL_SECONDS", "2"))
+SESSION_HYDRATE_TIMEOUT_SECONDS = float(os.getenv("SESSION_HYDRATE_TIMEOUT_SECONDS", "1.5"))
+# How often the Postgres backend deletes expired rows.
+_EXPIRE_INTERVAL_SECONDS = 15 * 60
+
+# --- Compact serialization -------------------------------------------------
+_FORMAT_JSON = b"\x01"
+_FORMAT_ZLIB = b"\x02"
+_COMPRESS_ABOVE = 512
+_ROLE_CODES = {"user": "u", "assistant": "a"}
+_CODE_ROLES = {code: role for role, code in _ROLE_CODES.items()}
+
+
+def dump_state(state: MemoryState) -> bytes:
+    """Serialize a session as compact JSON, zlib-compressed when it pays off."""
+    turns = [[_ROLE_CODES.get(turn.role, turn.role), turn.content] for turn in state.turns]
+    raw = json.dumps(
+        [state.tenant_id, state.summary, turns],
+        separators=(",", ":"),
+        ensure_ascii=False,
+    ).encode("utf-8")
+    if len(raw) > _COMPRESS_ABOVE:
+        return _FORMAT_ZLIB + zlib.compress(raw, 1)
+    return _FORMAT_JSON + raw
+
+
+def load_state(payload: bytes) -> MemoryState:
+    marker, body = payload[:1], payload[1:]
+    if marker == _FORMAT_ZLIB:
+        body = zlib.decompress(body)
+    elif marker != _FORMAT_JSON:
+        raise ValueError("Unknown session payload format.")
+    tenant_id, summary, turns = json.loads(body)
+    return MemoryState(
+        tenant_id=tenant_id,
+        summary=summary or "",
+        turns=[MemoryTurn(role=_CODE_ROLES.get(role, role), content=content) for role, content in turns],
+    )
+
+
+def session_key_str(key: SessionKey) -> str:
+    tenant_id, conversation_id = key
+    return f"{tenant_id}:{conversation_id}"
+
+
+# --- Shared backends -------------------------------------------------------
+class SessionBackend(Protocol):
+    async def start(self) -> None: ...
+
+    async def load(self, key: SessionKey) -> Optional[bytes]: ...
+
+    async def save_many(self, payloads: Dict[SessionKey, bytes], ttl_seconds: int) -> None: ...
+
+    async def expire(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class RedisSessionBackend:
+    def __init__(self) -> None:
+        self._cache = create_cache(
+            f"{CACHE_NAMESPACE}:sessions",
+            backend="REDIS",
+            serializer=NullSerializer(encoding=None),
+        )
+
+    async def start(self) -> None:
+        return None
+
+    async def load(self, key: SessionKey) -> Optional[bytes]:
+        return await self._cache.get(session_key_str(key))
+
+    async def save_many(self, payloads: Dict[SessionKey, bytes], ttl_seconds: int) -> None:
+        pairs = [(session_key_str(key), payload) for key, payload in payloads.items()]
+        await self._cache.multi_set(pairs, ttl=ttl_seconds)
+
+    async def expire(self) -> None:
+        return None  # Redis expires keys on its own.
+
+    async def close(self) -> None:
+        await self._cache.close()
+
+
+class PostgresSessionBackend:
+    async def start(self) -> None:
+        await ensure_bot_sessions_table()
+
+    async def load(self, key: SessionKey) -> Optional[bytes]:
+        return await get_bot_session(session_key_str(key))
+
+    async def save_many(self, payloads: Dict[SessionKey, bytes], ttl_seconds: int) -> None:
+        rows = [
+            {"session_key": session_key_str(key), "tenant_id": key[0], "payload": payload}
+            for key, payload in payloads.items()
+        ]
+        await save_bot_sessions(rows, ttl_seconds)
+
+    async def expire(self) -> None:
+        deleted = await delete_expired_bot_sessions()
+        if deleted:
+            print(f"🧹 Expired {deleted} conversation session(s)")
+
+    async def close(self) -> None:
+        return None
+
+
+def _backend_from_env(name: str) -> Optional[SessionBackend]:
+    if name == "REDIS":
+        return RedisSessionBackend()
+    if name == "POSTGRES":
+        return PostgresSessionBackend()
+    return None
+
+
+# --- Store -------------------------------------------------------------------
+@dataclass(slots=True)
+class _Entry:
+    state: MemoryState
+    expires_at: float
+
+
+class ConversationStore:
+    def __init__(
+        self,
+        *,
+        backend: Optional[SessionBackend] = None,
+        max_entries: int = SESSION_MAX_ENTRIES,
+        ttl_seconds: int = SESSION_TTL_SECONDS,
+        local_ttl_seconds: int = SESSION_LOCAL_TTL_SECONDS,
+        flush_interval: float = SESSION_FLUSH_INTERVAL_SECONDS,
+    ) -> None:
+        self._backend = backend
+        self._max_entries = max(max_entries, 1)
+        self._ttl_seconds = ttl_seconds
+        # Local copies of shared sessions are only trusted for a short while.
+        self._local_ttl = min(ttl_seconds, local_ttl_seconds) if backend else ttl_seconds
+        self._flush_interval = flush_interval
+        self._entries: "OrderedDict[SessionKey, _Entry]" = OrderedDict()
+        self._dirty: Dict[SessionKey, MemoryState] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._hydrations: Dict[SessionKey, asyncio.Task] = {}
+        self._last_expire = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self._backend).__name__ if self._backend else "memory",
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "dirty": len(self._dirty),
+        }
+
+    def _insert(self, key: SessionKey, state: MemoryState) -> None:
+        self._entries[key] = _Entry(state=state, expires_at=time.monotonic() + self._local_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            # Dirty sessions stay in `_dirty` until the next flush persists them.
+            self._entries.popitem(last=False)
+
+    def _sweep(self) -> None:
+        # Every access refreshes the expiry and moves the entry to the end, so
+        # the oldest entries (and the first to expire) are at the front.
+        now = time.monotonic()
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now:
+                break
+            self._entries.popitem(last=False)
+
+    async def get(self, key: SessionKey) -> Optional[MemoryState]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                entry.expires_at = time.monotonic() + self._local_ttl
+                self._entries.move_to_end(key)
+                return entry.state
+            del self._entries[key]
+
+        state = self._dirty.get(key)
+        if state is None and self._backend is not None:
+            try:
+                payload = await self._backend.load(key)
+            except Exception as exc:
+                print(f"⚠️ Failed to load conversation session {session_key_str(key)}: {exc}")
+                payload = None
+            if payload:
+                try:
+                    state = load_state(payload)
+                except (ValueError, zlib.error, json.JSONDecodeError) as exc:
+                    print(f"⚠️ Discarding unreadable conversation session {session_key_str(key)}: {exc}")
+        if state is not None:
+            self._insert(key, state)
+        return state
+
+    def hydrate(
+        self,
+        key: SessionKey,
+        loader: Callable[[], Awaitable[Optional[MemoryState]]],
+    ) -> asyncio.Task:
+        """Start (or join) a background rebuild of a missing session.
+
+        Concurrent callers for the same conversation share one loader call.
+        The result is cached; turns stored in the meantime are kept after it.
+        """
+        task = self._hydrations.get(key)
+        if task is not None:
+            return task
+
+        async def _run() -> Optional[MemoryState]:
+            try:
+                state = await self.get(key)
+                if state is not None:
+                    return state
+                state = await loader()
+                if state is not None:
+                    # A reply that gave up waiting may have stored its turns
+                    # meanwhile; they go after the loaded history.
+                    state = self.put_merged(key, state, newer=True)
+                return state
+            finally:
+                self._hydrations.pop(key, None)
+
+        task = asyncio.create_task(_run())
+        self._hydrations[key] = task
+        return task
+
+    async def wait_hydrated(
+        self,
+        task: asyncio.Task,
+        timeout: float = SESSION_HYDRATE_TIMEOUT_SECONDS,
+    ) -> Optional[MemoryState]:
+        """Wait at most `timeout` seconds for a hydration; never raises."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            print(f"⏱️ Session hydration still running after {timeout:.1f}s; continuing without history")
+        except Exception as exc:
+            print(f"⚠️ Session hydration failed: {exc}")
+        return None
+
+    def put(self, key: SessionKey, state: MemoryState) -> None:
+        self._insert(key, state)
+        if self._backend is not None:
+            self._dirty[key] = state
+
+    def put_merged(self, key: SessionKey, state: MemoryState, *, newer: bool = False) -> MemoryState:
+        """Store `state` without losing a session stored for `key` meanwhile.
+
+        `state` was built without the stored session (its history had not been
+        hydrated yet, or it is that history). The turns of whichever is newer
+        are appended to the older one; returns the session now stored.
+        """
+        entry = self._entries.get(key)
+        present = entry.state if entry is not None else self._dirty.get(key)
+        if present is not None and present is not state:
+            older, later = (state, present) if newer else (present, state)
+            for turn in later.turns:
+                older.remember(turn.role, turn.content)
+            state = older
+        self.put(key, state)
+        return state
+
+    async def flush(self) -> None:
+        """Persist buffered writes to the shared backend."""
+        self._sweep()
+        if self._backend is None or not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            payloads = {key: dump_state(state) for key, state in batch.items()}
+            await self._backend.save_many(payloads, self._ttl_seconds)
+        except Exception as exc:
+            print(f"⚠️ Failed to persist {len(batch)} conversation session(s): {exc}")
+            for key, state in batch.items():
+                self._dirty.setdefault(key, state)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush()
+            if self._backend is not None and time.monotonic() - self._last_expire > _EXPIRE_INTERVAL_SECONDS:
+                self._last_expire = time.monotonic()
+                try:
+                    await self._backend.expire()
+                except Exception as exc:
+                    print(f"⚠️ Failed to expire conversation sessions: {exc}")
+
+    async def start(self) -> None:
+        if self._backend is not None:
+            await self._backend.start()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self._backend is not None:
+            await self._backend.close()
+
+
+conversation_store = ConversationStore(backend=_backend_from_env(SESSION_BACKEND))
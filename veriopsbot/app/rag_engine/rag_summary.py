@@ -0,0 +1,104 @@
+"""Rolling conversation summaries maintained outside the request path."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+
+from .rag_llm import chat_completion
+from .rag_memory import MemoryState
+from .rag_prompt import count_tokens, llm_model_name, truncate_to_tokens, turn_tokens
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SUMMARY_MAX_TOKENS = 250
+# Evicted turns are folded in batches to avoid one extra LLM call per message.
+DEFAULT_SUMMARY_BATCH_TURNS = 4
+# Cap on the evicted turns sent in a single refresh so the summarization
+# prompt stays small even when a refresh was skipped for a while.
+_MAX_TURN_TOKENS = 1500
+
+_BACKGROUND_TASKS: Set[asyncio.Task] = set()
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a customer support conversation. "
+    "Merge the new turns into the existing summary. Keep facts the assistant may need later: "
+    "the user's name, goals, products, order or invoice numbers, problems reported and answers already given. "
+    "Drop greetings and filler. Write in the conversation's language, as short plain sentences."
+)
+
+
+def _positive_param(llm_params: Optional[Dict[str, Any]], key: str, default: int) -> int:
+    try:
+        value = int((llm_params or {}).get(key, default))
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+async def refresh_summary(
+    llm: Any,
+    memory: MemoryState,
+    *,
+    llm_params: Optional[Dict[str, Any]] = None,
+) -> bool:
+    """Fold the pending (evicted) turns into the rolling summary.
+
+    Only the turns present when the refresh starts are folded, so turns that
+    arrive while the LLM call is running stay pending for the next refresh.
+    """
+    if not memory.needs_summary() or llm is None:
+        return False
+
+    memory.summarizing = True
+    try:
+        model = llm_model_name(llm)
+        max_tokens = _positive_param(llm_params, "summary_max_tokens", DEFAULT_SUMMARY_MAX_TOKENS)
+        folded = []
+        lines = []
+        used = 0
+        for turn in memory.pending_turns():
+            cost = turn_tokens(turn, model)
+            if folded and used + cost > _MAX_TURN_TOKENS:
+                break
+            folded.append(turn)
+            lines.append(truncate_to_tokens(turn.line(), _MAX_TURN_TOKENS, model))
+            used += cost
+
+        user_prompt = (
+            f"Existing summary:\n{memory.summary or '(empty)'}\n\n"
+            "New turns:\n" + "\n".join(lines) + "\n\n"
+            f"Return the updated summary in at most {max_tokens} tokens."
+        )
+        summary = await chat_completion(llm, user_prompt, system_prompt=SUMMARY_SYSTEM_PROMPT)
+        summary = truncate_to_tokens(summary.strip(), max_tokens, model)
+        if not summary:
+            return False
+        memory.apply_summary(summary, folded)
+        print(
+            f"🧾 Conversation summary refreshed: folded={len(folded)} "
+            f"tokens={count_tokens(summary, model)}"
+        )
+        return True
+    except Exception as exc:  # pragma: no cover - LLM failures are runtime concerns
+        _LOGGER.warning("Conversation summary refresh failed: %s", exc)
+        return False
+    finally:
+        memory.summarizing = False
+
+
+def schedule_summary_refresh(
+    llm: Any,
+    memory: MemoryState,
+    *,
+    llm_params: Optional[Dict[str, Any]] = None,
+) -> Optional[asyncio.Task]:
+    """Run `refresh_summary` as a fire-and-forget task once enough turns are pending."""
+    batch_turns = _positive_param(llm_params, "summary_batch_turns", DEFAULT_SUMMARY_BATCH_TURNS)
+    if not memory.needs_summary(batch_turns) or llm is None:
+        return None
+    task = asyncio.create_task(refresh_summary(llm, memory, llm_params=llm_params))
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
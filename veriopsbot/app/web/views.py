@@ -9,10 +9,10 @@ from urllib.parse import urlencode
 
 import bcrypt
 from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile, status
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
-from app.controller import rag_docs, rag_ingest
+from app.controller import rag_docs, rag_faq, rag_ingest
 from app.db.repository import (
     create_user,
     get_params_by_tenant_id,
@@ -25,6 +25,7 @@ from app.db.repository import (
     update_omnichannel_settings,
     update_user_account,
 )
+from app.rag_engine.rag_faq import FAQ_MAX_ENTRIES
 
 router = APIRouter()
 
@@ -102,6 +103,7 @@ def _log(event: str, **fields: Any) -> None:
         "files": "📂",
         "form": "📮",
         "ingest": "🧪",
+        "faq": "⚡",
     }.get(event, "🔹")
     payload = {k: _safe_value(k, v) for k, v in fields.items()}
     try:
@@ -114,17 +116,25 @@ def _log(event: str, **fields: Any) -> None:
 # Internal helpers (unchanged, with logs)
 # =========================
 
-def _redirect_documents(**params: str | None) -> RedirectResponse:
+def _redirect_settings_section(section: str, **params: str | None) -> RedirectResponse:
     final_params = {key: value for key, value in params.items() if value}
     query = urlencode(final_params)
     base_url = "/settings"
     if query:
         base_url = f"{base_url}?{query}"
-    url = f"{base_url}#documents"
-    _log("info", action="redirect_documents", url=url, params=final_params)
+    url = f"{base_url}#{section}"
+    _log("info", action=f"redirect_{section}", url=url, params=final_params)
     return RedirectResponse(url=url, status_code=status.HTTP_303_SEE_OTHER)
 
 
+def _redirect_documents(**params: str | None) -> RedirectResponse:
+    return _redirect_settings_section("documents", **params)
+
+
+def _redirect_faq(**params: str | None) -> RedirectResponse:
+    return _redirect_settings_section("faq", **params)
+
+
 def _get_session(request: Request) -> Dict[str, Any] | None:
     token = request.cookies.get(SESSION_COOKIE_NAME)
     has_token = bool(token)
@@ -212,7 +222,17 @@ def _build_documents_context(session: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def _settings_template_context(
+async def _build_faq_context(session: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        faq_rows = await rag_faq.list_faq(session["tenant_id"])
+        _log("db", action="list_faq", tenant_id=session["tenant_id"], count=len(faq_rows))
+    except Exception as exc:  # pragma: no cover - defensive
+        _log("error", action="list_faq", error=str(exc))
+        faq_rows = []
+    return {"faq_rows": faq_rows, "faq_max_entries": FAQ_MAX_ENTRIES}
+
+
+async def _settings_template_context(
     request: Request,
     session: Dict[str, Any],
     form_values: Dict[str, str],
@@ -238,6 +258,7 @@ def _settings_template_context(
         "cross_encoder_options": CROSS_ENCODER_OPTIONS,
     }
     context.update(_build_documents_context(session))
+    context.update(await _build_faq_context(session))
     return context
 
 
@@ -566,7 +587,7 @@ async def settings_page(request: Request):
     _log("exit", route="GET /settings", template="settings.html")
     return templates.TemplateResponse(
         "settings.html",
-        _settings_template_context(
+        await _settings_template_context(
             request,
             session,
             form_values,
@@ -690,7 +711,7 @@ async def update_settings(request: Request):
         _log("warn", route="POST /settings", errors=errors)
         return templates.TemplateResponse(
             "settings.html",
-            _settings_template_context(
+            await _settings_template_context(
                 request,
                 session,
                 form_values,
@@ -800,7 +821,7 @@ async def update_settings(request: Request):
     _log("exit", route="POST /settings", status="success")
     return templates.TemplateResponse(
         "settings.html",
-        _settings_template_context(
+        await _settings_template_context(
             request,
             session,
             refreshed_form_values,
@@ -1049,7 +1070,7 @@ async def update_account_settings(request: Request):
         _log("warn", route="POST /settings/account", errors=errors)
         return templates.TemplateResponse(
             "settings.html",
-            _settings_template_context(
+            await _settings_template_context(
                 request,
                 session,
                 form_values,
@@ -1074,7 +1095,7 @@ async def update_account_settings(request: Request):
         errors.append("Unable to update account. Please try again.")
         return templates.TemplateResponse(
             "settings.html",
-            _settings_template_context(
+            await _settings_template_context(
                 request,
                 session,
                 form_values,
@@ -1090,7 +1111,7 @@ async def update_account_settings(request: Request):
     _log("exit", route="POST /settings/account", status="success")
     return templates.TemplateResponse(
         "settings.html",
-        _settings_template_context(
+        await _settings_template_context(
             request,
             session,
             form_values,
@@ -1192,6 +1213,13 @@ async def documents_delete_files(
         _log("warn", action="delete_files", reason="no matching files")
         return _redirect_documents(error="No matching files found to delete.")
 
+    try:
+        removed_nodes = await rag_ingest.remove_documents(session["tenant_id"], deleted, folder_name)
+        _log("ingest", action="remove_documents", folder=folder_name, nodes=removed_nodes)
+    except Exception as exc:  # pragma: no cover - defensive
+        # The files are gone either way; the next ingest drops their vectors.
+        _log("error", action="remove_documents", error=str(exc))
+
     message = f"Deleted {len(deleted)} file(s) from '{folder_name}'."
     _log("exit", route="POST /documents/files/delete", message=message)
     return _redirect_documents(message=message)
@@ -1226,10 +1254,133 @@ async def documents_ingest(request: Request):
         _log("error", route="POST /documents/ingest", error=str(exc))
         return _redirect_documents(error=str(exc))
 
-    ingested = result.get("documents_ingested")
-    message = f"Number of ingested documents: {engested}" if (engested := result.get("documents_ingested")) is not None else "Ingest completed."
+    message = f"Knowledge base refresh queued (job #{result['job_id']}). Progress is shown below."
     _log("exit", route="POST /documents/ingest", message=message)
     return _redirect_documents(message=message)
 
 
+@router.get("/documents/ingest/status")
+async def documents_ingest_status(request: Request):
+    session = _get_session(request)
+    if not session:
+        return JSONResponse({"detail": "Not authenticated."}, status_code=status.HTTP_401_UNAUTHORIZED)
+    return {"job": await rag_ingest.latest_ingest_job(session["tenant_id"])}
+
+
+@router.post("/documents/ingest/cancel")
+async def documents_ingest_cancel(request: Request, job_id: int = Form(...)):
+    _log("enter", route="POST /documents/ingest/cancel")
+    session = _get_session(request)
+    if not session:
+        _log("warn", route="POST /documents/ingest/cancel", reason="no session -> redirect /login")
+        return RedirectResponse(
+            url="/login",
+            status_code=status.HTTP_303_SEE_OTHER,
+        )
+
+    try:
+        result = await rag_ingest.cancel_ingest(job_id, tenant_id=session["tenant_id"])
+        _log("ingest", action="cancel_ingest", result=_safe_map(result))
+    except HTTPException as exc:
+        detail = str(exc.detail) if exc.detail else "Failed to cancel the ingest."
+        _log("warn", route="POST /documents/ingest/cancel", http_error=detail)
+        return _redirect_documents(error=detail)
+
+    message = f"Cancelling knowledge base refresh (job #{job_id})."
+    _log("exit", route="POST /documents/ingest/cancel", message=message)
+    return _redirect_documents(message=message)
+
+
+@router.post("/faq/save")
+async def faq_save(
+    request: Request,
+    question: str = Form(""),
+    answer: str = Form(""),
+    entry_id: str = Form(""),
+):
+    _log("enter", route="POST /faq/save")
+    session = _get_session(request)
+    if not session:
+        _log("warn", route="POST /faq/save", reason="no session -> redirect /login")
+        return RedirectResponse(
+            url="/login",
+            status_code=status.HTTP_303_SEE_OTHER,
+        )
+
+    target_id = int(entry_id) if entry_id.strip().isdigit() else None
+    try:
+        result = await rag_faq.save_faq_entry(
+            session["tenant_id"],
+            rag_faq.FaqEntry(question=question, answer=answer),
+            target_id,
+        )
+        _log("faq", action="save_faq_entry", result=_safe_map(result))
+    except HTTPException as exc:
+        detail = str(exc.detail) if exc.detail else "Failed to save the FAQ entry."
+        _log("error", route="POST /faq/save", http_error=detail)
+        return _redirect_faq(error=detail)
+
+    message = "FAQ entry updated." if target_id else "FAQ entry added."
+    _log("exit", route="POST /faq/save", message=message)
+    return _redirect_faq(message=message)
+
+
+@router.post("/faq/delete")
+async def faq_delete(
+    request: Request,
+    selected_faq: list[int] = Form([]),
+):
+    _log("enter", route="POST /faq/delete")
+    session = _get_session(request)
+    if not session:
+        _log("warn", route="POST /faq/delete", reason="no session -> redirect /login")
+        return RedirectResponse(
+            url="/login",
+            status_code=status.HTTP_303_SEE_OTHER,
+        )
+
+    try:
+        result = await rag_faq.delete_faq(session["tenant_id"], selected_faq)
+        _log("faq", action="delete_faq", result=_safe_map(result))
+    except HTTPException as exc:
+        detail = str(exc.detail) if exc.detail else "Failed to delete FAQ entries."
+        _log("warn", route="POST /faq/delete", http_error=detail)
+        return _redirect_faq(error=detail)
+
+    message = f"Deleted {result['deleted']} FAQ entr{'y' if result['deleted'] == 1 else 'ies'}."
+    _log("exit", route="POST /faq/delete", message=message)
+    return _redirect_faq(message=message)
+
+
+@router.post("/faq/import")
+async def faq_import(
+    request: Request,
+    file: UploadFile = File(...),
+    replace: bool = Form(False),
+):
+    _log("enter", route="POST /faq/import")
+    session = _get_session(request)
+    if not session:
+        _log("warn", route="POST /faq/import", reason="no session -> redirect /login")
+        return RedirectResponse(
+            url="/login",
+            status_code=status.HTTP_303_SEE_OTHER,
+        )
+
+    _log("faq", action="incoming_import", file=file.filename, replace=replace)
+    try:
+        result = await rag_faq.import_faq_csv(session["tenant_id"], await file.read(), replace=replace)
+        _log("faq", action="import_faq_csv", result=_safe_map(result))
+    except HTTPException as exc:
+        detail = str(exc.detail) if exc.detail else "Failed to import the FAQ."
+        _log("error", route="POST /faq/import", http_error=detail)
+        return _redirect_faq(error=detail)
+
+    message = f"Imported {result['imported']} FAQ entr{'y' if result['imported'] == 1 else 'ies'}."
+    if replace:
+        message += " Previous entries were replaced."
+    _log("exit", route="POST /faq/import", message=message)
+    return _redirect_faq(message=message)
+
+
 __all__ = ["router"]
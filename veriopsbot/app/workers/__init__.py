@@ -0,0 +1 @@
+"""Background workers started with the FastAPI lifespan."""
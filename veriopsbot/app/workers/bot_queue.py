@@ -0,0 +1,265 @@
+"""Durable queue and async worker pool for Chatwoot bot messages.
+
+`/bot` only validates and inserts a row into `bot_jobs`, so Chatwoot gets its
+200 straight away. Workers claim jobs with `FOR UPDATE SKIP LOCKED`, which
+lets several uvicorn processes share the queue without double processing.
+A job whose worker died is picked up again once its lease expires.
+Enqueues wake the workers of every process through `pg_notify`, and retries
+through a local timer, so the poll only matters as a slow fallback.
+
+Messages are serialized per conversation: only the oldest open job of a
+conversation can be claimed. Quick bursts ("hi" / "I have a problem" /
+"with my invoice") are merged into one job during `BOT_DEBOUNCE_SECONDS`,
+and a message arriving while its conversation is being answered cancels
+that generation and is answered together with it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from app.chatwoot.outbox import backoff_delay, chatwoot_outbox, deliverable_rows
+from app.db.repository import (
+    cancel_bot_job,
+    claim_bot_job,
+    complete_bot_job,
+    count_ready_bot_jobs,
+    delete_finished_bot_jobs,
+    enqueue_bot_job,
+    ensure_bot_queue_tables,
+    fail_bot_job,
+    finish_bot_job,
+    retry_bot_job,
+)
+from app.db.notifications import CHANNEL_BOT_JOB_CANCEL, CHANNEL_BOT_JOBS, database_listener
+from app.metrics import metrics
+
+# Queues the job's Chatwoot calls; returns False when the job was superseded.
+Deliver = Callable[[List[Dict[str, Any]]], Awaitable[bool]]
+BotJobHandler = Callable[[Dict[str, Any], Deliver], Awaitable[Dict[str, Any]]]
+
+BOT_WORKER_CONCURRENCY = int(os.getenv("BOT_WORKER_CONCURRENCY", "4"))
+BOT_JOB_POLL_SECONDS = float(os.getenv("BOT_JOB_POLL_SECONDS", "10"))
+BOT_JOB_MAX_ATTEMPTS = int(os.getenv("BOT_JOB_MAX_ATTEMPTS", "3"))
+BOT_JOB_LEASE_SECONDS = int(os.getenv("BOT_JOB_LEASE_SECONDS", "300"))
+BOT_WORKER_SHUTDOWN_SECONDS = float(os.getenv("BOT_WORKER_SHUTDOWN_SECONDS", "10"))
+BOT_DEBOUNCE_SECONDS = float(os.getenv("BOT_DEBOUNCE_SECONDS", "1.5"))
+BOT_DEBOUNCE_MAX_SECONDS = float(os.getenv("BOT_DEBOUNCE_MAX_SECONDS", "6"))
+_RETRY_BACKOFF_SECONDS = 5.0
+_RETRY_BACKOFF_MAX_SECONDS = 120.0
+_MONITOR_INTERVAL_SECONDS = 5.0
+_CLEANUP_INTERVAL_SECONDS = 15 * 60
+_FINISHED_RETENTION_SECONDS = 3 * 24 * 60 * 60
+
+
+def merge_payloads(older: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold a newer webhook payload into a pending one for the same conversation."""
+    merged = dict(newer)
+    merged["content"] = "\n".join(
+        part for part in ((older.get("content") or "").strip(), (newer.get("content") or "").strip()) if part
+    )
+    message_ids = list(older.get("merged_message_ids") or [older.get("id")])
+    message_ids.append(newer.get("id"))
+    merged["merged_message_ids"] = [message_id for message_id in message_ids if message_id is not None]
+    return merged
+
+
+class BotJobQueue:
+    def __init__(
+        self,
+        *,
+        concurrency: int = BOT_WORKER_CONCURRENCY,
+        poll_interval: float = BOT_JOB_POLL_SECONDS,
+        max_attempts: int = BOT_JOB_MAX_ATTEMPTS,
+        lease_seconds: int = BOT_JOB_LEASE_SECONDS,
+        debounce_seconds: float = BOT_DEBOUNCE_SECONDS,
+        max_debounce_seconds: float = BOT_DEBOUNCE_MAX_SECONDS,
+    ) -> None:
+        self._concurrency = max(concurrency, 1)
+        self._poll_interval = poll_interval
+        self._max_attempts = max(max_attempts, 1)
+        self._lease_seconds = lease_seconds
+        self._debounce_seconds = max(debounce_seconds, 0.0)
+        self._max_debounce_seconds = max(max_debounce_seconds, self._debounce_seconds)
+        self._handler: Optional[BotJobHandler] = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._workers: List[asyncio.Task] = []
+        self._monitor_task: Optional[asyncio.Task] = None
+        self._busy = 0
+        self._last_cleanup = 0.0
+        # Jobs running in this process, so a newer message can cancel them
+        # without waiting for the cancel poll.
+        self._running: Dict[int, asyncio.Task] = {}
+        self._superseded: Set[int] = set()
+
+    async def enqueue(self, payload: Dict[str, Any]) -> Optional[int]:
+        """Queue a webhook payload; returns None when its message was already queued."""
+        result = await enqueue_bot_job(
+            account_id=int(payload["account"]["id"]),
+            conversation_id=int(payload["conversation"]["id"]),
+            message_id=payload.get("id"),
+            payload=payload,
+            debounce_seconds=self._debounce_seconds,
+            max_debounce_seconds=self._max_debounce_seconds,
+            merge=merge_payloads,
+        )
+        if result["duplicate"]:
+            return None
+        if result["merged"]:
+            metrics.incr("bot_jobs_merged")
+        else:
+            metrics.incr("bot_jobs_enqueued")
+        superseded = result["superseded_job_id"]
+        if superseded is not None:
+            metrics.incr("bot_jobs_superseded")
+            self._cancel_local(superseded)
+        self._on_enqueued("")
+        return result["job_id"]
+
+    def _on_enqueued(self, _payload: str) -> None:
+        """Wake the workers once a job queued here or in another process is due."""
+        if self._debounce_seconds:
+            asyncio.get_running_loop().call_later(self._debounce_seconds, self._wake.set)
+        else:
+            self._wake.set()
+
+    def _on_cancel_requested(self, payload: str) -> None:
+        """Stop a job another process superseded, if it runs here."""
+        if payload.isdigit():
+            self._cancel_local(int(payload))
+
+    def _cancel_local(self, job_id: int) -> None:
+        task = self._running.get(job_id)
+        if task is not None and not task.done():
+            self._superseded.add(job_id)
+            task.cancel()
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        metrics.observe("bot_job_wait_seconds", float(job["wait_seconds"] or 0))
+        self._busy += 1
+        metrics.gauge("bot_workers_busy", self._busy)
+        started = time.perf_counter()
+
+        async def deliver(rows: List[Dict[str, Any]]) -> bool:
+            rows = deliverable_rows(rows)
+            if not await finish_bot_job(job_id, rows):
+                self._superseded.add(job_id)
+                return False
+            chatwoot_outbox.notify(len(rows))
+            return True
+
+        task = asyncio.create_task(self._handler(job["payload"], deliver))
+        self._running[job_id] = task
+        try:
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                if job_id not in self._superseded:
+                    raise
+                result = None
+            if job_id in self._superseded:
+                metrics.incr("bot_jobs_cancelled")
+                print(f"⏭️ Bot job {job_id} superseded by a newer message")
+                await cancel_bot_job(job_id)
+            else:
+                metrics.incr("bot_jobs_done")
+                print(f"✅ Bot job {job_id} done: {(result or {}).get('message')}")
+                await complete_bot_job(job_id)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            attempts = int(job["attempts"])
+            if attempts >= self._max_attempts:
+                metrics.incr("bot_jobs_failed")
+                print(f"❌ Bot job {job_id} failed after {attempts} attempts: {error}")
+                await fail_bot_job(job_id, error)
+            else:
+                delay = backoff_delay(attempts, _RETRY_BACKOFF_SECONDS, _RETRY_BACKOFF_MAX_SECONDS)
+                metrics.incr("bot_jobs_retried")
+                print(f"⚠️ Bot job {job_id} failed ({error}); retrying in {delay:.1f}s")
+                await retry_bot_job(job_id, delay, error)
+                asyncio.get_running_loop().call_later(delay, self._wake.set)
+        finally:
+            self._running.pop(job_id, None)
+            self._superseded.discard(job_id)
+            metrics.observe("bot_job_processing_seconds", time.perf_counter() - started)
+            self._busy -= 1
+            metrics.gauge("bot_workers_busy", self._busy)
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            # Clear before claiming so an enqueue racing with an empty claim
+            # still wakes us up immediately.
+            self._wake.clear()
+            try:
+                job = await claim_bot_job(self._lease_seconds)
+            except Exception as exc:
+                print(f"⚠️ Failed to claim bot job: {exc}")
+                job = None
+            if job is not None:
+                try:
+                    await self._run(job)
+                except Exception as exc:
+                    # Recording the outcome failed (e.g. a DB blip); the job
+                    # keeps its lease and is retried once it expires.
+                    metrics.incr("bot_worker_errors")
+                    print(f"⚠️ Bot worker error on job {job['id']}: {exc}")
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _monitor(self) -> None:
+        while not self._stopping:
+            try:
+                metrics.gauge("bot_queue_depth", await count_ready_bot_jobs())
+                if time.monotonic() - self._last_cleanup > _CLEANUP_INTERVAL_SECONDS:
+                    self._last_cleanup = time.monotonic()
+                    deleted = await delete_finished_bot_jobs(_FINISHED_RETENTION_SECONDS)
+                    if deleted:
+                        print(f"🧹 Removed {deleted} finished bot job(s)")
+            except Exception as exc:
+                print(f"⚠️ Bot queue monitor error: {exc}")
+            await asyncio.sleep(_MONITOR_INTERVAL_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": len(self._workers), "busy": self._busy}
+
+    async def start(self, handler: BotJobHandler) -> None:
+        if self._workers:
+            return
+        await ensure_bot_queue_tables()
+        database_listener.subscribe(CHANNEL_BOT_JOBS, self._on_enqueued)
+        database_listener.subscribe(CHANNEL_BOT_JOB_CANCEL, self._on_cancel_requested)
+        self._handler = handler
+        self._stopping = False
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._concurrency)]
+        self._monitor_task = asyncio.create_task(self._monitor())
+        print(f"🧵 Bot worker pool started with {self._concurrency} worker(s)")
+
+    async def stop(self) -> None:
+        """Let in-flight jobs finish for a short grace period, then cancel them.
+
+        Cancelled jobs keep their lease and are retried by the next worker
+        that finds it expired.
+        """
+        if not self._workers:
+            return
+        self._stopping = True
+        self._wake.set()
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            self._monitor_task = None
+        _, pending = await asyncio.wait(self._workers, timeout=BOT_WORKER_SHUTDOWN_SECONDS)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._workers = []
+
+
+bot_queue = BotJobQueue()
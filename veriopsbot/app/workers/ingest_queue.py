@@ -0,0 +1,275 @@
+"""Background ingest jobs with progress reporting.
+
+`POST /rag/ingest` and the dashboard only insert a row into `ingest_jobs` and
+return its id. Workers claim jobs with `FOR UPDATE SKIP LOCKED`; a tenant's
+jobs run one at a time, and repeated requests while one is waiting reuse
+it. While a job runs, its counters (files parsed, chunks embedded, rows
+written) are written to the row about once per `INGEST_PROGRESS_INTERVAL_SECONDS`,
+which also renews the lease and picks up cancellation requests. Enqueues
+wake idle workers in every process through `pg_notify`.
+
+The ingest thread runs under the pool's own `CapacityLimiter`, so a large
+folder never holds one of the default thread slots that database calls use.
+
+Rows of corpus versions retired by a rebuild are deleted by a collector task
+in small batches, once no query started before the switch can still read them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import anyio
+
+from app.db.repository import (
+    cancel_ingest_job,
+    claim_ingest_job,
+    count_open_ingest_jobs,
+    delete_corpus_version_rows,
+    delete_finished_ingest_jobs,
+    enqueue_ingest_job,
+    ensure_corpus_versions_table,
+    ensure_ingest_jobs_table,
+    finish_ingest_job,
+    get_retired_corpus_versions,
+    mark_corpus_version_collected,
+    release_ingest_job,
+    update_ingest_job_progress,
+)
+from app.db.notifications import CHANNEL_INGEST_JOBS, database_listener
+from app.metrics import metrics
+from app.rag_engine.ingest import SHARED_VECTOR_TABLE, IngestCancelled, ProgressCallback, ingest_documents
+
+INGEST_WORKER_CONCURRENCY = int(os.getenv("INGEST_WORKER_CONCURRENCY", "2"))
+INGEST_JOB_POLL_SECONDS = float(os.getenv("INGEST_JOB_POLL_SECONDS", "15"))
+INGEST_JOB_LEASE_SECONDS = int(os.getenv("INGEST_JOB_LEASE_SECONDS", "600"))
+INGEST_JOB_MAX_ATTEMPTS = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+INGEST_PROGRESS_INTERVAL_SECONDS = float(os.getenv("INGEST_PROGRESS_INTERVAL_SECONDS", "1"))
+INGEST_WORKER_SHUTDOWN_SECONDS = float(os.getenv("INGEST_WORKER_SHUTDOWN_SECONDS", "10"))
+# Retired corpus versions stay readable this long for queries already running.
+CORPUS_GC_GRACE_SECONDS = float(os.getenv("CORPUS_GC_GRACE_SECONDS", "120"))
+CORPUS_GC_BATCH_ROWS = int(os.getenv("CORPUS_GC_BATCH_ROWS", "1000"))
+CORPUS_GC_PAUSE_SECONDS = float(os.getenv("CORPUS_GC_PAUSE_SECONDS", "0.2"))
+_MONITOR_INTERVAL_SECONDS = 15.0
+_CLEANUP_INTERVAL_SECONDS = 60 * 60
+_FINISHED_RETENTION_SECONDS = 30 * 24 * 60 * 60
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+
+class _Interrupted(Exception):
+    """The worker is shutting down; the job goes back to the queue."""
+
+
+class IngestJobQueue:
+    def __init__(
+        self,
+        *,
+        concurrency: int = INGEST_WORKER_CONCURRENCY,
+        poll_interval: float = INGEST_JOB_POLL_SECONDS,
+        lease_seconds: int = INGEST_JOB_LEASE_SECONDS,
+        max_attempts: int = INGEST_JOB_MAX_ATTEMPTS,
+    ) -> None:
+        self._concurrency = max(concurrency, 1)
+        self._poll_interval = poll_interval
+        self._lease_seconds = lease_seconds
+        self._max_attempts = max(max_attempts, 1)
+        self._limiter: Optional[anyio.CapacityLimiter] = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._workers: List[asyncio.Task] = []
+        self._monitor_task: Optional[asyncio.Task] = None
+        self._gc_task: Optional[asyncio.Task] = None
+        self._busy = 0
+        self._last_cleanup = 0.0
+
+    async def enqueue(
+        self,
+        tenant_id: int,
+        folder_name: str,
+        provider: str | None = None,
+        embed_model: str | None = None,
+        rebuild: bool = False,
+    ) -> int:
+        job_id = await enqueue_ingest_job(tenant_id, folder_name, provider, embed_model, rebuild)
+        metrics.incr("ingest_jobs_enqueued")
+        self._wake.set()
+        return job_id
+
+    def _on_enqueued(self, _payload: str) -> None:
+        self._wake.set()
+
+    async def cancel(self, job_id: int, tenant_id: int | None = None) -> Optional[Dict[str, Any]]:
+        row = await cancel_ingest_job(job_id, tenant_id)
+        if row is not None:
+            metrics.incr("ingest_jobs_cancel_requested")
+        return row
+
+    def _progress_callback(self, job_id: int, latest: Dict[str, Any]) -> ProgressCallback:
+        """Build the callback the ingest thread calls while the pipeline runs."""
+        last_sent = 0.0
+
+        def report(progress: Dict[str, int]) -> None:
+            nonlocal last_sent
+            latest.clear()
+            latest.update(progress)
+            if self._stopping:
+                raise _Interrupted()
+            now = time.monotonic()
+            if now - last_sent < INGEST_PROGRESS_INTERVAL_SECONDS:
+                return
+            last_sent = now
+            if anyio.from_thread.run(update_ingest_job_progress, job_id, progress, self._lease_seconds):
+                raise IngestCancelled(f"Ingest job {job_id} was cancelled.")
+
+        return report
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        if int(job["attempts"]) > self._max_attempts:
+            metrics.incr("ingest_jobs_failed")
+            print(f"❌ Ingest job {job_id} abandoned after {job['attempts'] - 1} interrupted attempts")
+            await finish_ingest_job(job_id, STATUS_FAILED, error="Worker stopped too many times.")
+            return
+
+        self._busy += 1
+        metrics.gauge("ingest_workers_busy", self._busy)
+        started = time.perf_counter()
+        latest: Dict[str, Any] = {}
+        print(f"📚 Ingest job {job_id} started for tenant {job['tenant_id']} ({job['folder_name']})")
+        try:
+            report, provider, embed_model = await ingest_documents(
+                tenant_id=int(job["tenant_id"]),
+                folder_name=job["folder_name"],
+                provider=job["provider"],
+                embed_model=job["embed_model"],
+                on_progress=self._progress_callback(job_id, latest),
+                limiter=self._limiter,
+                rebuild=bool(job.get("rebuild")),
+            )
+            summary = {**report.as_dict(), "provider": provider, "embed_model": embed_model}
+            await finish_ingest_job(job_id, STATUS_DONE, progress=latest, report=summary)
+            metrics.incr("ingest_jobs_done")
+            print(
+                f"✅ Ingest job {job_id} done: {len(report.added)} added, {len(report.updated)} updated, "
+                f"{len(report.removed)} removed, {len(report.skipped)} unchanged, {len(report.failed)} failed"
+            )
+            metrics.incr("ingest_files_failed", len(report.failed))
+        except IngestCancelled:
+            await finish_ingest_job(job_id, STATUS_CANCELLED, progress=latest)
+            metrics.incr("ingest_jobs_cancelled")
+            print(f"⏹️ Ingest job {job_id} cancelled")
+        except _Interrupted:
+            await release_ingest_job(job_id)
+            print(f"⏸️ Ingest job {job_id} interrupted by shutdown; it will resume on the next worker")
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            await finish_ingest_job(job_id, STATUS_FAILED, progress=latest, error=error)
+            metrics.incr("ingest_jobs_failed")
+            print(f"❌ Ingest job {job_id} failed: {error}")
+        finally:
+            metrics.observe("ingest_job_seconds", time.perf_counter() - started)
+            self._busy -= 1
+            metrics.gauge("ingest_workers_busy", self._busy)
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                job = await claim_ingest_job(self._lease_seconds)
+            except Exception as exc:
+                print(f"⚠️ Failed to claim ingest job: {exc}")
+                job = None
+            if job is not None:
+                try:
+                    await self._run(job)
+                except Exception as exc:
+                    # Recording the outcome failed (e.g. a DB blip); the job
+                    # keeps its lease and is picked up again once it expires.
+                    metrics.incr("ingest_worker_errors")
+                    print(f"⚠️ Ingest worker error on job {job['id']}: {exc}")
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _monitor(self) -> None:
+        while not self._stopping:
+            try:
+                metrics.gauge("ingest_jobs_open", await count_open_ingest_jobs())
+                if time.monotonic() - self._last_cleanup > _CLEANUP_INTERVAL_SECONDS:
+                    self._last_cleanup = time.monotonic()
+                    deleted = await delete_finished_ingest_jobs(_FINISHED_RETENTION_SECONDS)
+                    if deleted:
+                        print(f"🧹 Removed {deleted} finished ingest job(s)")
+            except Exception as exc:
+                print(f"⚠️ Ingest queue monitor error: {exc}")
+            await asyncio.sleep(_MONITOR_INTERVAL_SECONDS)
+
+    async def _collect_garbage(self) -> None:
+        while not self._stopping:
+            try:
+                for corpus in await get_retired_corpus_versions(CORPUS_GC_GRACE_SECONDS):
+                    tenant_id, version = int(corpus["tenant_id"]), int(corpus["version"])
+                    total = 0
+                    while not self._stopping:
+                        deleted = await delete_corpus_version_rows(
+                            corpus["schema_name"], SHARED_VECTOR_TABLE, tenant_id, version, CORPUS_GC_BATCH_ROWS
+                        )
+                        total += deleted
+                        metrics.incr("corpus_gc_rows_deleted", deleted)
+                        if deleted < CORPUS_GC_BATCH_ROWS:
+                            await mark_corpus_version_collected(tenant_id, version)
+                            print(f"🧹 Collected corpus version {version} of tenant {tenant_id} ({total} rows)")
+                            break
+                        # Short batches with pauses keep locks and WAL bursts small.
+                        await asyncio.sleep(CORPUS_GC_PAUSE_SECONDS)
+            except Exception as exc:
+                print(f"⚠️ Corpus garbage collection error: {exc}")
+            await asyncio.sleep(_MONITOR_INTERVAL_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": len(self._workers), "busy": self._busy}
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        await ensure_ingest_jobs_table()
+        await ensure_corpus_versions_table()
+        database_listener.subscribe(CHANNEL_INGEST_JOBS, self._on_enqueued)
+        self._limiter = anyio.CapacityLimiter(self._concurrency)
+        self._stopping = False
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._concurrency)]
+        self._monitor_task = asyncio.create_task(self._monitor())
+        self._gc_task = asyncio.create_task(self._collect_garbage())
+        print(f"📚 Ingest worker pool started with {self._concurrency} worker(s)")
+
+    async def stop(self) -> None:
+        """Ask running ingests to stop at their next progress update, then cancel.
+
+        Interrupted jobs are released so another worker resumes them at once.
+        """
+        if not self._workers:
+            return
+        self._stopping = True
+        self._wake.set()
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            self._monitor_task = None
+        if self._gc_task is not None:
+            self._gc_task.cancel()
+            self._gc_task = None
+        _, pending = await asyncio.wait(self._workers, timeout=INGEST_WORKER_SHUTDOWN_SECONDS)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._workers = []
+
+
+ingest_queue = IngestJobQueue()
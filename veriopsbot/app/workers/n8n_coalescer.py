@@ -0,0 +1,178 @@
+"""Coalesce bursty contact/record webhooks before they reach n8n.
+
+One edit in Chatwoot or Twenty often emits several webhooks within seconds,
+and each one starts a full n8n workflow run. Events are keyed by the record
+they describe. The first event opens a `N8N_COALESCE_WINDOW_SECONDS` window;
+later events for the same record replace it, and only the latest payload
+is forwarded when the window closes. Chatwoot's `changed_attributes` are
+merged so the workflow still sees the oldest `previous_value`.
+
+An event is dropped when none of the fields the workflow reads changed
+since the last forwarded event for that record (see `SOURCE_FIELDS`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.metrics import metrics
+
+from .n8n_forwarder import n8n_forwarder
+
+N8N_COALESCE_WINDOW_SECONDS = float(os.getenv("N8N_COALESCE_WINDOW_SECONDS", "3"))
+# Records whose last forwarded fingerprint is remembered.
+N8N_COALESCE_MAX_RECORDS = int(os.getenv("N8N_COALESCE_MAX_RECORDS", "10000"))
+
+
+def _fields(env_name: str, default: str) -> Tuple[str, ...]:
+    return tuple(field.strip() for field in os.getenv(env_name, default).split(",") if field.strip())
+
+
+# Dotted paths the n8n workflows read. The Chatwoot contact sync uses the
+# contact id, account id, name, email and phone number.
+SOURCE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "chatwoot": _fields("N8N_CHATWOOT_FIELDS", "id,account.id,name,email,phone_number"),
+    "twenty": _fields("N8N_TWENTY_FIELDS", "record"),
+}
+# Bookkeeping fields that change on every write without meaning a real edit.
+_VOLATILE_KEYS = frozenset({"updatedAt", "createdAt", "updated_at", "created_at", "last_activity_at", "position", "searchVector"})
+
+_RECORD_KEYS: Dict[str, Callable[[Dict[str, Any]], Optional[str]]] = {
+    "chatwoot": lambda payload: (
+        f"{(payload.get('account') or {}).get('id')}:{payload['id']}" if payload.get("id") is not None else None
+    ),
+    "twenty": lambda payload: (payload.get("record") or {}).get("id"),
+}
+
+
+def _lookup(payload: Dict[str, Any], path: str) -> Any:
+    value: Any = payload
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _strip_volatile(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _strip_volatile(item) for key, item in value.items() if key not in _VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(item) for item in value]
+    return value
+
+
+def fingerprint(source: str, payload: Dict[str, Any]) -> str:
+    fields = SOURCE_FIELDS.get(source) or ()
+    values = {path: _strip_volatile(_lookup(payload, path)) for path in fields}
+    return json.dumps(values, sort_keys=True, default=str)
+
+
+def _merge_changed_attributes(older: Iterable[Dict[str, Any]], newer: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep the first previous_value and the last current_value per attribute."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for change in list(older) + list(newer):
+        for attribute, values in (change or {}).items():
+            if not isinstance(values, dict):
+                continue
+            if attribute in merged:
+                merged[attribute] = {**merged[attribute], "current_value": values.get("current_value")}
+            else:
+                merged[attribute] = dict(values)
+    return [{attribute: values} for attribute, values in merged.items()]
+
+
+def merge_events(older: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(newer)
+    older_changes = older.get("changed_attributes")
+    newer_changes = newer.get("changed_attributes")
+    if isinstance(older_changes, list) or isinstance(newer_changes, list):
+        merged["changed_attributes"] = _merge_changed_attributes(older_changes or [], newer_changes or [])
+    return merged
+
+
+class WebhookCoalescer:
+    def __init__(
+        self,
+        forward: Callable[[str, Dict[str, Any]], bool],
+        *,
+        window_seconds: float = N8N_COALESCE_WINDOW_SECONDS,
+        max_records: int = N8N_COALESCE_MAX_RECORDS,
+    ) -> None:
+        self._forward = forward
+        self._window = max(window_seconds, 0.0)
+        self._max_records = max(max_records, 1)
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._forwarded: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+    def _record_saved(self) -> None:
+        received = metrics.counter("n8n_events_received")
+        forwarded = metrics.counter("n8n_events_forwarded")
+        metrics.gauge("n8n_load_saved_ratio", round(1 - forwarded / received, 4) if received else 0.0)
+
+    def offer(self, source: str, payload: Dict[str, Any]) -> bool:
+        """Accept an event for forwarding; returns False only if it was dropped for capacity."""
+        metrics.incr("n8n_events_received")
+        metrics.incr("n8n_events_received", source=source)
+        record = _RECORD_KEYS.get(source, lambda _: None)(payload)
+        if record is None or not self._window:
+            return self._emit(source, payload, None)
+
+        key = (source, str(record))
+        pending = self._pending.get(key)
+        if pending is not None:
+            self._pending[key] = merge_events(pending, payload)
+            metrics.incr("n8n_events_coalesced", source=source)
+            self._record_saved()
+            return True
+        if self._forwarded.get(key) == fingerprint(source, payload):
+            metrics.incr("n8n_events_unchanged", source=source)
+            self._record_saved()
+            return True
+
+        self._pending[key] = payload
+        self._timers[key] = asyncio.get_running_loop().call_later(self._window, self._flush, key)
+        return True
+
+    def _flush(self, key: Tuple[str, str]) -> None:
+        self._timers.pop(key, None)
+        payload = self._pending.pop(key, None)
+        if payload is None:
+            return
+        source = key[0]
+        if self._forwarded.get(key) == fingerprint(source, payload):
+            # The burst ended where it started (e.g. an edit that was undone).
+            metrics.incr("n8n_events_unchanged", source=source)
+            self._record_saved()
+            return
+        self._emit(source, payload, key)
+
+    def _emit(self, source: str, payload: Dict[str, Any], key: Optional[Tuple[str, str]]) -> bool:
+        accepted = self._forward(source, payload)
+        if accepted:
+            metrics.incr("n8n_events_forwarded")
+            metrics.incr("n8n_events_forwarded", source=source)
+            if key is not None:
+                self._forwarded[key] = fingerprint(source, payload)
+                self._forwarded.move_to_end(key)
+                while len(self._forwarded) > self._max_records:
+                    self._forwarded.popitem(last=False)
+        self._record_saved()
+        return accepted
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": len(self._pending), "tracked_records": len(self._forwarded)}
+
+    async def stop(self) -> None:
+        """Forward whatever is still waiting for its window to close."""
+        for key, timer in list(self._timers.items()):
+            timer.cancel()
+            self._flush(key)
+
+
+n8n_coalescer = WebhookCoalescer(n8n_forwarder.submit)
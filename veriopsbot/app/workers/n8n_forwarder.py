@@ -0,0 +1,179 @@
+"""Asynchronous fan-out of Chatwoot/Twenty webhooks to n8n.
+
+Webhook routes only put the payload on a bounded in-memory queue and return.
+Dispatcher tasks post each event to every configured n8n target concurrently
+over one pooled client with bounded timeouts. Targets that fail are retried
+with exponential backoff without re-sending to the targets that succeeded.
+
+Targets are `{N8N_BASE_URL}/{prefix}/{source}` for each prefix in
+`N8N_WEBHOOK_PREFIXES`; drop `webhook-test` from it in production.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.chatwoot.outbox import backoff_delay
+from app.metrics import metrics
+
+N8N_BASE_URL = os.getenv("N8N_BASE_URL", "http://host.docker.internal:5678").rstrip("/")
+N8N_WEBHOOK_PREFIXES = [
+    prefix.strip().strip("/")
+    for prefix in os.getenv("N8N_WEBHOOK_PREFIXES", "webhook,webhook-test").split(",")
+    if prefix.strip()
+]
+N8N_TIMEOUT_SECONDS = float(os.getenv("N8N_TIMEOUT_SECONDS", "10"))
+N8N_QUEUE_SIZE = int(os.getenv("N8N_QUEUE_SIZE", "1000"))
+N8N_CONCURRENCY = int(os.getenv("N8N_CONCURRENCY", "4"))
+N8N_MAX_ATTEMPTS = int(os.getenv("N8N_MAX_ATTEMPTS", "5"))
+N8N_BACKOFF_SECONDS = float(os.getenv("N8N_BACKOFF_SECONDS", "1"))
+N8N_BACKOFF_MAX_SECONDS = float(os.getenv("N8N_BACKOFF_MAX_SECONDS", "60"))
+_SHUTDOWN_DRAIN_SECONDS = 5.0
+
+
+@dataclass(slots=True)
+class _Delivery:
+    source: str
+    payload: Dict[str, Any]
+    targets: List[str]
+    attempt: int = 1
+
+
+def n8n_targets(source: str) -> List[str]:
+    return [f"{N8N_BASE_URL}/{prefix}/{source}" for prefix in N8N_WEBHOOK_PREFIXES]
+
+
+class N8nForwarder:
+    def __init__(
+        self,
+        *,
+        queue_size: int = N8N_QUEUE_SIZE,
+        concurrency: int = N8N_CONCURRENCY,
+        max_attempts: int = N8N_MAX_ATTEMPTS,
+    ) -> None:
+        self._queue: Optional[asyncio.Queue] = None
+        self._queue_size = max(queue_size, 1)
+        self._concurrency = max(concurrency, 1)
+        self._max_attempts = max(max_attempts, 1)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._workers: List[asyncio.Task] = []
+        # Pending retries only; each one removes itself when it fires.
+        self._retry_handles: Dict[int, asyncio.TimerHandle] = {}
+
+    def submit(self, source: str, payload: Dict[str, Any]) -> bool:
+        """Queue an event for every n8n target; returns False when it was dropped."""
+        targets = n8n_targets(source)
+        if not targets:
+            return True
+        if self._queue is None:
+            print("⚠️ n8n forwarder is not running; dropping event", source)
+            metrics.incr("n8n_events_dropped", source=source, reason="stopped")
+            return False
+        return self._put(_Delivery(source=source, payload=payload, targets=targets))
+
+    def _put(self, delivery: _Delivery) -> bool:
+        try:
+            self._queue.put_nowait(delivery)
+        except asyncio.QueueFull:
+            print(f"⚠️ n8n forward queue full ({self._queue_size}); dropping {delivery.source} event")
+            metrics.incr("n8n_events_dropped", source=delivery.source, reason="queue_full")
+            return False
+        metrics.gauge("n8n_queue_depth", self._queue.qsize())
+        return True
+
+    async def _post(self, target: str, payload: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        try:
+            with metrics.timer("n8n_request_seconds", target=target):
+                resp = await self._client.post(target, json=payload)
+        except httpx.HTTPError as exc:
+            return target, f"{type(exc).__name__}: {exc}"
+        if resp.status_code >= 500 or resp.status_code == 429:
+            return target, f"HTTP {resp.status_code}"
+        if resp.status_code >= 300:
+            # Client errors (e.g. a test webhook that is not listening) will not
+            # succeed on retry.
+            metrics.incr("n8n_requests_rejected", target=target)
+            print(f"⚠️ n8n rejected {target}: {resp.status_code} {resp.text[:200]}")
+            return target, None
+        metrics.incr("n8n_requests_ok", target=target)
+        print(f"🔄 N8N webhook {target}: {resp.status_code}")
+        return target, None
+
+    async def _deliver(self, delivery: _Delivery) -> None:
+        results = await asyncio.gather(*(self._post(target, delivery.payload) for target in delivery.targets))
+        failed = [target for target, error in results if error]
+        for target, error in results:
+            if error:
+                metrics.incr("n8n_requests_failed", target=target)
+                print(f"❌ n8n delivery to {target} failed (attempt {delivery.attempt}): {error}")
+        if not failed:
+            return
+        if delivery.attempt >= self._max_attempts:
+            metrics.incr("n8n_events_dropped", source=delivery.source, reason="max_attempts")
+            return
+        delay = backoff_delay(delivery.attempt, N8N_BACKOFF_SECONDS, N8N_BACKOFF_MAX_SECONDS)
+        retry = _Delivery(
+            source=delivery.source,
+            payload=delivery.payload,
+            targets=failed,
+            attempt=delivery.attempt + 1,
+        )
+        metrics.incr("n8n_events_retried", source=delivery.source)
+        loop = asyncio.get_running_loop()
+        self._retry_handles[id(retry)] = loop.call_later(delay, self._fire_retry, retry)
+
+    def _fire_retry(self, retry: _Delivery) -> None:
+        self._retry_handles.pop(id(retry), None)
+        if self._queue is not None:
+            self._put(retry)
+
+    async def _worker(self) -> None:
+        while True:
+            delivery = await self._queue.get()
+            started = time.perf_counter()
+            try:
+                await self._deliver(delivery)
+            except Exception as exc:
+                print(f"⚠️ n8n forwarder error: {exc}")
+            finally:
+                metrics.observe("n8n_event_seconds", time.perf_counter() - started, source=delivery.source)
+                metrics.gauge("n8n_queue_depth", self._queue.qsize())
+                self._queue.task_done()
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(N8N_TIMEOUT_SECONDS, connect=min(N8N_TIMEOUT_SECONDS, 3.0)),
+            limits=httpx.Limits(max_connections=self._concurrency * 2, max_keepalive_connections=self._concurrency),
+        )
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._concurrency)]
+        print(f"🔄 n8n forwarder started: targets={n8n_targets('<source>')}")
+
+    async def stop(self) -> None:
+        if not self._workers:
+            return
+        for handle in self._retry_handles.values():
+            handle.cancel()
+        self._retry_handles = {}
+        try:
+            await asyncio.wait_for(self._queue.join(), _SHUTDOWN_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Dropping {self._queue.qsize()} queued n8n event(s) on shutdown")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        await self._client.aclose()
+        self._client = None
+
+
+n8n_forwarder = N8nForwarder()
@@ -0,0 +1,96 @@
+"""Compare sequential ingest embedding with the AIMD embedding scheduler.
+
+Run from the project root:
+
+    uv run --python 3.11 python -m benchmarks.bench_embed_scheduler --chunks 2000 --jobs 2
+
+Starts `FakeEmbeddingServer` (latency + token-bucket rate limit with 429s)
+and embeds the same chunks three ways: the previous sequential batching with
+the client's own retries, one job through `EmbeddingScheduler`, and `--jobs`
+concurrent jobs sharing one budget.
+"""
+
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from typing import List
+
+from llama_index.core.schema import TextNode
+from llama_index.embeddings.openai import OpenAIEmbedding
+
+from app.rag_engine.embed_scheduler import EmbeddingBudget, EmbeddingScheduler
+
+from .fake_embedding_server import FakeEmbeddingServer
+
+
+def _nodes(count: int, job: int = 0) -> List[TextNode]:
+    return [TextNode(text=f"job {job} chunk {index} about invoices and deliveries") for index in range(count)]
+
+
+def _batches(nodes: List[TextNode], size: int) -> List[List[TextNode]]:
+    return [nodes[start : start + size] for start in range(0, len(nodes), size)]
+
+
+def _embedder(url: str, retries: int, batch_size: int) -> OpenAIEmbedding:
+    return OpenAIEmbedding(api_key="fake", api_base=url, max_retries=retries, embed_batch_size=batch_size)
+
+
+def _sequential(url: str, chunks: int, batch_size: int) -> float:
+    embedder = _embedder(url, 10, batch_size)
+    texts = [node.text for node in _nodes(chunks)]
+    started = time.perf_counter()
+    embedder.get_text_embedding_batch(texts)
+    return time.perf_counter() - started
+
+
+def _scheduled(url: str, chunks: int, batch_size: int, jobs: int, budget: EmbeddingBudget) -> float:
+    embedder = _embedder(url, 0, batch_size)
+
+    def run(job: int) -> None:
+        scheduler = EmbeddingScheduler(embedder, budget)
+        for batch in scheduler.embed(_batches(_nodes(chunks, job), batch_size)):
+            assert all(node.embedding for node in batch)
+
+    threads = [threading.Thread(target=run, args=(job,)) for job in range(jobs)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000, help="chunks per job")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--jobs", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.2, help="server seconds per request")
+    parser.add_argument("--rps", type=float, default=20.0, help="server requests per second")
+    args = parser.parse_args()
+
+    server = FakeEmbeddingServer(latency=args.latency, rps=args.rps).start()
+    requests = -(-args.chunks // args.batch_size)
+    print(f"chunks/job={args.chunks} batch={args.batch_size} latency={args.latency}s limit={args.rps} req/s")
+
+    def report(label: str, seconds: float, total_requests: int, budget: EmbeddingBudget | None = None) -> None:
+        limited = server.counters["rate_limited"]
+        server.counters.update(ok=0, rate_limited=0, inputs=0)
+        extra = f"  final window={budget.limit}" if budget else ""
+        print(f"{label:>22}: {seconds:6.2f} s  {total_requests / seconds:6.1f} req/s  429s={limited}{extra}")
+
+    report("sequential", _sequential(server.url, args.chunks, args.batch_size), requests)
+    time.sleep(1)
+    budget = EmbeddingBudget("bench")
+    report("scheduler, 1 job", _scheduled(server.url, args.chunks, args.batch_size, 1, budget), requests, budget)
+    time.sleep(1)
+    budget = EmbeddingBudget("bench")
+    seconds = _scheduled(server.url, args.chunks, args.batch_size, args.jobs, budget)
+    report(f"scheduler, {args.jobs} jobs", seconds, requests * args.jobs, budget)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
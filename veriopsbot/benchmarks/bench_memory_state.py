@@ -0,0 +1,108 @@
+"""Measure per-session memory and hot-path cost of MemoryState.
+
+Run from the project root:
+
+    uv run --python 3.11 python -m benchmarks.bench_memory_state --sessions 20000
+
+Compares the current deque/slots implementation with the previous
+list-of-dataclasses layout (reproduced below) for the same workload.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+from app.rag_engine.rag_memory import MemoryState
+
+
+@dataclass
+class _LegacyTurn:
+    role: str
+    content: str
+
+
+@dataclass
+class _LegacyMemoryState:
+    tenant_id: int | None = None
+    turns: List[_LegacyTurn] = field(default_factory=list)
+    max_turns: int = 20
+
+    def remember(self, role: str, content: str) -> None:
+        self.turns.append(_LegacyTurn(role=role, content=content))
+        if len(self.turns) > self.max_turns:
+            self.turns = self.turns[-self.max_turns :]
+
+    def transcript(self) -> str:
+        return "\n".join(f"{turn.role}: {turn.content}" for turn in self.turns)
+
+
+def _messages(turns: int) -> List[tuple[str, str]]:
+    return [
+        ("user" if idx % 2 == 0 else "assistant", f"message {idx} about invoice #{1000 + idx} and delivery")
+        for idx in range(turns)
+    ]
+
+
+def _measure(
+    factory: Callable[[], object],
+    sessions: int,
+    turns: int,
+) -> tuple[float, float, float, float]:
+    messages = _messages(turns)
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    states = []
+    started = time.perf_counter()
+    for _ in range(sessions):
+        state = factory()
+        for role, content in messages:
+            state.remember(role, content)
+        states.append(state)
+    remember_seconds = time.perf_counter() - started
+    after_remember, _ = tracemalloc.get_traced_memory()
+
+    started = time.perf_counter()
+    for state in states:
+        # The pipeline used to rebuild the transcript up to three times per message.
+        for _ in range(3):
+            state.transcript()
+    transcript_seconds = time.perf_counter() - started
+    after_transcript, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (
+        (after_remember - baseline) / sessions,
+        (after_transcript - baseline) / sessions,
+        remember_seconds,
+        transcript_seconds,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=40, help="turns remembered per session")
+    args = parser.parse_args()
+
+    print(f"sessions={args.sessions} turns/session={args.turns}")
+    for label, factory in (("legacy", _LegacyMemoryState), ("current", MemoryState)):
+        per_session, with_transcript, remember_s, transcript_s = _measure(
+            factory, args.sessions, args.turns
+        )
+        remember_us = remember_s / (args.sessions * args.turns) * 1e6
+        transcript_us = transcript_s / (args.sessions * 3) * 1e6
+        print(
+            f"{label:>8}: {per_session / 1024:6.2f} KiB/session "
+            f"({with_transcript / 1024:6.2f} KiB with transcript)  "
+            f"remember={remember_us:6.2f} µs  transcript={transcript_us:6.2f} µs"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Measure ingest parsing throughput with and without the process pool.
+
+Run from the project root:
+
+    uv run --python 3.11 python -m benchmarks.bench_parse_pool --files 64 --processes 0,2,4,8
+
+Builds a fixture corpus of markdown, HTML and text files in a temporary
+directory and parses + chunks it with `FileParser` at each pool size
+(0 = in the calling thread, the previous behaviour). Warm-up (spawning workers,
+importing llama-index and loading the tokenizer) is reported separately.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from app.rag_engine.ingest_parse import FileParser, ParseTask
+
+_WORDS = (
+    "invoice delivery account refund warranty shipment order customer support ticket "
+    "payment subscription plan upgrade address tracking return policy product manual"
+).split()
+
+
+def _paragraph(rng: random.Random) -> str:
+    sentences = []
+    for _ in range(rng.randint(3, 8)):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 20))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def _build_corpus(root: Path, files: int, kib: int, seed: int = 7) -> List[Path]:
+    rng = random.Random(seed)
+    paths = []
+    for index in range(files):
+        paragraphs: List[str] = []
+        while sum(len(p) for p in paragraphs) < kib * 1024:
+            paragraphs.append(_paragraph(rng))
+        kind = ("md", "html", "txt")[index % 3]
+        if kind == "md":
+            body = "\n\n".join(f"## Section {n}\n\n{p}" for n, p in enumerate(paragraphs))
+        elif kind == "html":
+            body = "<html><body>" + "".join(f"<h2>Section {n}</h2><p>{p}</p>" for n, p in enumerate(paragraphs)) + "</body></html>"
+        else:
+            body = "\n\n".join(paragraphs)
+        path = root / f"doc{index:04d}.{kind}"
+        path.write_text(body, encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def _tasks(paths: List[Path]) -> List[ParseTask]:
+    return [ParseTask(str(path), {"tenant_id": "1", "source_path": path.name}) for path in paths]
+
+
+def _measure(paths: List[Path], processes: int) -> tuple[float, float, int]:
+    with FileParser(processes=processes) as parser:
+        # Warm up (worker start-up, tokenizer loading) before timing the parse.
+        started = time.perf_counter()
+        list(parser.parse(_tasks(paths[:1]) * max(processes, 1)))
+        startup = time.perf_counter() - started
+        started = time.perf_counter()
+        nodes = sum(len(result.nodes) for result in parser.parse(_tasks(paths)))
+        return startup, time.perf_counter() - started, nodes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=48)
+    parser.add_argument("--kib", type=int, default=64, help="approximate size of each file")
+    parser.add_argument("--processes", default="0,2,4", help="comma-separated pool sizes to compare")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = _build_corpus(Path(tmp), args.files, args.kib)
+        print(f"files={args.files} size≈{args.kib} KiB each")
+        baseline = None
+        for processes in (int(value) for value in args.processes.split(",")):
+            startup, seconds, nodes = _measure(paths, processes)
+            baseline = baseline or seconds
+            print(
+                f"processes={processes:>2}: {seconds:7.2f} s  {args.files / seconds:7.1f} files/s  "
+                f"{nodes} nodes  speedup={baseline / seconds:4.2f}x  (warm-up {startup:.2f} s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Local stand-in for the OpenAI embeddings endpoint.
+
+Serves `POST /v1/embeddings` with a fixed latency and a token-bucket rate
+limit; requests over the limit get a 429 with `Retry-After`. Used by
+`bench_embed_scheduler`, or on its own to point a dev instance at:
+
+    uv run --python 3.11 python -m benchmarks.fake_embedding_server --port 8099 --rps 20
+
+then set `api_base` to `http://127.0.0.1:8099/v1`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+
+class FakeEmbeddingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, *, latency: float = 0.1, rps: float = 20.0, burst: int = 5, dimensions: int = 64) -> None:
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.rps = rps
+        self.burst = burst
+        self.dimensions = dimensions
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+        self.counters = {"ok": 0, "rate_limited": 0, "inputs": 0}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def admit(self) -> float:
+        """0 if the request may proceed, else the seconds until a token is free."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens + (now - self._refilled) * self.rps, float(self.burst))
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            self.counters["rate_limited"] += 1
+            return (1 - self._tokens) / self.rps
+
+    def embed(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        vector = [digest[i % len(digest)] / 255 - 0.5 for i in range(self.dimensions)]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def start(self) -> "FakeEmbeddingServer":
+        threading.Thread(target=self.serve_forever, name="fake-embeddings", daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeEmbeddingServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _reply(self, status: int, body: Dict[str, Any], headers: Dict[str, str] | None = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") != "/v1/embeddings":
+            self._reply(404, {"error": {"message": "not found"}})
+            return
+        wait = self.server.admit()
+        if wait:
+            self._reply(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"retry-after": f"{wait:.3f}", "retry-after-ms": str(int(wait * 1000))},
+            )
+            return
+        inputs = request.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        time.sleep(self.server.latency)
+        self.server.counters["ok"] += 1
+        self.server.counters["inputs"] += len(inputs)
+        self._reply(
+            200,
+            {
+                "object": "list",
+                "model": request.get("model", "fake"),
+                "data": [
+                    {"object": "embedding", "index": index, "embedding": self.server.embed(str(text))}
+                    for index, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+            },
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per request")
+    parser.add_argument("--rps", type=float, default=20.0, help="sustained requests per second")
+    parser.add_argument("--burst", type=int, default=5)
+    args = parser.parse_args()
+    server = FakeEmbeddingServer(args.port, latency=args.latency, rps=args.rps, burst=args.burst)
+    print(f"Fake embeddings on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""EmbeddingBudget, Retry-After handling and EmbeddingScheduler against the fake embeddings server."""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Iterator, List
+
+import httpx
+import openai
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.embeddings.openai import OpenAIEmbedding
+
+from app.rag_engine.embed_scheduler import EmbeddingBudget, EmbeddingScheduler, rate_limit_delay
+from benchmarks.fake_embedding_server import FakeEmbeddingServer
+
+
+@pytest.fixture
+def server() -> Iterator[FakeEmbeddingServer]:
+    server = FakeEmbeddingServer(latency=0.02, rps=40.0, burst=4).start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _embedder(server: FakeEmbeddingServer, batch_size: int = 5) -> OpenAIEmbedding:
+    # Retries are the scheduler's job, as in ingest.
+    return OpenAIEmbedding(api_key="fake", api_base=server.url, max_retries=0, embed_batch_size=batch_size)
+
+
+def _batches(count: int, size: int) -> List[List[TextNode]]:
+    return [[TextNode(text=f"batch {batch} chunk {index}") for index in range(size)] for batch in range(count)]
+
+
+def test_budget_grows_by_about_one_slot_per_window() -> None:
+    budget = EmbeddingBudget("test", ceiling=16, initial=4)
+    for _ in range(4):
+        budget.release(budget.acquire())
+    assert budget.limit == 4
+    budget.release(budget.acquire())
+    assert budget.limit == 5
+
+
+def test_budget_never_grows_past_its_ceiling() -> None:
+    budget = EmbeddingBudget("test", ceiling=3, initial=2)
+    for _ in range(50):
+        budget.release(budget.acquire())
+    assert budget.limit == 3
+
+
+def test_budget_halves_once_per_rate_limit_event() -> None:
+    budget = EmbeddingBudget("test", ceiling=16, initial=8)
+    tickets = [budget.acquire() for _ in range(3)]
+    budget.release(budget.acquire(), retry_after=0)
+    assert budget.limit == 4
+    # Requests sent before the decrease report the same congestion event.
+    for ticket in tickets:
+        budget.release(ticket, retry_after=0)
+    assert budget.limit == 4
+    budget.release(budget.acquire(), retry_after=0)
+    assert budget.limit == 2
+
+
+def test_budget_does_not_shrink_below_one() -> None:
+    budget = EmbeddingBudget("test", ceiling=4, initial=1)
+    budget.release(budget.acquire(), retry_after=0)
+    assert budget.limit == 1
+
+
+def test_failed_request_neither_grows_nor_shrinks_the_budget() -> None:
+    budget = EmbeddingBudget("test", ceiling=16, initial=4)
+    budget.release(budget.acquire(), ok=False)
+    assert budget.limit == 4
+
+
+def test_retry_after_pauses_every_caller_of_the_budget() -> None:
+    budget = EmbeddingBudget("test", ceiling=4, initial=2)
+    budget.release(budget.acquire(), retry_after=0.3)
+    waited: List[float] = []
+
+    def acquire() -> None:
+        started = time.monotonic()
+        budget.release(budget.acquire())
+        waited.append(time.monotonic() - started)
+
+    threads = [threading.Thread(target=acquire) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert len(waited) == 2
+    assert min(waited) >= 0.25
+
+
+def test_acquire_waits_for_a_free_slot() -> None:
+    budget = EmbeddingBudget("test", ceiling=1, initial=1)
+    ticket = budget.acquire()
+    acquired = threading.Event()
+
+    def acquire() -> None:
+        budget.release(budget.acquire())
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.1)
+    budget.release(ticket)
+    assert acquired.wait(5)
+    thread.join(timeout=5)
+
+
+def test_rate_limit_delay_reads_retry_after_from_the_server() -> None:
+    server = FakeEmbeddingServer(latency=0, rps=2.0, burst=1).start()
+    try:
+        client = openai.OpenAI(api_key="fake", base_url=server.url, max_retries=0)
+        client.embeddings.create(model="fake", input=["first"])
+        with pytest.raises(openai.RateLimitError) as caught:
+            client.embeddings.create(model="fake", input=["second"])
+    finally:
+        server.shutdown()
+        server.server_close()
+    delay = rate_limit_delay(caught.value)
+    # One token refills in 1 / rps seconds.
+    assert delay is not None
+    assert 0.3 < delay <= 0.5
+
+
+def _rate_limit_error(headers: dict) -> openai.RateLimitError:
+    request = httpx.Request("POST", "http://test/v1/embeddings")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_rate_limit_delay_falls_back_and_caps() -> None:
+    assert rate_limit_delay(_rate_limit_error({"retry-after": "2"})) == 2.0
+    assert rate_limit_delay(_rate_limit_error({"retry-after": "3600"})) == 60.0
+    assert rate_limit_delay(_rate_limit_error({})) == 1.0
+
+
+def test_rate_limit_delay_ignores_other_errors() -> None:
+    request = httpx.Request("POST", "http://test/v1/embeddings")
+    response = httpx.Response(500, request=request)
+    assert rate_limit_delay(openai.InternalServerError("boom", response=response, body=None)) is None
+    assert rate_limit_delay(ValueError("not http")) is None
+
+
+def test_scheduler_returns_batches_in_order(server: FakeEmbeddingServer) -> None:
+    batches = _batches(count=20, size=5)
+    budget = EmbeddingBudget("test", ceiling=8, initial=4)
+    scheduler = EmbeddingScheduler(_embedder(server), budget, concurrency=4)
+
+    results = list(scheduler.embed(batches))
+
+    assert [id(batch) for batch in results] == [id(batch) for batch in batches]
+    for batch in results:
+        for node in batch:
+            assert node.embedding == pytest.approx(server.embed(node.text))
+    assert server.counters["ok"] == len(batches)
+
+
+def test_scheduler_retries_rate_limited_requests(server: FakeEmbeddingServer) -> None:
+    server.rps, server.burst = 10.0, 1
+    batches = _batches(count=8, size=2)
+    budget = EmbeddingBudget("test", ceiling=8, initial=8)
+    scheduler = EmbeddingScheduler(_embedder(server, batch_size=2), budget, concurrency=8, max_retries=20)
+
+    results = list(scheduler.embed(batches))
+
+    assert [id(batch) for batch in results] == [id(batch) for batch in batches]
+    assert all(node.embedding for batch in results for node in batch)
+    assert server.counters["rate_limited"] > 0
+    assert budget.limit < 8